@@ -2,48 +2,50 @@
 # Complete web server với MySQL/PostgreSQL direct queries
 
 import os
+import json
 import zipfile
 import io
 import secrets
 import mysql.connector
 import math
-import numpy as np
 import pandas as pd
 from datetime import datetime
-from flask import Flask, request, jsonify, send_file, send_from_directory, session, redirect
+from flask import Flask, request, jsonify, make_response, send_file, send_from_directory, session, redirect, Response, stream_with_context
 from flask_cors import CORS
 from werkzeug.utils import secure_filename
-from sklearn.preprocessing import StandardScaler
-from sklearn.metrics.pairwise import cosine_similarity
-from sklearn.impute import SimpleImputer
+from db_pool import get_pool
+import db
+from app_logging import get_logger
+from reference_data import city_directory, transport_catalog, TRANSPORT_MODE_NAMES, _id_key
+from catalog_events import notify_change
+from search_index import catalog_index
+from response_cache import cached_response, http_cache, skip_response_cache, response_cache
+from tour_feature_store import tour_feature_store
+from similarity_engine import SIMILARITY_CONFIG
+from budget_model import budget_model
+from place_features import place_feature_cache
+from place_catalog import get_places_by_ids
+from schedule_allocator import allocate_days, slot_layout
+from itinerary_cache import itinerary_cache
+from tour_jobs import tour_jobs, job_key, QueueFull
+from llm_providers import get_llm_provider
 
 app = Flask(__name__, static_folder="assets", template_folder="templates")
 app.secret_key = secrets.token_hex(16)
 CORS(app, supports_credentials=True)
+db.init_app(app)
 
-# Database configuration - Chỉnh sửa để khớp với database của user
-DB_CONFIG = {
-    'host': 'localhost',
-    'user': 'root',
-    'password': '',  # Thay đổi password database của bạn
-    'database': 'smart_travel',  # Tên database theo schema đã cung cấp
-    'charset': 'utf8mb4',
-    'collation': 'utf8mb4_unicode_ci'
-}
+db_log = get_logger('db')
+api_log = get_logger('api')
+batch_log = get_logger('recommendation.batch')
 
 def get_db_connection():
     """
-    Tạo kết nối database MySQL với connection pooling
+    Mượn kết nối database MySQL từ pool dùng chung (db_pool.py)
+    connection.close() sẽ trả kết nối về pool
     """
     try:
-        connection = mysql.connector.connect(
-            **DB_CONFIG,
-            pool_name="smart_travel_pool",
-            pool_size=10,
-            pool_reset_session=True,
-            autocommit=True
-        )
-        return connection
+        return get_pool().acquire()
     except mysql.connector.Error as e:
         print(f"Database connection error: {str(e)}")
         return None
@@ -69,58 +71,18 @@ def test_db_connection():
 def execute_query(query, params=None, fetch_one=False, fetch_all=True):
     """
     Execute SQL query với error handling
+    Trong request, các lần gọi dùng chung một kết nối (db.session) thay vì mượn/trả pool mỗi statement
     """
     try:
-        connection = get_db_connection()
-        if not connection:
-            print("❌ Database connection failed")
-            return None
-            
-        cursor = connection.cursor(dictionary=True, buffered=True)  # Make cursor buffered by default
-        
-        # Log the query for debugging
-        print(f"Executing query: {query}")
-        print(f"With params: {params}")
-        
-        try:
-            cursor.execute(query, params or ())
-            
-            # Xác định loại query
-            is_select = query.strip().lower().startswith('select')
-            is_modify = query.strip().lower().startswith(('insert', 'update', 'delete'))
-            
-            result = None
-            
-            # SELECT query - fetch results
-            if is_select:
-                if fetch_one:
-                    result = cursor.fetchone()
-                elif fetch_all:
-                    result = cursor.fetchall()
-                else:
-                    # If neither fetch_one nor fetch_all is True, still consume the results
-                    # to avoid "Unread result found" errors
-                    cursor.fetchall()
-            # INSERT/UPDATE/DELETE - return affected rows
-            elif is_modify:
-                connection.commit()
-                result = {'affected_rows': cursor.rowcount, 'last_id': cursor.lastrowid}
-                print(f"✅ Query executed and committed successfully. Rows affected: {cursor.rowcount}, Last ID: {cursor.lastrowid}")
-            
-            cursor.close()
-            connection.close()
-            return result
+        with db.session() as s:
+            return s.execute(query, params, fetch_one=fetch_one, fetch_all=fetch_all)
             
-        except mysql.connector.Error as e:
-            print(f"❌ MySQL error executing query: {str(e)}")
-            # Rollback nếu có lỗi
-            connection.rollback()
-            cursor.close()
-            connection.close()
-            return None
+    except mysql.connector.Error as e:
+        db_log.error('query_failed', error=str(e), sql=lambda: ' '.join(query.split()))
+        return None
         
     except Exception as e:
-        print(f"❌ Query execution error: {str(e)}")
+        db_log.exception('query_error', error=str(e))
         return None
 
 @app.route("/")
@@ -177,6 +139,56 @@ def admin_html():
 def health():
     return jsonify({'status': 'OK', 'message': 'Smart Travel Vietnam Flask API với Direct Database is running'})
 
+@app.route("/api/admin/monitoring/db-pool", methods=["GET"])
+def db_pool_stats():
+    """
+    Thống kê connection pool (in-use, waiting, histogram thời gian chờ) cho monitoring
+    """
+    if not session.get('is_admin'):
+        return jsonify({'success': False, 'message': 'Không có quyền admin'}), 403
+    return jsonify({'success': True, 'pool': get_pool().stats()})
+
+@app.route("/api/admin/monitoring/response-cache", methods=["GET"])
+def response_cache_stats():
+    """
+    Thống kê response cache (hit ratio tổng và theo từng endpoint) cho monitoring
+    """
+    if not session.get('is_admin'):
+        return jsonify({'success': False, 'message': 'Không có quyền admin'}), 403
+    return jsonify({'success': True, 'cache': response_cache.stats()})
+
+@app.route("/api/admin/monitoring/itinerary-cache", methods=["GET"])
+def itinerary_cache_stats():
+    """
+    Thống kê cache response Gemini (hit bộ nhớ / hit đĩa / miss) cho monitoring
+    """
+    if not session.get('is_admin'):
+        return jsonify({'success': False, 'message': 'Không có quyền admin'}), 403
+    return jsonify({'success': True, 'cache': itinerary_cache.stats()})
+
+@app.route("/api/admin/monitoring/tour-jobs", methods=["GET"])
+def tour_jobs_stats():
+    """
+    Độ sâu hàng đợi, số job đang chạy, dedupe/từ chối và thời gian chờ/chạy trung bình của tour_jobs
+    """
+    if not session.get('is_admin'):
+        return jsonify({'success': False, 'message': 'Không có quyền admin'}), 403
+    return jsonify({'success': True, 'jobs': tour_jobs.stats()})
+
+@app.route("/api/admin/reference-data/refresh", methods=["POST"])
+def refresh_reference_data():
+    """
+    Buộc load lại reference data trong bộ nhớ (city directory, transport catalog, tour feature store) sau khi admin sửa dữ liệu trực tiếp trong DB
+    """
+    if not session.get('is_admin'):
+        return jsonify({'success': False, 'message': 'Không có quyền admin'}), 403
+    city_directory.invalidate()
+    transport_catalog.invalidate()
+    tour_feature_store.invalidate()
+    notify_change('cities')
+    notify_change('transports')
+    return jsonify({'success': True, 'message': 'Reference data will be reloaded on next access'})
+
 @app.route("/api/debug-db", methods=["GET"])
 def debug_database():
     """
@@ -1050,30 +1062,9 @@ def hotels_autocomplete():
         if not query_string or len(query_string) < 2:
             return jsonify({"suggestions": []})
         
-        search_query = """
-            SELECT hotel_id, name, city, country, stars, rating, price_per_night
-            FROM hotels 
-            WHERE name LIKE %s OR city LIKE %s OR country LIKE %s
-            ORDER BY 
-                CASE 
-                    WHEN name LIKE %s THEN 1
-                    WHEN city LIKE %s THEN 2
-                    WHEN country LIKE %s THEN 3
-                    ELSE 4
-                END,
-                rating DESC, 
-                name ASC
-            LIMIT %s
-        """
-        
-        search_term = f"%{query_string}%"
-        exact_search = f"{query_string}%"
-        
-        params = (search_term, search_term, search_term, 
-                 exact_search, exact_search, exact_search, 
-                 int(limit))
-        
-        results = execute_query(search_query, params)
+        # Tìm trong n-gram index (chuỗi con trên name/city/country, không dấu, chịu lỗi gõ)
+        # thứ hạng như trước: name > city > country > chứa chuỗi, rồi rating DESC, name ASC
+        results = catalog_index.search('hotels', query_string, int(limit))
         
         if results:
             suggestions = []
@@ -1153,6 +1144,8 @@ def cities_autocomplete():
         return jsonify({"suggestions": []})
 
 @app.route("/api/countries", methods=["GET"])
+@http_cache(max_age=300)
+@cached_response(tables=('hotels',), key_args=())
 def get_countries():
     """Lấy danh sách quốc gia unique từ hotels table"""
     try:
@@ -1163,36 +1156,22 @@ def get_countries():
             countries = [{"country": row['country']} for row in results]
             return jsonify({"countries": countries})
         else:
+            if results is None:
+                skip_response_cache()
             return jsonify({"countries": []})
             
     except Exception:
+        skip_response_cache()
         return jsonify({"countries": []})
 
 @app.route("/api/cities", methods=["GET"])
+@http_cache(max_age=300)
+@cached_response(tables=('cities',), key_args=())
 def get_cities():
     """Lấy danh sách thành phố từ cities table"""
     try:
-        # Lấy danh sách cities từ cities table với city_id, name, country
-        query = """
-            SELECT city_id, name, country 
-            FROM cities 
-            WHERE name IS NOT NULL AND name != '' 
-            AND country IS NOT NULL AND country != ''
-            ORDER BY name
-        """
-        results = execute_query(query)
-        
-        if results:
-            cities = []
-            for row in results:
-                cities.append({
-                    "city_id": row['city_id'],
-                    "name": row['name'], 
-                    "country": row['country']
-                })
-            return jsonify(cities)
-        else:
-            return jsonify([])
+        # Lấy danh sách cities (city_id, name, country) từ city directory trong bộ nhớ
+        return jsonify(city_directory.all())
             
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -1324,8 +1303,7 @@ def search_hotels():
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
-@app.route("/api/hotels/<string:hotel_id>", methods=["GET"])
-def get_hotel_details(hotel_id):
+def _hotel_details(hotel_id):
     """Lấy thông tin chi tiết của một hotel từ database"""
     try:
         # Query to get hotel details by hotel_id with city information
@@ -1362,14 +1340,26 @@ def get_hotel_details(hotel_id):
         print(f"Error getting hotel details: {str(e)}")
         return jsonify({"success": False, "error": str(e)}), 500
 
+@app.route("/api/hotels/<string:hotel_id>", methods=["GET"])
+@http_cache(max_age=60)
+@cached_response(tables=('hotels', 'cities'), key_args=())
+def get_hotel_details(hotel_id):
+    """Chi tiết hotel cho trang public (response cache + ETag, max-age 60s)"""
+    return _hotel_details(hotel_id)
+
 # API endpoint cho frontend edit form (alias)
 @app.route("/api/hotels/details/<string:hotel_id>", methods=["GET"])
 def get_hotel_details_alias(hotel_id):
     """Alias endpoint để tương thích với frontend code"""
-    return get_hotel_details(hotel_id)
+    # Form sửa của admin: không qua response cache / ETag, browser luôn hỏi lại server
+    response = make_response(_hotel_details(hotel_id))
+    response.cache_control.no_cache = True
+    return response
 
 # API endpoint để lấy chi tiết activities
 @app.route("/api/activities/<string:activity_id>", methods=["GET"])
+@http_cache(max_age=60)
+@cached_response(tables=('activities',), key_args=())
 def get_activity_details(activity_id):
     """Lấy thông tin chi tiết của một activity từ database"""
     try:
@@ -1439,8 +1429,7 @@ def get_transport_details(transport_id):
         return jsonify({"error": str(e)}), 500
 
 # API endpoint để lấy chi tiết restaurants
-@app.route("/api/restaurants/<string:restaurant_id>", methods=["GET"])
-def get_restaurant_details(restaurant_id):
+def _restaurant_details(restaurant_id):
     """Lấy thông tin chi tiết của một restaurant từ database"""
     try:
         # Query to get restaurant details by restaurant_id
@@ -1476,11 +1465,21 @@ def get_restaurant_details(restaurant_id):
         print(f"Error getting restaurant details: {str(e)}")
         return jsonify({"success": False, "error": str(e)}), 500
 
+@app.route("/api/restaurants/<string:restaurant_id>", methods=["GET"])
+@http_cache(max_age=60)
+@cached_response(tables=('restaurants', 'cities'), key_args=())
+def get_restaurant_details(restaurant_id):
+    """Chi tiết restaurant cho trang public (response cache + ETag, max-age 60s)"""
+    return _restaurant_details(restaurant_id)
+
 # API endpoint cho frontend edit form (alias)
 @app.route("/api/restaurants/details/<string:restaurant_id>", methods=["GET"])
 def get_restaurant_details_alias(restaurant_id):
     """Alias endpoint để tương thích với frontend code"""
-    return get_restaurant_details(restaurant_id)
+    # Form sửa của admin: không qua response cache / ETag, browser luôn hỏi lại server
+    response = make_response(_restaurant_details(restaurant_id))
+    response.cache_control.no_cache = True
+    return response
 
 # API endpoint để lấy chi tiết transports
 @app.route("/api/transports/<string:transport_id>", methods=["GET"])
@@ -1568,30 +1567,9 @@ def restaurants_autocomplete():
         if not query_string or len(query_string) < 2:
             return jsonify({"suggestions": []})
         
-        search_query = """
-            SELECT restaurant_id, name, city, country, cuisine_type, rating, price_avg
-            FROM restaurants 
-            WHERE name LIKE %s OR city LIKE %s OR country LIKE %s OR cuisine_type LIKE %s
-            ORDER BY 
-                CASE 
-                    WHEN name LIKE %s THEN 1
-                    WHEN city LIKE %s THEN 2
-                    WHEN country LIKE %s THEN 3
-                    ELSE 4
-                END,
-                rating DESC, 
-                name ASC
-            LIMIT %s
-        """
-        
-        search_term = f"%{query_string}%"
-        exact_search = f"{query_string}%"
-        
-        params = (search_term, search_term, search_term, search_term,
-                 exact_search, exact_search, exact_search, 
-                 int(limit))
-        
-        results = execute_query(search_query, params)
+        # Tìm trong n-gram index (chuỗi con trên name/city/country/cuisine_type, không dấu, chịu lỗi gõ)
+        # thứ hạng như trước: name > city > country > chứa chuỗi, rồi rating DESC, name ASC
+        results = catalog_index.search('restaurants', query_string, int(limit))
         
         if results:
             suggestions = []
@@ -1672,6 +1650,8 @@ def restaurant_cities_autocomplete():
         return jsonify({"suggestions": []})
 
 @app.route("/api/restaurants/countries", methods=["GET"])
+@http_cache(max_age=300)
+@cached_response(tables=('restaurants',), key_args=())
 def get_restaurant_countries():
     """Lấy danh sách quốc gia unique từ restaurants table"""
     try:
@@ -1683,13 +1663,18 @@ def get_restaurant_countries():
             print(f"✅ Found {len(countries)} restaurant countries from database")
             return jsonify({"countries": countries})
         else:
+            if results is None:
+                skip_response_cache()
             return jsonify({"countries": []})
             
     except Exception as e:
         print(f"❌ Error in get_restaurant_countries: {str(e)}")
+        skip_response_cache()
         return jsonify({"countries": []})
 
 @app.route("/api/restaurants/cities", methods=["GET"])
+@http_cache(max_age=300)
+@cached_response(tables=('restaurants',), key_args=('country',))
 def get_restaurant_cities():
     """Lấy danh sách thành phố unique theo quốc gia từ restaurants table"""
     try:
@@ -1716,49 +1701,21 @@ def get_restaurant_cities():
             return jsonify({"cities": cities})
         else:
             print(f"⚠️ No restaurants found for country: {country}")
+            if results is None:
+                skip_response_cache()
             return jsonify({"cities": []})
             
     except Exception as e:
         print(f"Error in get_restaurant_cities: {str(e)}")
+        skip_response_cache()
         return jsonify({"cities": []})
 
 @app.route("/api/restaurants/cuisines", methods=["GET"])
-@app.route("/api/ghost/cuisines", methods=["GET"])
+@http_cache(max_age=300)
+@cached_response(tables=('restaurants',), key_args=())
 def get_restaurant_cuisines():
     """Lấy danh sách cuisine types unique từ restaurants table"""
     try:
-        # Kiểm tra nếu đây là ghost text request
-        if request.path == '/api/ghost/cuisines':
-            query_string = request.args.get('q', '').strip()
-            
-            if not query_string or len(query_string) < 2:
-                return jsonify({"suggestion": ""})
-                
-            search_query = """
-                SELECT DISTINCT cuisine_type FROM restaurants 
-                WHERE cuisine_type LIKE %s AND cuisine_type IS NOT NULL AND cuisine_type != '' 
-                ORDER BY cuisine_type ASC
-                LIMIT 1
-            """
-            
-            search_term = f"{query_string}%"  # Starts with query
-            
-            connection = get_db_connection()
-            if not connection:
-                return jsonify({"suggestion": ""})
-                
-            cursor = connection.cursor(dictionary=True)
-            cursor.execute(search_query, (search_term,))
-            result = cursor.fetchone()
-            cursor.close()
-            connection.close()
-            
-            if result and result['cuisine_type']:
-                return jsonify({"suggestion": result['cuisine_type']})
-            else:
-                return jsonify({"suggestion": ""})
-        
-        # Nếu không phải ghost text request, trả về danh sách đầy đủ
         query = "SELECT DISTINCT cuisine_type FROM restaurants WHERE cuisine_type IS NOT NULL AND cuisine_type != '' ORDER BY cuisine_type"
         results = execute_query(query)
         
@@ -1768,14 +1725,32 @@ def get_restaurant_cuisines():
             return jsonify({"cuisines": cuisines})
         else:
             print("⚠️ No cuisine types found in database")
+            if results is None:
+                skip_response_cache()
             return jsonify({"cuisines": []})
             
     except Exception as e:
         print(f"❌ Error in get_restaurant_cuisines: {str(e)}")
-        if request.path == '/api/ghost/cuisines':
+        skip_response_cache()
+        return jsonify({"cuisines": []})
+
+@app.route("/api/ghost/cuisines", methods=["GET"])
+def ghost_cuisines_autocomplete():
+    """
+    Ghost text autocomplete cho cuisine types (index prefix trong bộ nhớ)
+    """
+    try:
+        query_string = request.args.get('q', '').strip()
+        
+        if not query_string or len(query_string) < 2:
             return jsonify({"suggestion": ""})
-        else:
-            return jsonify({"cuisines": []})
+        
+        suggestion = catalog_index.suggest_cuisine(query_string)
+        return jsonify({"suggestion": suggestion or ""})
+            
+    except Exception as e:
+        print(f"Error in ghost_cuisines_autocomplete: {str(e)}")
+        return jsonify({"suggestion": ""})
 
 @app.route("/api/activities/details/<activity_id>", methods=["GET"])
 def get_activity_details_api(activity_id):
@@ -1862,16 +1837,12 @@ def search_restaurants():
             ORDER BY rating DESC, price_avg ASC
         """
         
-        # Print query and params for debugging
-        print(f"Executing restaurant search query: {query}")
-        print(f"With params: {params}")
-        
         # EXECUTE QUERY
         results = execute_query(query, tuple(params))
         
         if results:
             restaurants = []
-            print(f"✅ Found {len(results)} restaurants from database")
+            api_log.debug('restaurant_search', results=len(results), filters=len(params))
             
             for row in results:
                 restaurant = {
@@ -1888,16 +1859,14 @@ def search_restaurants():
                     "description": row['description'] or "No description available"
                 }
                 restaurants.append(restaurant)
-                print(f"  - Restaurant: {restaurant['name']} ({restaurant['city']}, {restaurant['country']})")
             
             return jsonify({"restaurants": restaurants})
             
         else:
-            print("No restaurants found in database - returning empty result")
             return jsonify({"restaurants": []})
             
     except Exception as e:
-        print(f"Error in search_restaurants: {str(e)}")
+        api_log.exception('restaurant_search_failed', error=str(e))
         return jsonify({"restaurants": []})
 
 @app.route("/api/restaurants/<string:restaurant_id>", methods=["GET"])
@@ -1940,8 +1909,8 @@ def get_restaurant_by_id(restaurant_id):
 @app.route("/api/autocomplete/countries", methods=["GET"])
 def ghost_countries_autocomplete():
     """
-    Ghost text autocomplete cho countries từ database
-    Truy vấn cả hotels và restaurants table
+    Ghost text autocomplete cho countries
+    Tra index prefix trong bộ nhớ (countries của cả hotels và restaurants)
     """
     try:
         query_string = request.args.get('q', '').strip()
@@ -1949,33 +1918,8 @@ def ghost_countries_autocomplete():
         if not query_string or len(query_string) < 2:
             return jsonify({"suggestion": ""})
         
-        # Query cả hotels và restaurants để lấy country suggestions
-        search_query = """
-            (SELECT DISTINCT country FROM hotels WHERE country LIKE %s)
-            UNION
-            (SELECT DISTINCT country FROM restaurants WHERE country LIKE %s)
-            ORDER BY country ASC
-            LIMIT 1
-        """
-        
-        search_term = f"{query_string}%"  # Starts with query
-        params = (search_term, search_term)
-        
-        # Use buffered cursor explicitly for this query
-        connection = get_db_connection()
-        if not connection:
-            return jsonify({"suggestion": ""})
-            
-        cursor = connection.cursor(dictionary=True, buffered=True)
-        cursor.execute(search_query, params)
-        result = cursor.fetchone()
-        cursor.close()
-        connection.close()
-        
-        if result and result['country']:
-            return jsonify({"suggestion": result['country']})
-        else:
-            return jsonify({"suggestion": ""})
+        suggestion = catalog_index.suggest_country(query_string)
+        return jsonify({"suggestion": suggestion or ""})
             
     except Exception as e:
         print(f"Error in ghost_countries_autocomplete: {str(e)}")
@@ -1993,28 +1937,11 @@ def get_city_id():
         if not city_name:
             return jsonify({"error": "City name is required"}), 400
         
-        connection = get_db_connection()
-        if not connection:
-            return jsonify({"error": "Database connection failed"}), 500
-        
-        cursor = connection.cursor(dictionary=True)
+        # Tìm city_id trong city directory (không phân biệt hoa thường / dấu như LIKE trong MySQL)
+        city_id = city_directory.find_id(city_name, country_name or None)
         
-        # Search for city_id in cities table using LIKE for flexible matching
-        if country_name:
-            query = "SELECT city_id FROM cities WHERE name LIKE %s AND country LIKE %s LIMIT 1"
-            params = (f"%{city_name}%", f"%{country_name}%")
-        else:
-            query = "SELECT city_id FROM cities WHERE name LIKE %s LIMIT 1"
-            params = (f"%{city_name}%",)
-        
-        cursor.execute(query, params)
-        result = cursor.fetchone()
-        
-        cursor.close()
-        connection.close()
-        
-        if result:
-            return jsonify({"city_id": result['city_id']})
+        if city_id is not None:
+            return jsonify({"city_id": city_id})
         else:
             return jsonify({"error": "City not found"}), 404
     
@@ -2033,19 +1960,8 @@ def get_city_name():
         if not city_id:
             return jsonify({"error": "City ID is required"}), 400
         
-        connection = get_db_connection()
-        if not connection:
-            return jsonify({"error": "Database connection failed"}), 500
-        
-        cursor = connection.cursor(dictionary=True)
-        
-        # Get city name from cities table
-        query = "SELECT name, country FROM cities WHERE city_id = %s LIMIT 1"
-        cursor.execute(query, (city_id,))
-        result = cursor.fetchone()
-        
-        cursor.close()
-        connection.close()
+        # Get city name from city directory
+        result = city_directory.get(city_id)
         
         if result:
             return jsonify({
@@ -2197,8 +2113,8 @@ def get_activities():
 @app.route("/api/autocomplete/cities", methods=["GET"])
 def ghost_cities_autocomplete():
     """
-    Ghost text autocomplete cho cities từ database
-    Truy vấn cả hotels và restaurants table
+    Ghost text autocomplete cho cities
+    Tra index prefix trong bộ nhớ (cities của cả hotels và restaurants, giới hạn theo country nếu có)
     """
     try:
         query_string = request.args.get('q', '').strip()
@@ -2207,44 +2123,8 @@ def ghost_cities_autocomplete():
         if not query_string or len(query_string) < 2:
             return jsonify({"suggestion": ""})
         
-        # Nếu có country context, search trong country đó
-        if country:
-            search_query = """
-                (SELECT DISTINCT city FROM hotels WHERE city LIKE %s AND country = %s)
-                UNION
-                (SELECT DISTINCT city FROM restaurants WHERE city LIKE %s AND country = %s)
-                ORDER BY city ASC
-                LIMIT 1
-            """
-            search_term = f"{query_string}%"
-            params = (search_term, country, search_term, country)
-        else:
-            # Không có country context, search tất cả cities
-            search_query = """
-                (SELECT DISTINCT city FROM hotels WHERE city LIKE %s)
-                UNION
-                (SELECT DISTINCT city FROM restaurants WHERE city LIKE %s)
-                ORDER BY city ASC
-                LIMIT 1
-            """
-            search_term = f"{query_string}%"
-            params = (search_term, search_term)
-        
-        # Use buffered cursor explicitly for this query
-        connection = get_db_connection()
-        if not connection:
-            return jsonify({"suggestion": ""})
-            
-        cursor = connection.cursor(dictionary=True, buffered=True)
-        cursor.execute(search_query, params)
-        result = cursor.fetchone()
-        cursor.close()
-        connection.close()
-        
-        if result and result['city']:
-            return jsonify({"suggestion": result['city']})
-        else:
-            return jsonify({"suggestion": ""})
+        suggestion = catalog_index.suggest_city(query_string, country or None)
+        return jsonify({"suggestion": suggestion or ""})
             
     except Exception as e:
         print(f"Error in ghost_cities_autocomplete: {str(e)}")
@@ -2253,7 +2133,7 @@ def ghost_cities_autocomplete():
 @app.route("/api/ghost/restaurants", methods=["GET"])
 def ghost_restaurants_autocomplete():
     """
-    Ghost text autocomplete cho restaurant names từ database
+    Ghost text autocomplete cho restaurant names (rating cao nhất trước)
     """
     try:
         query_string = request.args.get('q', '').strip()
@@ -2261,31 +2141,8 @@ def ghost_restaurants_autocomplete():
         if not query_string or len(query_string) < 2:
             return jsonify({"suggestion": ""})
         
-        search_query = """
-            SELECT name FROM restaurants 
-            WHERE name LIKE %s
-            ORDER BY rating DESC, name ASC
-            LIMIT 1
-        """
-        
-        search_term = f"{query_string}%"  # Starts with query
-        params = (search_term,)
-        
-        # Use buffered cursor explicitly for this query
-        connection = get_db_connection()
-        if not connection:
-            return jsonify({"suggestion": ""})
-            
-        cursor = connection.cursor(dictionary=True, buffered=True)
-        cursor.execute(search_query, params)
-        result = cursor.fetchone()
-        cursor.close()
-        connection.close()
-        
-        if result and result['name']:
-            return jsonify({"suggestion": result['name']})
-        else:
-            return jsonify({"suggestion": ""})
+        suggestion = catalog_index.suggest_name('restaurants', query_string)
+        return jsonify({"suggestion": suggestion or ""})
             
     except Exception as e:
         print(f"Error in ghost_restaurants_autocomplete: {str(e)}")
@@ -2294,7 +2151,7 @@ def ghost_restaurants_autocomplete():
 @app.route("/api/ghost/hotels", methods=["GET"])
 def ghost_hotels_autocomplete():
     """
-    Ghost text autocomplete cho hotel names từ database
+    Ghost text autocomplete cho hotel names (rating cao nhất trước)
     """
     try:
         query_string = request.args.get('q', '').strip()
@@ -2302,31 +2159,8 @@ def ghost_hotels_autocomplete():
         if not query_string or len(query_string) < 2:
             return jsonify({"suggestion": ""})
         
-        search_query = """
-            SELECT name FROM hotels 
-            WHERE name LIKE %s
-            ORDER BY rating DESC, name ASC
-            LIMIT 1
-        """
-        
-        search_term = f"{query_string}%"  # Starts with query
-        params = (search_term,)
-        
-        # Use buffered cursor explicitly for this query
-        connection = get_db_connection()
-        if not connection:
-            return jsonify({"suggestion": ""})
-            
-        cursor = connection.cursor(dictionary=True, buffered=True)
-        cursor.execute(search_query, params)
-        result = cursor.fetchone()
-        cursor.close()
-        connection.close()
-        
-        if result and result['name']:
-            return jsonify({"suggestion": result['name']})
-        else:
-            return jsonify({"suggestion": ""})
+        suggestion = catalog_index.suggest_name('hotels', query_string)
+        return jsonify({"suggestion": suggestion or ""})
             
     except Exception as e:
         print(f"Error in ghost_hotels_autocomplete: {str(e)}")
@@ -2352,6 +2186,7 @@ def save_admin_config():
             json.dump(config_data, f, indent=2, ensure_ascii=False)
         
         print("✅ Admin configuration saved successfully")
+        notify_change('site_config')
         
         # Check if theme was changed and if restart is requested
         restart_requested = config_data.get('restartAfterApply', False)
@@ -2659,6 +2494,7 @@ def delete_user(user_id):
 
 # Public endpoint để get config cho tất cả users (kể cả anonymous)
 @app.route("/api/config", methods=["GET"]) 
+@cached_response(tables=('site_config',), key_args=())
 def get_public_config():
     """
     Get public configuration accessible to all users including anonymous
@@ -3448,9 +3284,7 @@ class UserTourInfo:
 
 def get_city_name_by_id(city_id):
     """Get city name from city_id"""
-    query = "SELECT name FROM cities WHERE city_id = %s LIMIT 1"
-    result = execute_query(query, (city_id,), fetch_one=True)
-    return result['name'] if result else "Unknown City"
+    return city_directory.name(city_id, "Unknown City")
 
 def get_tour_id():
     """Generate a new tour ID"""
@@ -3462,19 +3296,8 @@ def get_tour_id():
 
 def get_place_details(place_id, place_type):
     """Get details of a place by its ID and type"""
-    if place_type == 'hotel':
-        table = 'hotels'
-    elif place_type == 'activity':
-        table = 'activities'
-    elif place_type == 'restaurant':
-        table = 'restaurants'
-    elif place_type == 'transport':
-        table = 'transports'
-    else:
-        return None
-    
-    query = f"SELECT * FROM {table} WHERE {place_type}_id = %s LIMIT 1"
-    return execute_query(query, (place_id,), fetch_one=True)
+    # Nhiều id thì gọi thẳng get_places_by_ids (một câu IN) thay vì gọi hàm này trong vòng lặp
+    return get_places_by_ids(place_type, [place_id]).get(place_id)
 
 def get_places_by_city(city_id, place_type, limit=10):
     """Get places by city ID and type"""
@@ -3518,95 +3341,60 @@ def get_collaborative_recommendations(user_id, city_id, place_type, limit=5):
 
 def get_content_based_recommendations(preferred_ids, city_id, place_type, limit=5):
     """Content-based recommendations based on user preferences"""
+    # Ma trận price/rating đã impute + chuẩn hóa của thành phố được cache theo (place_type, city)
+    features = place_feature_cache.get(city_id, place_type)
+    if features is None:
+        return []
+    
     if not preferred_ids:
         # If no preferences, return top-rated places
-        return get_places_by_city(city_id, place_type, limit)
+        return features.top_rated(limit)
     
-    # Get details of preferred places
-    preferred_places = []
-    for place_id in preferred_ids:
-        place = get_place_details(place_id, place_type)
-        if place:
-            preferred_places.append(place)
+    # Get details of preferred places: lấy từ danh sách của thành phố trong cache,
+    # id còn thiếu (place ở thành phố khác) lấy bằng một câu IN
+    found = features.lookup(preferred_ids)
+    missing = [place_id for place_id in preferred_ids if place_id not in found]
+    if missing:
+        found.update(get_places_by_ids(place_type, missing))
+    preferred_places = [found[place_id] for place_id in preferred_ids if place_id in found]
     
     if not preferred_places:
         # If no valid preferences, return top-rated places
-        return get_places_by_city(city_id, place_type, limit)
-    
-    # Get all places in the destination city
-    all_places = get_places_by_city(city_id, place_type, 100)  # Get more places to find similar ones
+        return features.top_rated(limit)
     
-    if not all_places:
+    # Cosine similarity giữa các place của thành phố và trung bình đặc trưng của place user đã chọn
+    return features.most_similar(preferred_places, limit)
+
+# Số activity / restaurant mỗi ngày trong build_schedule_day (sáng + chiều, trưa + tối)
+SCHEDULE_ACTIVITIES_PER_DAY = 2
+SCHEDULE_RESTAURANTS_PER_DAY = 2
+
+def build_schedule_pools(city_id, user_input, duration_days=1):
+    """Candidate places for the whole tour, computed once per tour"""
+    # Đủ place khác nhau cho mọi ngày (cache đặc trưng giữ tối đa PLACE_FEATURES_CANDIDATES place)
+    return {
+        'activity': get_content_based_recommendations(
+            user_input.activity_ids, city_id, 'activity', max(5, SCHEDULE_ACTIVITIES_PER_DAY * duration_days)),
+        'restaurant': get_content_based_recommendations(
+            user_input.restaurant_ids, city_id, 'restaurant', max(3, SCHEDULE_RESTAURANTS_PER_DAY * duration_days)),
+        'transport': get_content_based_recommendations(user_input.transport_ids, city_id, 'transport', 2),
+    }
+
+def pick_for_day(pool, day_index, per_day):
+    """Round-robin: ngày day_index lấy per_day place kế tiếp, chỉ lặp lại place khi đã dùng hết pool"""
+    if not pool:
         return []
-    
-    # Extract features for comparison (e.g., price, rating)
-    features = []
-    for place in all_places:
-        # Extract relevant features depending on place type
-        if place_type == 'hotel':
-            price = place.get('price_per_night', 0)
-        elif place_type == 'activity':
-            price = place.get('price', 0)
-        elif place_type == 'restaurant':
-            price = place.get('price_avg', 0)
-        elif place_type == 'transport':
-            price = place.get('avg_price_per_km', 0)
-        else:
-            price = 0
-        
-        rating = place.get('rating', 0)
-        features.append([price, rating])
-    
-    # Extract features for preferred places
-    pref_features = []
-    for place in preferred_places:
-        if place_type == 'hotel':
-            price = place.get('price_per_night', 0)
-        elif place_type == 'activity':
-            price = place.get('price', 0)
-        elif place_type == 'restaurant':
-            price = place.get('price_avg', 0)
-        elif place_type == 'transport':
-            price = place.get('avg_price_per_km', 0)
-        else:
-            price = 0
-        
-        rating = place.get('rating', 0)
-        pref_features.append([price, rating])
-    
-    # Convert to numpy arrays
-    features_array = np.array(features)
-    pref_features_array = np.array(pref_features)
-    
-    # Handle missing values
-    imputer = SimpleImputer(strategy='mean')
-    features_array = imputer.fit_transform(features_array)
-    pref_features_array = imputer.transform(pref_features_array)
-    
-    # Normalize features
-    scaler = StandardScaler()
-    features_array = scaler.fit_transform(features_array)
-    pref_features_array = scaler.transform(pref_features_array)
-    
-    # Calculate average preferred features
-    avg_pref_features = np.mean(pref_features_array, axis=0).reshape(1, -1)
-    
-    # Calculate similarity scores
-    similarities = cosine_similarity(features_array, avg_pref_features).flatten()
-    
-    # Sort places by similarity
-    similar_indices = similarities.argsort()[::-1][:limit]
-    
-    # Return recommended places
-    recommendations = [all_places[i] for i in similar_indices]
-    return recommendations
+    start = day_index * per_day
+    return [pool[(start + k) % len(pool)] for k in range(min(per_day, len(pool)))]
 
-def build_schedule_day(day_number, city_id, user_input):
+def build_schedule_day(day_number, city_id, user_input, pools=None):
     """Build a schedule for a single day"""
-    # Get recommendations for activities, restaurants, and transport
-    activities = get_content_based_recommendations(user_input.activity_ids, city_id, 'activity', 5)
-    restaurants = get_content_based_recommendations(user_input.restaurant_ids, city_id, 'restaurant', 3)
-    transports = get_content_based_recommendations(user_input.transport_ids, city_id, 'transport', 2)
+    # Get recommendations for activities, restaurants, and transport (một lần cho cả tour nếu có pools)
+    if pools is None:
+        pools = build_schedule_pools(city_id, user_input)
+    activities = pick_for_day(pools['activity'], day_number - 1, SCHEDULE_ACTIVITIES_PER_DAY)
+    restaurants = pick_for_day(pools['restaurant'], day_number - 1, SCHEDULE_RESTAURANTS_PER_DAY)
+    transports = pools['transport']
     
     # Build a day schedule
     schedule_items = []
@@ -3699,10 +3487,11 @@ def build_final_tour_json(user_input, mode='auto'):
     start_city = get_city_name_by_id(user_input.start_city_id)
     destination_city = get_city_name_by_id(user_input.destination_city_id)
     
-    # Build schedule for each day
+    # Build schedule for each day: candidate places lấy một lần cho cả tour rồi chia cho từng ngày
+    pools = build_schedule_pools(user_input.destination_city_id, user_input, user_input.duration_days)
     schedule = []
     for day in range(1, user_input.duration_days + 1):
-        day_schedule = build_schedule_day(day, user_input.destination_city_id, user_input)
+        day_schedule = build_schedule_day(day, user_input.destination_city_id, user_input, pools)
         schedule.append(day_schedule)
     
     # Calculate total cost
@@ -3791,6 +3580,7 @@ def admin_add_hotel():
         )
         
         result = execute_query(insert_query, params, fetch_one=False, fetch_all=False)
+        notify_change('hotels', data['hotel_id'])
         
         return jsonify({
             'success': True,
@@ -4052,6 +3842,7 @@ def admin_add_restaurant():
         )
         
         result = execute_query(insert_query, params, fetch_one=False, fetch_all=False)
+        notify_change('restaurants', new_id)
         
         return jsonify({
             'success': True,
@@ -4129,8 +3920,13 @@ def admin_upload_restaurants_excel():
                 # If no restaurants yet, start with R0000
                 next_num = 0
             
-            added_count = 0
             errors = []
+            rows_to_insert = []
+            
+            insert_query = """
+            INSERT INTO restaurants (restaurant_id, name, city_id, city, country, price_avg, cuisine_type, rating, latitude, longitude, description)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+            """
             
             for index, row in df.iterrows():
                 try:
@@ -4143,12 +3939,6 @@ def admin_upload_restaurants_excel():
                     next_num += 1
                     new_id = f"R{next_num:04d}"
                     
-                    # Insert restaurant with auto-generated ID
-                    insert_query = """
-                    INSERT INTO restaurants (restaurant_id, name, city_id, city, country, price_avg, cuisine_type, rating, latitude, longitude, description)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                    """
-                    
                     params = (
                         new_id,
                         str(row['name']),
@@ -4163,13 +3953,35 @@ def admin_upload_restaurants_excel():
                         str(row['description']) if not pd.isna(row['description']) else None
                     )
                     
-                    execute_query(insert_query, params, fetch_one=False, fetch_all=False)
-                    added_count += 1
+                    rows_to_insert.append((index, params))
                     
                 except Exception as row_error:
                     errors.append(f'Row {index + 1}: {str(row_error)}')
                     continue
             
+            # Insert tất cả trong một transaction bằng một batch INSERT
+            with db.session() as s:
+                try:
+                    with s.transaction():
+                        s.executemany(insert_query, [params for _, params in rows_to_insert])
+                    added_count = len(rows_to_insert)
+                    
+                except mysql.connector.Error as batch_error:
+                    # Batch lỗi: chèn lại từng dòng với savepoint để biết chính xác dòng nào lỗi
+                    print(f"⚠️ Batch insert failed, retrying row by row: {batch_error}")
+                    added_count = 0
+                    with s.transaction():
+                        for index, params in rows_to_insert:
+                            try:
+                                with s.savepoint():
+                                    s.execute(insert_query, params)
+                                added_count += 1
+                            except mysql.connector.Error as row_error:
+                                errors.append(f'Row {index + 1}: {str(row_error)}')
+            
+            if added_count:
+                notify_change('restaurants')
+            
             response_data = {
                 'success': True,
                 'message': f'Successfully processed Excel file',
@@ -4246,6 +4058,7 @@ def admin_edit_restaurant(restaurant_id):
         )
         
         result = execute_query(update_query, params, fetch_one=False, fetch_all=False)
+        notify_change('restaurants', restaurant_id)
         
         return jsonify({
             'success': True,
@@ -4296,6 +4109,7 @@ def admin_delete_restaurant(restaurant_id):
         # Delete restaurant
         delete_query = "DELETE FROM restaurants WHERE restaurant_id = %s"
         result = execute_query(delete_query, (restaurant_id,), fetch_one=False, fetch_all=False)
+        notify_change('restaurants', restaurant_id)
         
         return jsonify({
             'success': True,
@@ -5039,6 +4853,7 @@ def admin_update_hotel(hotel_id):
         update_query = f"UPDATE hotels SET {', '.join(update_fields)} WHERE hotel_id = %s"
         
         result = execute_query(update_query, tuple(params), fetch_one=False, fetch_all=False)
+        notify_change('hotels', hotel_id)
         
         return jsonify({
             'success': True,
@@ -5078,6 +4893,7 @@ def admin_delete_hotel(hotel_id):
         # Delete hotel
         delete_query = "DELETE FROM hotels WHERE hotel_id = %s"
         result = execute_query(delete_query, (hotel_id,), fetch_one=False, fetch_all=False)
+        notify_change('hotels', hotel_id)
         
         return jsonify({
             'success': True,
@@ -5093,11 +4909,6 @@ def admin_delete_hotel(hotel_id):
 # =====================================================================
 
 import pandas as pd
-import numpy as np
-from collections import Counter, defaultdict
-from sklearn.linear_model import LinearRegression
-from sklearn.feature_extraction import DictVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
 from datetime import datetime, timedelta
 import random
 
@@ -5136,86 +4947,29 @@ def get_user_similarity(user_input: UserTourInfo, other_input: UserTourInfo):
     shared_budget = math.fabs((user_normalized_budget - other_normalized_budget) / (user_normalized_budget + other_normalized_budget + 1e-9))
     return shared_budget + shared_hotels + shared_activities + shared_transports + shared_restaurants
 
-def get_top_k_similar_users(user_input: UserTourInfo, K=5):
-    query = """
-        SELECT 
-            t.user_id, 
-            t.start_city_id, 
-            t.destination_city_id, 
-            t.guest_count, 
-            t.duration_days, 
-            t.target_budget,
-            GROUP_CONCAT(DISTINCT ta.activity_id) as activity_ids,
-            GROUP_CONCAT(DISTINCT th.hotel_id) as hotel_ids,
-            GROUP_CONCAT(DISTINCT tr.restaurant_id) as restaurant_ids,
-            GROUP_CONCAT(DISTINCT tt.transport_id) as transport_ids
-        FROM tour_options t
-        LEFT JOIN tour_options_activities ta ON t.option_id = ta.option_id
-        LEFT JOIN tour_options_hotels th ON t.option_id = th.option_id
-        LEFT JOIN tour_options_restaurants tr ON t.option_id = tr.option_id
-        LEFT JOIN tour_options_transports tt ON t.option_id = tt.option_id
-        WHERE t.destination_city_id = %s AND t.user_id != %s
-        GROUP BY t.user_id, t.start_city_id, t.destination_city_id, t.guest_count, t.duration_days, t.target_budget
-    """
-    
-    all_tour_options = execute_query(query, (user_input.destination_city_id, user_input.user_id or ''))
-    similarities = []
-    
-    if all_tour_options:
-        for option in all_tour_options:
-            option['activity_ids'] = option['activity_ids'].split(',') if option['activity_ids'] else []
-            option['hotel_ids'] = option['hotel_ids'].split(',') if option['hotel_ids'] else []
-            option['restaurant_ids'] = option['restaurant_ids'].split(',') if option['restaurant_ids'] else []
-            option['transport_ids'] = option['transport_ids'].split(',') if option['transport_ids'] else []
-            other_user = UserTourInfo(option)
-            score = get_user_similarity(user_input, other_user)
-            if score != -math.inf:
-                similarities.append((other_user.user_id, score))
-    
-    top_k = sorted(similarities, key=lambda x: x[1], reverse=True)[:K]
-    return top_k
+def get_top_k_similar_users(user_input: UserTourInfo, K=5, mode=None):
+    # Partition tour option của thành phố đích đã có sẵn trong feature store (ma trận thưa),
+    # chấm điểm mọi option một lần (cùng công thức get_user_similarity).
+    # mode: 'exact' | 'ann' (MinHash/LSH, gần đúng) | 'auto' (ann khi partition lớn), mặc định theo SIMILARITY_CONFIG
+    partition = tour_feature_store.partition(user_input.destination_city_id)
+    if partition is None:
+        return []
+    return partition.similarity_matrix().top_k(user_input, K, mode=mode or SIMILARITY_CONFIG['mode'])
 
 def recommend_existing(user_input: UserTourInfo, top_n=1):
-    query = """
-        SELECT 
-            t.option_id, 
-            t.user_id, 
-            t.start_city_id, 
-            t.destination_city_id, 
-            t.guest_count, 
-            t.duration_days, 
-            t.target_budget,
-            t.rating,
-            GROUP_CONCAT(DISTINCT ta.activity_id) as activity_ids,
-            GROUP_CONCAT(DISTINCT th.hotel_id) as hotel_ids,
-            GROUP_CONCAT(DISTINCT tr.restaurant_id) as restaurant_ids,
-            GROUP_CONCAT(DISTINCT tt.transport_id) as transport_ids
-        FROM tour_options t
-        LEFT JOIN tour_options_activities ta ON t.option_id = ta.option_id
-        LEFT JOIN tour_options_hotels th ON t.option_id = th.option_id
-        LEFT JOIN tour_options_restaurants tr ON t.option_id = tr.option_id
-        LEFT JOIN tour_options_transports tt ON t.option_id = tt.option_id
-        WHERE t.user_id = %s
-        GROUP BY t.option_id, t.user_id, t.start_city_id, t.destination_city_id, 
-                 t.guest_count, t.duration_days, t.target_budget, t.rating
-    """
-    
-    all_opts = execute_query(query, (user_input.user_id or '',))
+    # Các tour option của user lấy từ feature store (đã gom id list, không cần GROUP_CONCAT)
+    all_opts = tour_feature_store.options_for_user(user_input.user_id or '')
     
     if not all_opts:
         print("No tour options found for user_id:", user_input.user_id)
         return pd.DataFrame()
     
-    # Chuyển đổi decimal.Decimal sang float và xử lý danh sách
+    # Giá trị mặc định cho các trường số bị thiếu (store đã chuyển Decimal sang float)
     for opt in all_opts:
-        opt['guest_count'] = float(opt['guest_count']) if opt['guest_count'] is not None else 1.0
-        opt['duration_days'] = float(opt['duration_days']) if opt['duration_days'] is not None else 3.0
-        opt['target_budget'] = float(opt['target_budget']) if opt['target_budget'] is not None else 1000.0
-        opt['rating'] = float(opt['rating']) if opt['rating'] is not None else 0.0
-        opt['activity_ids'] = opt['activity_ids'].split(',') if opt['activity_ids'] else []
-        opt['hotel_ids'] = opt['hotel_ids'].split(',') if opt['hotel_ids'] else []
-        opt['restaurant_ids'] = opt['restaurant_ids'].split(',') if opt['restaurant_ids'] else []
-        opt['transport_ids'] = opt['transport_ids'].split(',') if opt['transport_ids'] else []
+        opt['guest_count'] = opt['guest_count'] if opt['guest_count'] is not None else 1.0
+        opt['duration_days'] = opt['duration_days'] if opt['duration_days'] is not None else 3.0
+        opt['target_budget'] = opt['target_budget'] if opt['target_budget'] is not None else 1000.0
+        opt['rating'] = opt['rating'] if opt['rating'] is not None else 0.0
     
     df = pd.DataFrame(all_opts)
     
@@ -5235,128 +4989,71 @@ def recommend_existing(user_input: UserTourInfo, top_n=1):
     
     return pd.DataFrame()
 
-def impute_all_fields(user_input: UserTourInfo, topk_users: list):
-    if not topk_users:
+def impute_all_fields(user_input: UserTourInfo, stats=None):
+    # Giá trị điền lấy từ thống kê chạy của feature store (mean / mode / top 3 item trên toàn bộ
+    # tour option, cập nhật theo từng option) thay vì dựng DataFrame cả bảng mỗi request.
+    # target_budget không điền ở đây: prepare_cold_start_user dự đoán nó bằng budget_model
+    stats = stats or tour_feature_store.imputation_stats()
+    if not stats['options']:
         return user_input
         
-    df = pd.DataFrame(topk_users)
-    for field in ['guest_count', 'duration_days', 'target_budget']:
+    for field in ['guest_count', 'duration_days']:
         if getattr(user_input, field) is None:
-            mean_value = df[field].mean() if not df[field].isna().all() else 1
+            mean_value = stats[field] if stats[field] is not None else 1
             setattr(user_input, field, mean_value)
     for field in ['start_city_id', 'destination_city_id']:
         if getattr(user_input, field) is None:
-            mode_value = df[field].mode()[0] if not df[field].isna().all() else None
-            setattr(user_input, field, mode_value)
+            setattr(user_input, field, stats[field])
     for field in ['hotel_ids', 'activity_ids', 'restaurant_ids', 'transport_ids']:
         lst = getattr(user_input, field)
         if not lst:
-            all_ids = sum(df[field].dropna().tolist(), [])
-            top3 = [i for i, _ in Counter(all_ids).most_common(3)]
-            setattr(user_input, field, top3)
+            setattr(user_input, field, list(stats[field]))
     return user_input
 
-def recommend_cold_start(user_input: UserTourInfo, K=5, top_n=1):
-    query = """
-        SELECT 
-            t.option_id, 
-            t.user_id, 
-            t.start_city_id, 
-            t.destination_city_id, 
-            t.guest_count, 
-            t.duration_days, 
-            t.target_budget,
-            t.rating,
-            GROUP_CONCAT(DISTINCT ta.activity_id) as activity_ids,
-            GROUP_CONCAT(DISTINCT th.hotel_id) as hotel_ids,
-            GROUP_CONCAT(DISTINCT tr.restaurant_id) as restaurant_ids,
-            GROUP_CONCAT(DISTINCT tt.transport_id) as transport_ids
-        FROM tour_options t
-        LEFT JOIN tour_options_activities ta ON t.option_id = ta.option_id
-        LEFT JOIN tour_options_hotels th ON t.option_id = th.option_id
-        LEFT JOIN tour_options_restaurants tr ON t.option_id = tr.option_id
-        LEFT JOIN tour_options_transports tt ON t.option_id = tt.option_id
-        GROUP BY t.option_id, t.user_id, t.start_city_id, t.destination_city_id, t.guest_count, t.duration_days, t.target_budget, t.rating
-    """
+def prepare_cold_start_user(user_input: UserTourInfo, stats=None):
+    # Điền các trường bị thiếu
+    stats = stats or tour_feature_store.imputation_stats()
+    user_input = impute_all_fields(user_input, stats)
     
-    all_opts = execute_query(query)
+    if user_input.target_budget is None:
+        # Dự đoán ngân sách bằng mô hình hồi quy đã fit sẵn (theo thành phố, fallback toàn cục),
+        # chưa fit được model thì dùng ngân sách trung bình như trước
+        predicted = None
+        if user_input.duration_days is not None and user_input.guest_count is not None:
+            predicted = budget_model.predict(user_input.duration_days, user_input.guest_count,
+                                             user_input.destination_city_id)
+        if predicted is None:
+            predicted = stats['target_budget'] if stats['options'] and stats['target_budget'] is not None else 1000
+        user_input.target_budget = predicted
+    return user_input
+
+def recommend_cold_start(user_input: UserTourInfo, K=5, top_n=1, similarity_mode=None):
+    # Thống kê của toàn bộ tour option trong feature store (không có option nào thì không gợi ý được)
+    stats = tour_feature_store.imputation_stats()
     
-    if not all_opts:
+    if not stats['options']:
         return pd.DataFrame()
     
-    # Chuyển đổi decimal.Decimal sang float
-    for opt in all_opts:
-        opt['activity_ids'] = opt['activity_ids'].split(',') if opt['activity_ids'] else []
-        opt['hotel_ids'] = opt['hotel_ids'].split(',') if opt['hotel_ids'] else []
-        opt['restaurant_ids'] = opt['restaurant_ids'].split(',') if opt['restaurant_ids'] else []
-        opt['transport_ids'] = opt['transport_ids'].split(',') if opt['transport_ids'] else []
-        opt['guest_count'] = float(opt['guest_count']) if opt['guest_count'] is not None else None
-        opt['duration_days'] = float(opt['duration_days']) if opt['duration_days'] is not None else None
-        opt['target_budget'] = float(opt['target_budget']) if opt['target_budget'] is not None else None
-        opt['rating'] = float(opt['rating']) if opt['rating'] is not None else None
-    
-    # Điền các trường bị thiếu
-    user_input = impute_all_fields(user_input, all_opts)
-    
-    if user_input.target_budget is None:
-        # Dự đoán ngân sách bằng mô hình hồi quy
-        df_budget = pd.DataFrame(all_opts)
-        X = df_budget[['duration_days', 'guest_count']].dropna()
-        y = df_budget.loc[X.index, 'target_budget']
-        if not X.empty and not y.empty:
-            reg = LinearRegression().fit(X, y)
-            user_input.target_budget = reg.predict([[user_input.duration_days, user_input.guest_count]])[0]
-        else:
-            user_input.target_budget = 1000
+    user_input = prepare_cold_start_user(user_input, stats)
 
     # Lấy top K người dùng tương tự
-    top_users = get_top_k_similar_users(user_input, K)
+    top_users = get_top_k_similar_users(user_input, K, mode=similarity_mode)
+    return rank_cold_start_options(user_input, top_users, top_n)
+
+def rank_cold_start_options(user_input: UserTourInfo, top_users, top_n=1):
+    # Chọn option từ [(user_id, score)] của các user tương tự (fallback: option bất kỳ)
     top_user_ids = [user_id for user_id, _ in top_users]
     
     if not top_user_ids:
-        # Fallback method
-        fallback_query = """
-            SELECT 
-                t.option_id, 
-                t.user_id, 
-                t.start_city_id, 
-                t.destination_city_id, 
-                t.guest_count, 
-                t.duration_days, 
-                t.target_budget,
-                t.rating
-            FROM tour_options t
-            WHERE t.destination_city_id = %s
-            LIMIT %s
-        """
-        
-        random_opts = execute_query(fallback_query, (user_input.destination_city_id, top_n))
+        # Fallback: vài option bất kỳ của thành phố đích, không có thì của cả hệ thống
+        random_opts = tour_feature_store.first_options(top_n, user_input.destination_city_id)
         
         if not random_opts:
-            fallback_query2 = """
-                SELECT 
-                    t.option_id, 
-                    t.user_id, 
-                    t.start_city_id, 
-                    t.destination_city_id, 
-                    t.guest_count, 
-                    t.duration_days, 
-                    t.target_budget,
-                    t.rating
-                FROM tour_options t
-                LIMIT %s
-            """
-            random_opts = execute_query(fallback_query2, (top_n,))
+            random_opts = tour_feature_store.first_options(top_n)
         
         if not random_opts:
             return pd.DataFrame()
         
-        for opt in random_opts:
-            opt['guest_count'] = float(opt['guest_count']) if opt['guest_count'] is not None else None
-            opt['duration_days'] = float(opt['duration_days']) if opt['duration_days'] is not None else None
-            opt['target_budget'] = float(opt['target_budget']) if opt['target_budget'] is not None else None
-            opt['rating'] = float(opt['rating']) if opt['rating'] is not None else None
-        
         df = pd.DataFrame(random_opts)
         if df.empty:
             return df
@@ -5370,31 +5067,11 @@ def recommend_cold_start(user_input: UserTourInfo, K=5, top_n=1):
         return df.head(top_n)
     
     # Lấy options từ top K người dùng tương tự
-    query_topk = """
-        SELECT 
-            t.option_id, 
-            t.user_id, 
-            t.start_city_id, 
-            t.destination_city_id, 
-            t.guest_count, 
-            t.duration_days, 
-            t.target_budget,
-            t.rating
-        FROM tour_options t
-        WHERE t.user_id IN ({})
-    """.format(','.join(['%s'] * len(top_user_ids)))
-    
-    topk_opts = execute_query(query_topk, tuple(top_user_ids))
+    topk_opts = tour_feature_store.options_for_users(top_user_ids)
     
     if not topk_opts:
         return pd.DataFrame()
     
-    for opt in topk_opts:
-        opt['guest_count'] = float(opt['guest_count']) if opt['guest_count'] is not None else None
-        opt['duration_days'] = float(opt['duration_days']) if opt['duration_days'] is not None else None
-        opt['target_budget'] = float(opt['target_budget']) if opt['target_budget'] is not None else None
-        opt['rating'] = float(opt['rating']) if opt['rating'] is not None else None
-    
     df = pd.DataFrame(topk_opts)
     required_cols = ['guest_count', 'duration_days', 'target_budget']
     
@@ -5444,12 +5121,11 @@ time_slots = [
     {"start_time": "20:00:00", "end_time": "23:00:00", "type": "hotel"}
 ]
 
-def select_places_for_users(user_input: UserTourInfo):
-    city = user_input.destination_city_id
-    duration = float(user_input.duration_days) if user_input.duration_days is not None else 3.0
-    budget = float(user_input.target_budget) if user_input.target_budget is not None else 1000.0
-    daily_budget = budget / duration
-    
+def load_places_for_city(city):
+    """
+    activities, restaurants, hotels của một thành phố (giá, rating đã chuyển sang float),
+    dùng chung được cho nhiều user vì select_places_for_users không sửa các dict này
+    """
     # Lấy danh sách activities, restaurants, hotels từ MySQL
     act_query = "SELECT activity_id, name, city_id, price, rating FROM activities WHERE city_id = %s"
     act_all = execute_query(act_query, (city,)) or []
@@ -5470,6 +5146,15 @@ def select_places_for_users(user_input: UserTourInfo):
     for item in hotel_all:
         item['price_per_night'] = float(item['price_per_night']) if item['price_per_night'] is not None else 0.0
         item['rating'] = float(item['rating']) if item['rating'] is not None else 0.0
+    return act_all, rest_all, hotel_all
+
+def select_places_for_users(user_input: UserTourInfo, places=None):
+    # places: kết quả load_places_for_city đã có sẵn (batch), None thì query theo destination
+    duration = float(user_input.duration_days) if user_input.duration_days is not None else 3.0
+    budget = float(user_input.target_budget) if user_input.target_budget is not None else 1000.0
+    daily_budget = budget / duration
+    
+    act_all, rest_all, hotel_all = places if places is not None else load_places_for_city(user_input.destination_city_id)
 
     # Số lượng places cần thiết mỗi ngày
     num_activities_per_day = sum(1 for s in time_slots if s['type'] == 'activity')
@@ -5531,28 +5216,13 @@ def generate_tour_schedule(user_input: UserTourInfo, sel_activities, sel_restaur
     hotel_cost_per_night = float(hotel_per_day.get('price_per_night', 0.0))
     
     # Ensure enough activities and restaurants for the duration
-    num_activity_slots = sum(1 for s in time_slots if s['type'] == 'activity')
-    num_restaurant_slots = sum(1 for s in time_slots if s['type'] == 'restaurant')
+    # (số slot và slot hotel cuối ngày tính một lần, chia place cho từng ngày bằng cursor)
+    layout = slot_layout(time_slots)
+    num_activity_slots = layout['counts'].get('activity', 0)
+    num_restaurant_slots = layout['counts'].get('restaurant', 0)
     
-    all_activities = []
-    all_restaurants = []
-    
-    for day in range(duration):
-        day_activities = []
-        day_restaurants = []
-        
-        remaining_activities = [a for a in sel_activities if a not in [item for sublist in all_activities for item in sublist]]
-        if len(remaining_activities) < num_activity_slots:
-            remaining_activities += sel_activities
-        day_activities = remaining_activities[:num_activity_slots]
-        
-        remaining_restaurants = [r for r in sel_restaurants if r not in [item for sublist in all_restaurants for item in sublist]]
-        if len(remaining_restaurants) < num_restaurant_slots:
-            remaining_restaurants += sel_restaurants
-        day_restaurants = remaining_restaurants[:num_restaurant_slots]
-        
-        all_activities.append(day_activities)
-        all_restaurants.append(day_restaurants)
+    all_activities = allocate_days(sel_activities, duration, num_activity_slots)
+    all_restaurants = allocate_days(sel_restaurants, duration, num_restaurant_slots)
         
     schedule = []
     
@@ -5588,7 +5258,7 @@ def generate_tour_schedule(user_input: UserTourInfo, sel_activities, sel_restaur
                         "cost": float(it.get('price_avg', 0.0))
                     })
             else:
-                is_last_hotel_slot = slot['start_time'] == max(s['start_time'] for s in time_slots if s['type'] == 'hotel')
+                is_last_hotel_slot = slot['start_time'] == layout['last_hotel_start']
                 items.append({
                     "start_time": slot['start_time'],
                     "end_time": slot['end_time'],
@@ -5604,9 +5274,7 @@ def generate_tour_schedule(user_input: UserTourInfo, sel_activities, sel_restaur
     return schedule
 
 def build_final_tour_json(user_input: UserTourInfo, mode='auto'):
-    query_count = "SELECT COUNT(*) as count FROM tour_options WHERE user_id = %s"
-    exist_count_result = execute_query(query_count, (user_input.user_id or '',), fetch_one=True)
-    exist_count = exist_count_result['count'] if exist_count_result else 0
+    exist_count = tour_feature_store.count_for_user(user_input.user_id or '')
     
     use_existing = (mode == 'existing') or (mode == 'auto' and exist_count > 1)
     
@@ -5615,51 +5283,38 @@ def build_final_tour_json(user_input: UserTourInfo, mode='auto'):
     else:
         recommend_df = recommend_cold_start(user_input, K=5, top_n=1)
     
+    return tour_from_recommendation(recommend_df)
+
+def tour_from_recommendation(recommend_df, places_by_city=None):
+    # Tour JSON từ option đứng đầu recommend_df. places_by_city: dict dùng chung trong một batch
+    # (destination -> load_places_for_city) để mỗi thành phố chỉ query places một lần
     if recommend_df.empty:
         return {"error": "No suitable tour options found."}
         
     chosen_id = recommend_df.iloc[0]['option_id']
     
-    query_chosen = """
-        SELECT 
-            t.option_id, t.user_id, t.start_city_id, t.destination_city_id, 
-            t.guest_count, t.duration_days, t.target_budget,
-            GROUP_CONCAT(DISTINCT th.hotel_id) as hotel_ids,
-            GROUP_CONCAT(DISTINCT ta.activity_id) as activity_ids,
-            GROUP_CONCAT(DISTINCT tr.restaurant_id) as restaurant_ids,
-            GROUP_CONCAT(DISTINCT tt.transport_id) as transport_ids
-        FROM tour_options t
-        LEFT JOIN tour_options_hotels th ON t.option_id = th.option_id
-        LEFT JOIN tour_options_activities ta ON t.option_id = ta.option_id
-        LEFT JOIN tour_options_restaurants tr ON t.option_id = tr.option_id
-        LEFT JOIN tour_options_transports tt ON t.option_id = tt.option_id
-        WHERE t.option_id = %s
-        GROUP BY t.option_id, t.user_id, t.start_city_id, t.destination_city_id, 
-                 t.guest_count, t.duration_days, t.target_budget
-    """
-    
-    opt = execute_query(query_chosen, (chosen_id,), fetch_one=True)
+    opt = tour_feature_store.get(chosen_id)
     
     if not opt:
         return {"error": f"No tour option found for option_id: {chosen_id}"}
     
-    opt['guest_count'] = float(opt['guest_count']) if opt['guest_count'] is not None else 1.0
-    opt['duration_days'] = float(opt['duration_days']) if opt['duration_days'] is not None else 3.0
-    opt['target_budget'] = float(opt['target_budget']) if opt['target_budget'] is not None else 1000.0
-    opt['hotel_ids'] = opt['hotel_ids'].split(',') if opt['hotel_ids'] else []
-    opt['activity_ids'] = opt['activity_ids'].split(',') if opt['activity_ids'] else []
-    opt['restaurant_ids'] = opt['restaurant_ids'].split(',') if opt['restaurant_ids'] else []
-    opt['transport_ids'] = opt['transport_ids'].split(',') if opt['transport_ids'] else []
+    opt['guest_count'] = opt['guest_count'] if opt['guest_count'] is not None else 1.0
+    opt['duration_days'] = opt['duration_days'] if opt['duration_days'] is not None else 3.0
+    opt['target_budget'] = opt['target_budget'] if opt['target_budget'] is not None else 1000.0
     
     user = UserTourInfo(opt)
-    sel_activities, sel_restaurants, sel_hotels = select_places_for_users(user)
+    places = None
+    if places_by_city is not None:
+        city_key = _id_key(user.destination_city_id)
+        places = places_by_city.get(city_key)
+        if places is None:
+            places = places_by_city[city_key] = load_places_for_city(user.destination_city_id)
+    sel_activities, sel_restaurants, sel_hotels = select_places_for_users(user, places)
     schedule = generate_tour_schedule(user, sel_activities, sel_restaurants, sel_hotels)
     
-    city_query = "SELECT city_id, name FROM cities WHERE city_id IN (%s, %s)"
-    city_info_result = execute_query(city_query, (user.start_city_id, user.destination_city_id))
-    city_info = {row['city_id']: row['name'] for row in city_info_result} if city_info_result else {}
-    start_name = city_info.get(user.start_city_id, "Unknown")
-    destination_name = city_info.get(user.destination_city_id, "Unknown")
+    city_info = city_directory.resolve_many([user.start_city_id, user.destination_city_id])
+    start_name = city_info.get(user.start_city_id, {}).get('name', "Unknown")
+    destination_name = city_info.get(user.destination_city_id, {}).get('name', "Unknown")
     
     total_cost = 0.0
     for day in schedule:
@@ -5678,6 +5333,101 @@ def build_final_tour_json(user_input: UserTourInfo, mode='auto'):
         "schedule": schedule
     }
 
+def build_final_tour_json_batch(users, mode='auto', similarity_mode=None):
+    """
+    Generator build_final_tour_json cho nhiều UserTourInfo (job hàng loạt như email campaign).
+    User được gom theo thành phố đích: partition của mỗi thành phố chỉ lấy một lần và mọi user
+    cold-start của thành phố được chấm điểm cùng lúc bằng top_k_many; places của mỗi thành phố
+    cũng chỉ query một lần cho cả batch.
+    Yield (vị trí trong users, tour json) ngay khi từng user xong, lỗi của một user trả về
+    {"error": ...} thay vì dừng cả batch
+    """
+    places_by_city = {}
+    stats = None
+    groups = {}  # destination key -> ([(index, user) dùng tour cũ], [(index, user) cold start])
+
+    for index, user_input in enumerate(users):
+        try:
+            exist_count = tour_feature_store.count_for_user(user_input.user_id or '')
+            use_existing = (mode == 'existing') or (mode == 'auto' and exist_count > 1)
+            if not use_existing:
+                if stats is None:
+                    stats = tour_feature_store.imputation_stats()
+                if not stats['options']:
+                    yield index, {"error": "No suitable tour options found."}
+                    continue
+                user_input = prepare_cold_start_user(user_input, stats)
+        except Exception as e:
+            batch_log.exception('batch_prepare_failed', user_id=user_input.user_id, error=str(e))
+            yield index, {"error": str(e)}
+            continue
+        group = groups.setdefault(_id_key(user_input.destination_city_id), ([], []))
+        group[0 if use_existing else 1].append((index, user_input))
+
+    for existing, cold in groups.values():
+        for index, user_input in existing:
+            try:
+                tour = tour_from_recommendation(recommend_existing(user_input, top_n=1), places_by_city)
+            except Exception as e:
+                batch_log.exception('batch_recommendation_failed', user_id=user_input.user_id, error=str(e))
+                tour = {"error": str(e)}
+            yield index, tour
+
+        if not cold:
+            continue
+        destination_id = cold[0][1].destination_city_id
+        partition = tour_feature_store.partition(destination_id)
+        batch_scores = None
+        if partition is not None:
+            batch_scores = partition.similarity_matrix().top_k_many(
+                [user_input for _, user_input in cold], 5, mode=similarity_mode or SIMILARITY_CONFIG['mode'])
+
+        for index, user_input in cold:
+            try:
+                top_users = []
+                if batch_scores is not None:
+                    try:
+                        top_users = next(batch_scores)
+                    except Exception as e:
+                        # Một user lỗi làm hỏng cả khối: các user còn lại chấm điểm từng người
+                        batch_log.warning('batch_scoring_failed', destination_city_id=destination_id, error=str(e))
+                        batch_scores = None
+                        top_users = get_top_k_similar_users(user_input, 5, mode=similarity_mode)
+                elif partition is not None:
+                    top_users = get_top_k_similar_users(user_input, 5, mode=similarity_mode)
+                tour = tour_from_recommendation(rank_cold_start_options(user_input, top_users, top_n=1), places_by_city)
+            except Exception as e:
+                batch_log.exception('batch_recommendation_failed', user_id=user_input.user_id, error=str(e))
+                tour = {"error": str(e)}
+            yield index, tour
+
+@app.route("/api/admin/recommendations/batch", methods=["POST"])
+def batch_recommendations():
+    """
+    Gợi ý tour cho nhiều user một lượt (job email campaign hàng đêm).
+    Body: {"users": [{"user_id": ..., "destination_city_id": ..., ...} | user_id], "mode": "auto"}
+    Trả về NDJSON, mỗi dòng {"index", "user_id", "tour"} được stream ngay khi user đó xong
+    """
+    if not session.get('is_admin'):
+        return jsonify({'success': False, 'message': 'Không có quyền admin'}), 403
+
+    data = request.get_json(silent=True) or {}
+    users = data.get('users')
+    if not isinstance(users, list) or not users:
+        return jsonify({'success': False, 'message': 'users must be a non-empty list'}), 400
+    mode = data.get('mode', 'auto')
+    if mode not in ('auto', 'existing', 'cold_start'):
+        return jsonify({'success': False, 'message': f'Invalid mode: {mode}'}), 400
+
+    user_inputs = [UserTourInfo(user if isinstance(user, dict) else {'user_id': user}) for user in users]
+    user_ids = [user_input.user_id for user_input in user_inputs]
+
+    def generate():
+        for index, tour in build_final_tour_json_batch(user_inputs, mode=mode):
+            yield json.dumps({'index': index, 'user_id': user_ids[index], 'tour': tour}, default=str) + '\n'
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
 # Serve static files
 @app.route('/assets/<path:filename>')
 def serve_assets(filename):
@@ -5751,12 +5501,215 @@ def get_hotels_by_city(city_id):
 # TOUR GENERATION API - Integration with recommendation.py
 # =============================================================================
 
+def prepare_tour_generation(data):
+    """
+    Chuẩn hóa body của /api/generate-tour (đã validate required fields) thành (tour_input, user_prefs)
+    """
+    # Chuẩn bị dữ liệu cho recommendation system
+    tour_input = {
+        "user_id": data.get("user_id", None),
+        "start_city_id": data.get("start_city_id", None),
+        "destination_city_id": int(data["destination_city_id"]),
+        "hotel_ids": data.get("hotel_ids", []),
+        "activity_ids": data.get("activity_ids", []),
+        "restaurant_ids": data.get("restaurant_ids", []),
+        "transport_ids": data.get("transport_ids", []),
+        "guest_count": int(data["guest_count"]),
+        "duration_days": int(data["duration_days"]),
+        "target_budget": float(data["target_budget"])
+    }
+
+    # Xử lý user preferences từ frontend (từ daily preferences)
+    user_prefs = data.get("user_preferences", {})
+
+    # Chuyển đổi hotel_ids, activity_ids, restaurant_ids, transport_ids thành preferences format
+    if tour_input["hotel_ids"] or tour_input["activity_ids"] or tour_input["restaurant_ids"] or tour_input["transport_ids"]:
+        # Nếu có IDs được truyền vào, coi như là liked preferences
+        if not user_prefs:
+            user_prefs = {}
+
+        if tour_input["hotel_ids"]:
+            user_prefs["liked_hotels"] = user_prefs.get("liked_hotels", []) + tour_input["hotel_ids"]
+        if tour_input["activity_ids"]:
+            user_prefs["liked_activities"] = user_prefs.get("liked_activities", []) + tour_input["activity_ids"]
+        if tour_input["restaurant_ids"]:
+            user_prefs["liked_restaurants"] = user_prefs.get("liked_restaurants", []) + tour_input["restaurant_ids"]
+        if tour_input["transport_ids"]:
+            # Convert transport IDs to transport mode names bằng transport catalog trong bộ nhớ
+            print(f"🔄 Converting transport IDs: {tour_input['transport_ids']}")
+
+            try:
+                transport_modes = transport_catalog.resolve_preferences(tour_input["transport_ids"], unknown="taxi")
+
+            except Exception as e:
+                print(f"   ❌ Transport catalog error: {e}, using fallback mapping")
+                # Fallback to hardcoded mapping if database fails
+                transport_modes = [
+                    transport_id if transport_id in TRANSPORT_MODE_NAMES else "taxi"
+                    for transport_id in tour_input["transport_ids"]
+                ]
+
+            print(f"🚗 Final transport modes: {transport_modes}")
+            user_prefs["liked_transport_modes"] = user_prefs.get("liked_transport_modes", []) + transport_modes
+
+    # Process disliked transport modes từ user_preferences nếu có
+    if "disliked_transport_modes" in user_prefs and user_prefs["disliked_transport_modes"]:
+        print(f"🔄 Converting disliked transport IDs: {user_prefs['disliked_transport_modes']}")
+
+        try:
+            # ID không có trong catalog thì bỏ qua
+            disliked_modes = transport_catalog.resolve_preferences(user_prefs["disliked_transport_modes"], unknown=None)
+
+        except Exception as e:
+            print(f"   ❌ Transport catalog error: {e}, keeping original IDs")
+            # If database fails, assume they're already mode names
+            disliked_modes = [
+                transport_id for transport_id in user_prefs["disliked_transport_modes"]
+                if transport_id in TRANSPORT_MODE_NAMES
+            ]
+
+        print(f"🚫 Final disliked modes: {disliked_modes}")
+        user_prefs["disliked_transport_modes"] = disliked_modes
+
+    print(f"📋 Processed tour input: {tour_input}")
+    print(f"🚗 Transport preferences: liked={user_prefs.get('liked_transport_modes', [])}, disliked={user_prefs.get('disliked_transport_modes', [])}")
+
+    return tour_input, user_prefs
+
+def run_tour_generation(tour_input, user_prefs, progress=None, on_day=None):
+    """
+    Tạo tour bằng Gemini, trả về (http_status, payload) đúng như response của /api/generate-tour.
+    Chạy trực tiếp trong request hoặc trên worker của tour_jobs (progress(percent, stage) cập nhật job).
+    on_day(day) nhận từng ngày đã hậu xử lý khi stream (xem stream_tour_generation)
+    """
+    progress = progress or (lambda percent, stage=None: None)
+    progress(5, 'preparing')
+
+    # Import recommendation functions - CHỈ SỬ DỤNG GEMINI AI
+    try:
+        from recommendation import UserTourInfo, get_gemini_travel_recommendations
+    except ImportError as e:
+        print(f"❌ Error importing recommendation module: {str(e)}")
+        return 500, {
+            "success": False,
+            "error": "Gemini AI recommendation system not available"
+        }
+
+    # Tạo UserTourInfo object
+    try:
+        user_tour = UserTourInfo(tour_input)
+        print(f"✅ Created UserTourInfo object for user: {user_tour.user_id}")
+    except Exception as e:
+        print(f"❌ Error creating UserTourInfo: {str(e)}")
+        return 500, {
+            "success": False,
+            "error": f"Error creating tour request: {str(e)}"
+        }
+
+    # CHỈ SỬ DỤNG GEMINI AI RECOMMENDATION
+    try:
+        print(f"🤖 Using Gemini AI recommendation with preferences: {user_prefs}")
+
+        # Lấy tên thành phố đích
+        destination_name = "Unknown"
+        try:
+            destination_name = city_directory.name(user_tour.destination_city_id, "Unknown")
+            print(f"✅ Found destination city: {destination_name}")
+        except Exception as e:
+            print(f"⚠️ Error getting city name: {e}")
+
+        # Sử dụng Gemini AI recommendation (LUÔN LUÔN)
+        print(f"🔄 Calling Gemini AI for destination: {destination_name}")
+        # Không giữ kết nối của request (đã dùng cho city_directory/catalog) trong suốt lệnh gọi LLM
+        db.release()
+
+        try:
+            tour_result = get_gemini_travel_recommendations(user_tour, destination_name, user_prefs, progress=progress, on_day=on_day)
+            print(f"✅ Gemini AI returned result type: {type(tour_result)}")
+
+            if tour_result:
+                print(f"✅ Tour result keys: {list(tour_result.keys()) if isinstance(tour_result, dict) else 'Not a dict'}")
+
+        except Exception as gemini_error:
+            print(f"❌ Gemini AI error: {str(gemini_error)}")
+            print(f"❌ Error type: {type(gemini_error)}")
+            import traceback
+            print(f"❌ Traceback: {traceback.format_exc()}")
+
+            return 500, {
+                "success": False,
+                "error": f"Gemini AI error: {str(gemini_error)}",
+                "error_type": str(type(gemini_error))
+            }
+
+        if not tour_result:
+            print("❌ Gemini AI returned empty result")
+            return 500, {
+                "success": False,
+                "error": "Gemini AI returned empty tour recommendation"
+            }
+
+        print(f"🎉 Successfully generated Gemini tour for destination: {destination_name}")
+
+        # Return success response
+        return 200, {
+            "success": True,
+            "data": tour_result,
+            "recommendation_info": {
+                "algorithm_used": "gemini_ai",
+                "preferences_used": user_prefs,
+                "destination": destination_name,
+                "ai_model": get_llm_provider().model_name
+            }
+        }
+
+    except Exception as e:
+        print(f"❌ Error during tour generation: {str(e)}")
+        return 500, {
+            "success": False,
+            "error": f"Error generating tour: {str(e)}"
+        }
+
+def _sse(event, payload):
+    return f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False, default=str)}\n\n"
+
+def stream_tour_generation(job_id, keepalive=15):
+    """
+    Server-Sent Events cho /api/generate-tour?stream=1: 'progress' theo từng giai đoạn, 'day' cho mỗi
+    ngày ngay khi model viết xong và đã tính khoảng cách, cuối cùng 'done' (payload như response
+    thường) hoặc 'error'. Tour được tạo trên worker pool của tour_jobs (cùng giới hạn đồng thời,
+    hàng đợi và dedupe với ?async=1), generator chỉ đọc log event của job
+    """
+    cursor, days_sent = 0, 0
+    while True:
+        events, cursor, job = tour_jobs.wait_events(job_id, cursor, timeout=keepalive)
+        if job is None:
+            yield _sse('error', {"success": False, "error": "Job not found or expired"})
+            return
+        for event, payload in events:
+            if event == 'day':
+                days_sent += 1
+            yield _sse(event, payload)
+        if job['finished_at'] is not None:
+            payload = job['result']
+            # Cache hit / fallback / job không stream: gửi các ngày còn thiếu từ kết quả cuối
+            if payload.get('success'):
+                for day in payload['data'].get('schedule', [])[days_sent:]:
+                    yield _sse('day', day)
+            yield _sse('done' if payload.get('success') else 'error', payload)
+            return
+        if not events:
+            yield ": keepalive\n\n"
+
 @app.route("/api/generate-tour", methods=["POST"])
 def generate_tour():
     """
     API endpoint để generate tour sử dụng recommendation.py
     Input: JSON object với format từ frontend form
     Output: Generated tour JSON từ recommendation system
+    Với ?async=1 (hoặc "async": true trong body): trả về 202 + job_id ngay, tour được tạo trên
+    worker pool của tour_jobs, poll GET /api/generate-tour/<job_id> để lấy kết quả
+    Với ?stream=1: text/event-stream, từng ngày được gửi ngay khi xong (xem stream_tour_generation)
     """
     try:
         # Lấy dữ liệu từ request
@@ -5779,222 +5732,44 @@ def generate_tour():
                     "error": f"Missing required field: {field}"
                 }), 400
         
-        # Import recommendation functions - CHỈ SỬ DỤNG GEMINI AI
-        try:
-            from recommendation import UserTourInfo, get_gemini_travel_recommendations
-        except ImportError as e:
-            print(f"❌ Error importing recommendation module: {str(e)}")
-            return jsonify({
-                "success": False,
-                "error": "Gemini AI recommendation system not available"
-            }), 500
-        
-        # Chuẩn bị dữ liệu cho recommendation system
-        tour_input = {
-            "user_id": data.get("user_id", None),
-            "start_city_id": data.get("start_city_id", None),
-            "destination_city_id": int(data["destination_city_id"]),
-            "hotel_ids": data.get("hotel_ids", []),
-            "activity_ids": data.get("activity_ids", []),
-            "restaurant_ids": data.get("restaurant_ids", []),
-            "transport_ids": data.get("transport_ids", []),
-            "guest_count": int(data["guest_count"]),
-            "duration_days": int(data["duration_days"]),
-            "target_budget": float(data["target_budget"])
-        }
-        
-        # Xử lý user preferences từ frontend (từ daily preferences)
-        user_prefs = data.get("user_preferences", {})
-        
-        # Chuyển đổi hotel_ids, activity_ids, restaurant_ids, transport_ids thành preferences format
-        if tour_input["hotel_ids"] or tour_input["activity_ids"] or tour_input["restaurant_ids"] or tour_input["transport_ids"]:
-            # Nếu có IDs được truyền vào, coi như là liked preferences
-            if not user_prefs:
-                user_prefs = {}
-            
-            if tour_input["hotel_ids"]:
-                user_prefs["liked_hotels"] = user_prefs.get("liked_hotels", []) + tour_input["hotel_ids"]
-            if tour_input["activity_ids"]:
-                user_prefs["liked_activities"] = user_prefs.get("liked_activities", []) + tour_input["activity_ids"]
-            if tour_input["restaurant_ids"]:
-                user_prefs["liked_restaurants"] = user_prefs.get("liked_restaurants", []) + tour_input["restaurant_ids"]
-            if tour_input["transport_ids"]:
-                # Convert transport IDs to transport mode names by querying database
-                transport_modes = []
-                print(f"🔄 Converting transport IDs from database: {tour_input['transport_ids']}")
-                
-                # Get database connection to lookup transport types
-                try:
-                    from recommendation import get_db_connection
-                    conn = get_db_connection()
-                    cursor = conn.cursor(dictionary=True)
-                    
-                    for transport_id in tour_input["transport_ids"]:
-                        # First check if it's already a mode name
-                        if transport_id in ["walk", "bike", "scooter", "taxi", "bus", "metro"]:
-                            transport_modes.append(transport_id)
-                            print(f"   ✅ {transport_id} (already a mode name)")
-                        elif transport_id.lower() in ["walk", "walking", "on foot", "foot"]:
-                            transport_modes.append("walk")
-                            print(f"   ✅ {transport_id} → walk (manual walking)")
-                        else:
-                            # Query database to get transport type and use actual name
-                            cursor.execute("SELECT type FROM transports WHERE transport_id = %s", (transport_id,))
-                            result = cursor.fetchone()
-                            
-                            if result and result['type']:
-                                # Use actual database transport name instead of mapping
-                                transport_name = result['type']
-                                transport_modes.append(transport_name)
-                                print(f"   ✅ {transport_id} → {transport_name} (from database)")
-                            else:
-                                # Fallback
-                                transport_modes.append("taxi")
-                                print(f"   ⚠️ {transport_id} → taxi (not found in database)")
-                    
-                    cursor.close()
-                    conn.close()
-                    
-                except Exception as e:
-                    print(f"   ❌ Database error: {e}, using fallback mapping")
-                    # Fallback to hardcoded mapping if database fails
-                    for transport_id in tour_input["transport_ids"]:
-                        if transport_id in ["walk", "bike", "scooter", "taxi", "bus", "metro"]:
-                            transport_modes.append(transport_id)
-                        else:
-                            transport_modes.append("taxi")
-                
-                print(f"🚗 Final transport modes: {transport_modes}")
-                user_prefs["liked_transport_modes"] = user_prefs.get("liked_transport_modes", []) + transport_modes
+        tour_input, user_prefs = prepare_tour_generation(data)
         
-        # Process disliked transport modes từ user_preferences nếu có
-        if "disliked_transport_modes" in user_prefs and user_prefs["disliked_transport_modes"]:
-            disliked_modes = []
-            print(f"🔄 Converting disliked transport IDs from database: {user_prefs['disliked_transport_modes']}")
-            
-            # Get database connection to lookup transport types
+        if request.args.get('stream', '').lower() in ('1', 'true'):
             try:
-                from recommendation import get_db_connection
-                conn = get_db_connection()
-                cursor = conn.cursor(dictionary=True)
-                
-                for transport_id in user_prefs["disliked_transport_modes"]:
-                    # First check if it's already a mode name
-                    if transport_id in ["walk", "bike", "scooter", "taxi", "bus", "metro"]:
-                        disliked_modes.append(transport_id)
-                        print(f"   ❌ {transport_id} (already a mode name, disliked)")
-                    elif transport_id.lower() in ["walk", "walking", "on foot", "foot"]:
-                        disliked_modes.append("walk")
-                        print(f"   ❌ {transport_id} → walk (manual walking, disliked)")
-                    else:
-                        # Query database to get transport type and use actual name
-                        cursor.execute("SELECT type FROM transports WHERE transport_id = %s", (transport_id,))
-                        result = cursor.fetchone()
-                        
-                        if result and result['type']:
-                            # Use actual database transport name instead of mapping
-                            transport_name = result['type']
-                            disliked_modes.append(transport_name)
-                            print(f"   ❌ {transport_id} → {transport_name} (from database, disliked)")
-                        else:
-                            print(f"   ⚠️ {transport_id} → not found in database (skipped)")
-                
-                cursor.close()
-                conn.close()
-                
-            except Exception as e:
-                print(f"   ❌ Database error: {e}, keeping original IDs")
-                # If database fails, assume they're already mode names
-                for transport_id in user_prefs["disliked_transport_modes"]:
-                    if transport_id in ["walk", "bike", "scooter", "taxi", "bus", "metro"]:
-                        disliked_modes.append(transport_id)
-            
-            print(f"🚫 Final disliked modes: {disliked_modes}")
-            user_prefs["disliked_transport_modes"] = disliked_modes
-        
-        print(f"📋 Processed tour input: {tour_input}")
-        print(f"🚗 Transport preferences: liked={user_prefs.get('liked_transport_modes', [])}, disliked={user_prefs.get('disliked_transport_modes', [])}")
-        
-        # Tạo UserTourInfo object
-        try:
-            user_tour = UserTourInfo(tour_input)
-            print(f"✅ Created UserTourInfo object for user: {user_tour.user_id}")
-        except Exception as e:
-            print(f"❌ Error creating UserTourInfo: {str(e)}")
-            return jsonify({
-                "success": False,
-                "error": f"Error creating tour request: {str(e)}"
-            }), 500
-        
-        # CHỈ SỬ DỤNG GEMINI AI RECOMMENDATION
-        try:
-            print(f"🤖 Using Gemini AI recommendation with preferences: {user_prefs}")
-            
-            # Lấy tên thành phố đích
-            destination_name = "Unknown"
-            try:
-                from recommendation import get_db_connection
-                conn = get_db_connection()
-                cursor = conn.cursor(dictionary=True)
-                cursor.execute("SELECT name FROM cities WHERE city_id = %s", (user_tour.destination_city_id,))
-                city_result = cursor.fetchone()
-                if city_result:
-                    destination_name = city_result['name']
-                cursor.close()
-                conn.close()
-                print(f"✅ Found destination city: {destination_name}")
-            except Exception as e:
-                print(f"⚠️ Error getting city name: {e}")
-            
-            # Sử dụng Gemini AI recommendation (LUÔN LUÔN)
-            print(f"🔄 Calling Gemini AI for destination: {destination_name}")
-            
-            try:
-                tour_result = get_gemini_travel_recommendations(user_tour, destination_name, user_prefs)
-                print(f"✅ Gemini AI returned result type: {type(tour_result)}")
-                
-                if tour_result:
-                    print(f"✅ Tour result keys: {list(tour_result.keys()) if isinstance(tour_result, dict) else 'Not a dict'}")
-                
-            except Exception as gemini_error:
-                print(f"❌ Gemini AI error: {str(gemini_error)}")
-                print(f"❌ Error type: {type(gemini_error)}")
-                import traceback
-                print(f"❌ Traceback: {traceback.format_exc()}")
-                
+                job, _ = tour_jobs.submit(job_key(tour_input, user_prefs), run_tour_generation,
+                                          tour_input, user_prefs, stream=True)
+            except QueueFull as e:
                 return jsonify({
                     "success": False,
-                    "error": f"Gemini AI error: {str(gemini_error)}",
-                    "error_type": str(type(gemini_error))
-                }), 500
-            
-            if not tour_result:
-                print("❌ Gemini AI returned empty result")
+                    "error": str(e)
+                }), 503
+            # stream_with_context giữ app context tới khi stream xong: trả kết nối của request
+            # (có thể đã mượn khi city_directory/transport_catalog reload) trước khi stream
+            db.release()
+            return Response(
+                stream_with_context(stream_tour_generation(job['job_id'])),
+                mimetype='text/event-stream',
+                headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+            )
+        
+        if request.args.get('async', '').lower() in ('1', 'true') or data.get('async') is True:
+            try:
+                job, created = tour_jobs.submit(job_key(tour_input, user_prefs), run_tour_generation, tour_input, user_prefs)
+            except QueueFull as e:
                 return jsonify({
                     "success": False,
-                    "error": "Gemini AI returned empty tour recommendation"
-                }), 500
-                
-            print(f"🎉 Successfully generated Gemini tour for destination: {destination_name}")
-            
-            # Return success response
+                    "error": str(e)
+                }), 503
             return jsonify({
                 "success": True,
-                "data": tour_result,
-                "recommendation_info": {
-                    "algorithm_used": "gemini_ai",
-                    "preferences_used": user_prefs,
-                    "destination": destination_name,
-                    "ai_model": "gemini-1.5-flash"
-                }
-            })
-            
-        except Exception as e:
-            print(f"❌ Error during tour generation: {str(e)}")
-            return jsonify({
-                "success": False,
-                "error": f"Error generating tour: {str(e)}"
-            }), 500
+                "job_id": job['job_id'],
+                "status": job['status'],
+                "deduplicated": not created,
+                "status_url": f"/api/generate-tour/{job['job_id']}"
+            }), 202
+        
+        http_status, payload = run_tour_generation(tour_input, user_prefs)
+        return jsonify(payload), http_status
     
     except Exception as e:
         print(f"❌ Unexpected error in generate_tour: {str(e)}")
@@ -6002,9 +5777,28 @@ def generate_tour():
             "success": False,
             "error": f"Unexpected server error: {str(e)}"
         }), 500
+
+@app.route("/api/generate-tour/<string:job_id>", methods=["GET"])
+def generate_tour_job(job_id):
+    """
+    Status / progress của job tạo tour, kèm result (payload như /api/generate-tour) khi đã xong
+    """
+    job = tour_jobs.get(job_id)
+    if job is None:
+        return jsonify({
+            "success": False,
+            "error": "Job not found or expired"
+        }), 404
+    return jsonify({"success": True, "job": job})
+
 @app.route('/<path:filename>')
 def serve_files(filename):
     return send_from_directory('.', filename)
 
 if __name__ == "__main__":
+    # Build index autocomplete trước khi nhận request (lỗi DB thì build lại ở request đầu tiên)
+    try:
+        catalog_index.build()
+    except Exception as e:
+        print(f"⚠️ Could not build ghost-text index at startup: {e}")
     app.run(debug=True, host="0.0.0.0", port=8386)
\ No newline at end of file
@@ -0,0 +1,163 @@
+# Smart Travel Vietnam - Structured logging
+# JSON lines, level theo từng logger, sampling theo logger và format lười
+#
+#   from app_logging import get_logger
+#   log = get_logger('db.query')
+#   log.debug('query', sql=query, duration_ms=12.3)   # không format gì nếu DEBUG tắt
+#   log.info('report', rows=lambda: expensive_count())  # field callable chỉ được gọi khi ghi log
+
+import os
+import sys
+import json
+import random
+import logging
+import threading
+from datetime import datetime, timezone
+
+ROOT_LOGGER = 'smart_travel'
+
+# Logging configuration - có thể override bằng biến môi trường
+LOG_CONFIG = {
+    'level': os.environ.get('LOG_LEVEL', 'INFO').upper(),
+    'format': os.environ.get('LOG_FORMAT', 'json'),  # json | text
+    # Level riêng cho từng logger (tên không có prefix smart_travel.)
+    'levels': {},
+    # Tỉ lệ giữ lại (0.0 - 1.0) cho log dưới WARNING, khớp theo prefix dài nhất
+    'sampling': {
+        'db.query': float(os.environ.get('LOG_SAMPLE_DB_QUERY', 0.01)),
+    },
+    # Chỉ log statement chậm hơn ngưỡng này (ms)
+    'slow_query_ms': float(os.environ.get('SLOW_QUERY_MS', 200)),
+}
+
+_configured = False
+_configure_lock = threading.Lock()
+
+
+def _resolve(value):
+    return value() if callable(value) else value
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Một dòng JSON cho mỗi record. Field chỉ được resolve/serialize tại đây,
+    tức là khi record thực sự được ghi
+    """
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name[len(ROOT_LOGGER) + 1:] or record.name,
+            'event': record.getMessage(),
+        }
+        for key, value in (getattr(record, 'fields', None) or {}).items():
+            entry[key] = _resolve(value)
+        if record.exc_info:
+            entry['exc'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """
+    Dạng key=value dễ đọc khi chạy local
+    """
+
+    def format(self, record):
+        parts = [
+            datetime.fromtimestamp(record.created).strftime('%H:%M:%S'),
+            record.levelname,
+            record.name[len(ROOT_LOGGER) + 1:] or record.name,
+            record.getMessage(),
+        ]
+        for key, value in (getattr(record, 'fields', None) or {}).items():
+            parts.append(f"{key}={_resolve(value)}")
+        line = ' '.join(str(p) for p in parts)
+        if record.exc_info:
+            line += '\n' + self.formatException(record.exc_info)
+        return line
+
+
+def configure_logging(force=False):
+    """
+    Gắn handler stdout cho logger gốc smart_travel theo LOG_CONFIG (idempotent)
+    """
+    global _configured
+    with _configure_lock:
+        if _configured and not force:
+            return
+
+        root = logging.getLogger(ROOT_LOGGER)
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+
+        handler = logging.StreamHandler(sys.stdout)
+        handler.setFormatter(TextFormatter() if LOG_CONFIG['format'] == 'text' else JsonFormatter())
+        root.addHandler(handler)
+        root.setLevel(LOG_CONFIG['level'])
+        root.propagate = False
+
+        for name, level in LOG_CONFIG['levels'].items():
+            logging.getLogger(f"{ROOT_LOGGER}.{name}").setLevel(level.upper())
+
+        _configured = True
+
+
+def _sampling_rate(name):
+    best, rate = -1, 1.0
+    for prefix, value in LOG_CONFIG['sampling'].items():
+        if (name == prefix or name.startswith(prefix + '.')) and len(prefix) > best:
+            best, rate = len(prefix), value
+    return rate
+
+
+class StructuredLogger:
+    """
+    Wrapper mỏng quanh logging.Logger: kiểm tra level và sampling trước khi
+    tạo LogRecord, field được truyền dạng keyword và chỉ format khi ghi
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._logger = logging.getLogger(f"{ROOT_LOGGER}.{name}")
+        self.sample_rate = _sampling_rate(name)
+
+    def is_enabled(self, level):
+        return self._logger.isEnabledFor(level)
+
+    def _log(self, level, event, fields, exc_info=False):
+        if not self._logger.isEnabledFor(level):
+            return
+        # WARNING trở lên luôn được ghi, chỉ sample log chi tiết
+        if level < logging.WARNING and self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+            return
+        self._logger.log(level, event, exc_info=exc_info, extra={'fields': fields}, stacklevel=3)
+
+    def debug(self, event, **fields):
+        self._log(logging.DEBUG, event, fields)
+
+    def info(self, event, **fields):
+        self._log(logging.INFO, event, fields)
+
+    def warning(self, event, **fields):
+        self._log(logging.WARNING, event, fields)
+
+    def error(self, event, **fields):
+        self._log(logging.ERROR, event, fields)
+
+    def exception(self, event, **fields):
+        self._log(logging.ERROR, event, fields, exc_info=True)
+
+
+_loggers = {}
+
+
+def get_logger(name):
+    """
+    Lấy StructuredLogger theo tên (vd. 'db.query', 'api.restaurants')
+    """
+    logger = _loggers.get(name)
+    if logger is None:
+        configure_logging()
+        logger = _loggers.setdefault(name, StructuredLogger(name))
+    return logger
@@ -961,6 +961,38 @@ function updateHiddenTransportIds() {
     }
 }
 
+/**
+ * Đọc Server-Sent Events của /api/generate-tour?stream=1: gọi onDay(day) cho mỗi ngày vừa xong,
+ * trả về payload cuối cùng (event done/error)
+ */
+async function readTourStream(response, onDay) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        let boundary;
+        while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+            const message = buffer.slice(0, boundary);
+            buffer = buffer.slice(boundary + 2);
+            const event = (message.match(/^event: (.*)$/m) || [])[1];
+            const data = (message.match(/^data: (.*)$/m) || [])[1];
+            if (!event || data === undefined) continue;  // keepalive
+            const payload = JSON.parse(data);
+            if (event === 'day') {
+                onDay(payload);
+            } else if (event === 'progress') {
+                console.log(`⏳ Tour generation: ${payload.stage} (${payload.progress}%)`);
+            } else if (event === 'done' || event === 'error') {
+                return payload;
+            }
+        }
+    }
+    return { success: false, error: 'Stream ended unexpectedly' };
+}
+
 /**
  * Generate tour based on form data - Tích hợp với backend API
  */
@@ -1001,8 +1033,8 @@ async function generateTour() {
     console.log('📤 Sending tour data to API:', tourData);
     
     try {
-        // Gọi API backend
-        const response = await fetch('/api/generate-tour', {
+        // Gọi API backend (stream: hiển thị từng ngày ngay khi server tạo xong)
+        const response = await fetch('/api/generate-tour?stream=1', {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json',
@@ -1013,11 +1045,24 @@ async function generateTour() {
         });
         
         // Xử lý response
-        const result = await response.json();
+        const streamedDays = [];
+        const result = response.ok && (response.headers.get('Content-Type') || '').startsWith('text/event-stream') ?
+            await readTourStream(response, day => {
+                streamedDays.push(day);
+                if (loadingDiv) loadingDiv.classList.add('hidden');
+                if (resultsDiv) resultsDiv.classList.remove('hidden');
+                displayTourResults([{
+                    tour_id: 'streaming_tour',
+                    duration_days: tourData.duration_days,
+                    guest_count: tourData.guest_count,
+                    schedule: streamedDays
+                }]);
+            }) :
+            await response.json();
         
         if (loadingDiv) loadingDiv.classList.add('hidden');
         
-        if (response.ok && result.success) {
+        if (result.success) {
             // Hiển thị kết quả thành công
             console.log('✅ Tour generated successfully:', result.data);
             
@@ -0,0 +1,174 @@
+# Smart Travel Vietnam - Budget regression model registry
+# Mô hình target_budget ~ duration_days + guest_count được fit một lần (theo từng destination
+# và toàn cục) trên feature store, lưu hệ số ra file, fit lại theo lịch hoặc sau N tour option
+# mới. Dự đoán chỉ là intercept + 2 phép nhân
+#
+#   from budget_model import budget_model
+#   budget_model.predict(duration_days=3, guest_count=2, destination_city_id=5)
+
+import os
+import json
+import time
+import threading
+
+import numpy as np
+from sklearn.linear_model import LinearRegression
+
+from app_logging import get_logger
+from catalog_events import subscribe
+from reference_data import _id_key
+from tour_feature_store import tour_feature_store
+
+BUDGET_MODEL_CONFIG = {
+    'path': os.environ.get('BUDGET_MODEL_PATH', 'budget_model.json'),
+    'refit_interval': int(os.environ.get('BUDGET_MODEL_REFIT_INTERVAL', 6 * 3600)),  # giây
+    'refit_after': int(os.environ.get('BUDGET_MODEL_REFIT_AFTER', 500)),             # số tour option mới
+    'min_city_samples': int(os.environ.get('BUDGET_MODEL_MIN_CITY_SAMPLES', 20)),    # ít hơn thì dùng model toàn cục
+}
+
+FEATURES = ('duration_days', 'guest_count')
+GLOBAL_KEY = '*'
+
+log = get_logger('budget_model')
+
+
+def _fit(samples):
+    """
+    Fit LinearRegression trên list (duration_days, guest_count, target_budget),
+    trả về hệ số dạng dict để lưu JSON
+    """
+    data = np.array(samples, dtype=float)
+    reg = LinearRegression().fit(data[:, :2], data[:, 2])
+    return {
+        'intercept': float(reg.intercept_),
+        'coef': [float(c) for c in reg.coef_],
+        'samples': len(samples),
+    }
+
+
+class BudgetModelRegistry:
+    """
+    Hệ số hồi quy ngân sách theo destination_city_id (key GLOBAL_KEY cho model toàn cục).
+    Fit lại ở background thread khi đến hạn, request trong lúc đó vẫn dùng hệ số cũ
+    """
+
+    def __init__(self, path, refit_interval=6 * 3600, refit_after=500, min_city_samples=20):
+        self.path = path
+        self.refit_interval = refit_interval
+        self.refit_after = refit_after
+        self.min_city_samples = min_city_samples
+        self._lock = threading.Lock()
+        self._init_lock = threading.Lock()
+        self._models = None
+        self._fitted_at = None   # epoch giây, lưu cùng file
+        self._pending = 0        # số tour option thay đổi từ lần fit trước
+        self._refitting = False
+
+    # ---------- fit / lưu ----------
+
+    def fit(self):
+        """
+        Fit lại toàn bộ từ feature store và ghi file. Trả về số model đã fit
+        """
+        by_city, all_samples = {}, []
+        for option in tour_feature_store.all_options():
+            values = [option[field] for field in FEATURES] + [option['target_budget']]
+            if any(value is None for value in values):
+                continue
+            by_city.setdefault(_id_key(option['destination_city_id']), []).append(values)
+            all_samples.append(values)
+
+        models = {}
+        if all_samples:
+            models[GLOBAL_KEY] = _fit(all_samples)
+        for city_key, samples in by_city.items():
+            if len(samples) >= self.min_city_samples:
+                models[city_key] = _fit(samples)
+
+        fitted_at = time.time()
+        with self._lock:
+            self._models, self._fitted_at, self._pending = models, fitted_at, 0
+        self._save(models, fitted_at)
+        log.info('budget_model_fitted', models=len(models), samples=len(all_samples))
+        return len(models)
+
+    def _save(self, models, fitted_at):
+        try:
+            tmp_path = self.path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'fitted_at': fitted_at, 'features': list(FEATURES), 'models': models}, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            log.warning('budget_model_save_failed', path=self.path, error=str(e))
+
+    def _load_saved(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                saved = json.load(f)
+        except (OSError, ValueError):
+            return False
+        if saved.get('features') != list(FEATURES):
+            return False
+        with self._lock:
+            self._models, self._fitted_at = saved['models'], saved['fitted_at']
+        log.info('budget_model_loaded', models=len(saved['models']), path=self.path)
+        return True
+
+    def _ensure_models(self):
+        models = self._models
+        if models is None:
+            with self._init_lock:
+                if self._models is None and not self._load_saved():
+                    self.fit()
+            models = self._models
+        if self._due():
+            self._refit_in_background()
+        return models
+
+    def _due(self):
+        if self._refitting:
+            return False
+        if self._fitted_at is None or time.time() - self._fitted_at >= self.refit_interval:
+            return True
+        return self._pending >= self.refit_after
+
+    def _refit_in_background(self):
+        with self._lock:
+            if self._refitting:
+                return
+            self._refitting = True
+
+        def run():
+            try:
+                self.fit()
+            except Exception as e:
+                log.exception('budget_model_refit_failed', error=str(e))
+            finally:
+                self._refitting = False
+
+        threading.Thread(target=run, name='budget-model-refit', daemon=True).start()
+
+    def _on_tour_option_change(self, table, row_id):
+        with self._lock:
+            self._pending += 1 if row_id is not None else self.refit_after
+
+    # ---------- dự đoán ----------
+
+    def predict(self, duration_days, guest_count, destination_city_id=None):
+        """
+        Ngân sách dự đoán bằng model của destination (nếu đủ dữ liệu), không thì model toàn cục.
+        None nếu chưa có dữ liệu để fit
+        """
+        models = self._ensure_models()
+        model = None
+        if destination_city_id is not None:
+            model = models.get(_id_key(destination_city_id))
+        model = model or models.get(GLOBAL_KEY)
+        if model is None:
+            return None
+        coef = model['coef']
+        return model['intercept'] + coef[0] * float(duration_days) + coef[1] * float(guest_count)
+
+
+budget_model = BudgetModelRegistry(**BUDGET_MODEL_CONFIG)
+subscribe(budget_model._on_tour_option_change, tables=('tour_options',))
@@ -0,0 +1,44 @@
+# Smart Travel Vietnam - Catalog change notifications
+# Các endpoint admin gọi notify_change() sau khi ghi hotels/restaurants/activities/...,
+# các cache/index trong bộ nhớ subscribe() để cập nhật đúng phần bị thay đổi
+#
+#   from catalog_events import notify_change, subscribe
+#   subscribe(on_change, tables=('hotels', 'restaurants'))
+#   notify_change('hotels', 'H0012')      # một dòng thay đổi
+#   notify_change('restaurants')          # cả bảng (vd. import Excel)
+
+import threading
+
+from app_logging import get_logger
+
+log = get_logger('catalog_events')
+
+_subscribers = []
+_lock = threading.Lock()
+
+
+def subscribe(callback, tables=None):
+    """
+    Đăng ký callback(table, row_id). tables=None nghĩa là nhận mọi bảng
+    """
+    with _lock:
+        _subscribers.append((frozenset(tables) if tables else None, callback))
+    return callback
+
+
+def notify_change(table, row_id=None):
+    """
+    Báo cho các subscriber biết bảng table (dòng row_id, hoặc cả bảng nếu None) vừa thay đổi.
+    Lỗi của một subscriber không ảnh hưởng request admin hay các subscriber khác
+    """
+    with _lock:
+        subscribers = list(_subscribers)
+
+    for tables, callback in subscribers:
+        if tables is not None and table not in tables:
+            continue
+        try:
+            callback(table, row_id)
+        except Exception as e:
+            log.exception('catalog_subscriber_failed', table=table, row_id=row_id,
+                          subscriber=getattr(callback, '__qualname__', repr(callback)), error=str(e))
@@ -0,0 +1,250 @@
+# Smart Travel Vietnam - Unit-of-work database API
+# Giữ một kết nối cho cả request, hỗ trợ transaction, savepoint và batch statements
+#
+#   import db
+#   with db.session() as s:
+#       with s.transaction():
+#           s.execute("UPDATE ...", params)
+#           s.executemany("INSERT ...", rows)
+#   db.release()    # trả kết nối của request trước việc dài không dùng DB (vd. gọi LLM)
+
+import time
+import itertools
+from contextlib import contextmanager
+
+from flask import g, has_app_context
+from mysql.connector.errors import ProgrammingError, NotSupportedError
+
+from db_pool import get_pool
+from app_logging import LOG_CONFIG, get_logger
+
+query_log = get_logger('db.query')
+slow_log = get_logger('db.slow')
+
+_G_KEY = '_db_session'
+
+
+def _compact_sql(query):
+    return ' '.join(query.split())
+
+
+def _log_statement(query, started, rows=None, batch=None, prepared=False):
+    """
+    Log thời gian chạy statement: luôn log nếu vượt ngưỡng slow_query_ms,
+    còn lại chỉ log DEBUG (có sampling). Không log params để tránh lộ dữ liệu
+    """
+    duration_ms = (time.perf_counter() - started) * 1000.0
+    if duration_ms >= LOG_CONFIG['slow_query_ms']:
+        slow_log.warning('slow_query', sql=lambda: _compact_sql(query),
+                         duration_ms=round(duration_ms, 2), rows=rows, batch=batch, prepared=prepared)
+    else:
+        query_log.debug('query', sql=lambda: _compact_sql(query),
+                        duration_ms=round(duration_ms, 2), rows=rows, batch=batch, prepared=prepared)
+
+
+class Session:
+    """
+    Bọc một kết nối mượn từ pool. Kết nối ở chế độ autocommit, nên mỗi statement
+    ngoài transaction() được commit ngay; bên trong transaction() thì commit/rollback
+    một lần khi kết thúc block.
+    """
+
+    _savepoint_ids = itertools.count(1)
+
+    def __init__(self, connection):
+        self.connection = connection
+        self._depth = 0  # số transaction() lồng nhau đang mở
+
+    @property
+    def in_transaction(self):
+        return self._depth > 0
+
+    def cursor(self):
+        return self.connection.cursor(dictionary=True, buffered=True)
+
+    def execute(self, query, params=None, fetch_one=False, fetch_all=True):
+        """
+        Chạy một statement, cùng ngữ nghĩa trả về với execute_query:
+        SELECT trả về row/list row, INSERT/UPDATE/DELETE trả về affected_rows và last_id.
+        Lỗi MySQL được raise cho caller (transaction() sẽ rollback).
+        SELECT/INSERT/UPDATE/DELETE chạy bằng prepared statement cache của kết nối nếu có.
+        """
+        statement = query.strip().lower()
+        if params is not None and not isinstance(params, (tuple, dict)):
+            params = tuple(params)
+
+        statements = getattr(self.connection, 'statements', None)
+        if statements is not None and statement.startswith(('select', 'insert', 'update', 'delete')):
+            entry = statements.get(self.connection, query)
+            if entry is not None:
+                try:
+                    return self._execute_prepared(entry, params, statement, fetch_one, fetch_all)
+                except (ProgrammingError, NotSupportedError):
+                    # Statement không prepare được (hoặc lỗi cú pháp): bỏ cursor khỏi cache
+                    # và chạy lại bằng cursor thường; nếu lại lỗi thì đó là lỗi thật
+                    statements.discard(query)
+                    result = self._execute_plain(query, params, statement, fetch_one, fetch_all)
+                    statements.discard(query, unpreparable=True)
+                    return result
+                except Exception:
+                    statements.discard(query)
+                    raise
+
+        return self._execute_plain(query, params, statement, fetch_one, fetch_all)
+
+    def _execute_prepared(self, entry, params, statement, fetch_one, fetch_all):
+        sql, cursor = entry
+        started = time.perf_counter()
+        try:
+            # Truyền đúng object sql đã cache: connector so sánh theo identity để bỏ qua bước prepare
+            cursor.execute(sql, params or ())
+            if statement.startswith('select'):
+                # Prepared cursor không buffered: luôn đọc hết để giải phóng kết nối
+                rows = cursor.fetchall()
+                if fetch_one:
+                    return rows[0] if rows else None
+                return rows if fetch_all else None
+            return {'affected_rows': cursor.rowcount, 'last_id': cursor.lastrowid}
+        finally:
+            _log_statement(sql, started, rows=cursor.rowcount, prepared=True)
+
+    def _execute_plain(self, query, params, statement, fetch_one, fetch_all):
+        cursor = self.cursor()
+        started = time.perf_counter()
+        try:
+            cursor.execute(query, params or ())
+
+            if statement.startswith('select'):
+                if fetch_one:
+                    return cursor.fetchone()
+                rows = cursor.fetchall()
+                return rows if fetch_all else None
+            if statement.startswith(('insert', 'update', 'delete')):
+                return {'affected_rows': cursor.rowcount, 'last_id': cursor.lastrowid}
+            return None
+        finally:
+            _log_statement(query, started, rows=cursor.rowcount)
+            cursor.close()
+
+    def executemany(self, query, seq_params):
+        """
+        Chạy một statement cho nhiều bộ params. Với INSERT ... VALUES,
+        mysql-connector gộp thành một multi-row INSERT (một round trip).
+        """
+        seq_params = list(seq_params)
+        if not seq_params:
+            return {'affected_rows': 0, 'last_id': None}
+
+        cursor = self.cursor()
+        started = time.perf_counter()
+        try:
+            cursor.executemany(query, seq_params)
+            return {'affected_rows': cursor.rowcount, 'last_id': cursor.lastrowid}
+        finally:
+            _log_statement(query, started, rows=cursor.rowcount, batch=len(seq_params))
+            cursor.close()
+
+    @contextmanager
+    def transaction(self):
+        """
+        Transaction tường minh. Nếu đã ở trong transaction thì block lồng nhau
+        được xử lý như một savepoint.
+        """
+        if self.in_transaction:
+            with self.savepoint():
+                yield self
+            return
+
+        self.connection.start_transaction()
+        self._depth += 1
+        try:
+            yield self
+        except BaseException:
+            self._depth -= 1
+            self.connection.rollback()
+            raise
+        else:
+            self._depth -= 1
+            self.connection.commit()
+
+    @contextmanager
+    def savepoint(self):
+        """
+        Savepoint bên trong transaction hiện tại: lỗi trong block chỉ rollback
+        phần việc của block, transaction bên ngoài vẫn tiếp tục.
+        """
+        if not self.in_transaction:
+            raise RuntimeError("savepoint() must be used inside session.transaction()")
+
+        name = f"sp_{next(self._savepoint_ids)}"
+        self.execute(f"SAVEPOINT {name}")
+        self._depth += 1
+        try:
+            yield self
+        except BaseException:
+            self._depth -= 1
+            self.execute(f"ROLLBACK TO SAVEPOINT {name}")
+            raise
+        else:
+            self._depth -= 1
+            self.execute(f"RELEASE SAVEPOINT {name}")
+
+    def close(self):
+        """
+        Trả kết nối về pool (pool tự rollback nếu còn transaction dang dở)
+        """
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+
+@contextmanager
+def session():
+    """
+    Lấy session của request hiện tại (tạo mới nếu chưa có). Kết nối được giữ
+    đến khi request kết thúc và trả về pool trong teardown (hoặc sớm hơn bằng release()).
+    Ngoài Flask app context thì session chỉ sống trong block with.
+    """
+    if has_app_context():
+        s = g.get(_G_KEY)
+        if s is None:
+            s = Session(get_pool().acquire())
+            setattr(g, _G_KEY, s)
+        yield s
+        return
+
+    s = Session(get_pool().acquire())
+    try:
+        yield s
+    finally:
+        s.close()
+
+
+def release():
+    """
+    Trả kết nối của request hiện tại về pool ngay, không đợi teardown. Gọi trước việc dài
+    không dùng DB; db.session() sau đó trong cùng request sẽ mượn kết nối mới.
+    Không làm gì ngoài app context hoặc khi request chưa mượn kết nối
+    """
+    if not has_app_context():
+        return
+    s = g.get(_G_KEY)
+    if s is None:
+        return
+    if s.in_transaction:
+        raise RuntimeError("db.release() called inside an open transaction")
+    g.pop(_G_KEY)
+    s.close()
+
+
+def close_request_session(exc=None):
+    """
+    Teardown handler: trả kết nối của request về pool
+    """
+    s = g.pop(_G_KEY, None)
+    if s is not None:
+        s.close()
+
+
+def init_app(app):
+    app.teardown_appcontext(close_request_session)
@@ -0,0 +1,362 @@
+# Smart Travel Vietnam - Shared MySQL connection pool
+# Một pool duy nhất cho toàn process, dùng chung bởi app.py và recommendation.py
+
+import os
+import time
+import threading
+from collections import deque, OrderedDict
+
+import mysql.connector
+from mysql.connector.errors import PoolError
+
+# Database configuration - Chỉnh sửa để khớp với database của user
+DB_CONFIG = {
+    'host': 'localhost',
+    'user': 'root',
+    'password': '',  # Thay đổi password database của bạn
+    'database': 'smart_travel',  # Tên database theo schema đã cung cấp
+    'charset': 'utf8mb4',
+    'collation': 'utf8mb4_unicode_ci'
+}
+
+# Pool configuration - có thể override bằng biến môi trường
+POOL_CONFIG = {
+    'size': int(os.environ.get('DB_POOL_SIZE', 10)),                # số kết nối giữ thường trực
+    'max_overflow': int(os.environ.get('DB_POOL_MAX_OVERFLOW', 10)),  # số kết nối tạm thời khi pool đầy
+    'timeout': float(os.environ.get('DB_POOL_TIMEOUT', 10)),        # giây chờ tối đa khi mượn kết nối
+    'recycle': int(os.environ.get('DB_POOL_RECYCLE', 1800)),        # giây trước khi đóng và mở lại kết nối
+    'pre_ping': os.environ.get('DB_POOL_PRE_PING', '1') != '0',      # ping kết nối trước khi giao cho caller
+    'statement_cache_size': int(os.environ.get('DB_STATEMENT_CACHE_SIZE', 64)),  # prepared statements / kết nối, 0 = tắt
+}
+
+# Biên của histogram thời gian chờ (ms)
+WAIT_BUCKETS_MS = (1, 5, 10, 50, 100, 500, 1000, 5000)
+
+
+class StatementCacheStats:
+    """
+    Bộ đếm hit/miss của prepared-statement cache, cộng dồn cho mọi kết nối trong pool
+    """
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.fallbacks = 0  # statement MySQL không cho prepare, chạy bằng cursor thường
+
+    def as_dict(self):
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'fallbacks': self.fallbacks,
+            'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0
+        }
+
+
+class StatementCache:
+    """
+    LRU các prepared cursor của một kết nối, key theo SQL text.
+    Mỗi prepared cursor giữ đúng một statement đã prepare trên server, nên gọi lại
+    cùng SQL chỉ tốn bước execute.
+    """
+
+    def __init__(self, capacity, stats):
+        self.capacity = capacity
+        self.stats = stats
+        self._cursors = OrderedDict()  # sql -> (sql object, cursor)
+        self._unpreparable = set()
+
+    def get(self, raw, query):
+        """
+        Trả về (sql, cursor) đã prepare cho query, hoặc None nếu không dùng prepared.
+        Phải truyền lại đúng object sql trả về vào cursor.execute để connector
+        không prepare lại.
+        """
+        if query in self._unpreparable:
+            return None
+
+        entry = self._cursors.get(query)
+        if entry is not None:
+            self._cursors.move_to_end(query)
+            self.stats.hits += 1
+            return entry
+
+        self.stats.misses += 1
+        entry = (query, raw.cursor(prepared=True, dictionary=True))
+        self._cursors[query] = entry
+        if len(self._cursors) > self.capacity:
+            _, (_, old_cursor) = self._cursors.popitem(last=False)
+            self.stats.evictions += 1
+            self._close_cursor(old_cursor)
+        return entry
+
+    def discard(self, query, unpreparable=False):
+        entry = self._cursors.pop(query, None)
+        if entry is not None:
+            self._close_cursor(entry[1])
+        if unpreparable:
+            self.stats.fallbacks += 1
+            self._unpreparable.add(query)
+
+    def __len__(self):
+        return len(self._cursors)
+
+    @staticmethod
+    def _close_cursor(cursor):
+        try:
+            cursor.close()
+        except Exception:
+            pass
+
+
+class _Slot:
+    """
+    Một kết nối thật của pool cùng metadata đi kèm
+    """
+
+    __slots__ = ('raw', 'created_at', 'statements')
+
+    def __init__(self, raw, created_at, statements):
+        self.raw = raw
+        self.created_at = created_at
+        self.statements = statements
+
+
+class PooledConnection:
+    """
+    Proxy quanh kết nối MySQL thật. close() trả kết nối về pool thay vì đóng socket,
+    nên code cũ dạng connection.close() vẫn chạy đúng.
+    """
+
+    def __init__(self, pool, slot):
+        self._pool = pool
+        self._slot = slot
+        self._raw = slot.raw
+        self._released = False
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+    @property
+    def statements(self):
+        """
+        Prepared-statement cache của kết nối (None nếu bị tắt)
+        """
+        return self._slot.statements
+
+    def close(self):
+        if self._released:
+            return
+        self._released = True
+        self._pool._release(self._slot)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+
+class ConnectionPool:
+    """
+    Pool kết nối MySQL thread-safe với overflow, timeout khi mượn,
+    health-check khi mượn và recycle kết nối quá cũ
+    """
+
+    def __init__(self, db_config, size=10, max_overflow=10, timeout=10.0,
+                 recycle=1800, pre_ping=True, statement_cache_size=64):
+        self.db_config = dict(db_config)
+        self.size = size
+        self.max_overflow = max_overflow
+        self.timeout = timeout
+        self.recycle = recycle
+        self.pre_ping = pre_ping
+        self.statement_cache_size = statement_cache_size
+        self.statement_stats = StatementCacheStats()
+
+        self._cond = threading.Condition()
+        self._idle = deque()   # _Slot
+        self._opened = 0       # tổng số kết nối đang mở (idle + in use)
+        self._in_use = 0
+        self._waiting = 0
+
+        self._checkouts = 0
+        self._timeouts = 0
+        self._recycled = 0
+        self._ping_failures = 0
+        self._wait_total_ms = 0.0
+        self._wait_max_ms = 0.0
+        self._wait_histogram = [0] * (len(WAIT_BUCKETS_MS) + 1)
+
+    def _connect(self):
+        raw = mysql.connector.connect(**self.db_config, autocommit=True)
+        statements = None
+        if self.statement_cache_size > 0:
+            statements = StatementCache(self.statement_cache_size, self.statement_stats)
+        return _Slot(raw, time.monotonic(), statements)
+
+    @staticmethod
+    def _discard(raw):
+        try:
+            raw.close()
+        except Exception:
+            pass
+
+    def _record_wait(self, waited_ms):
+        self._checkouts += 1
+        self._wait_total_ms += waited_ms
+        self._wait_max_ms = max(self._wait_max_ms, waited_ms)
+        for i, bound in enumerate(WAIT_BUCKETS_MS):
+            if waited_ms <= bound:
+                self._wait_histogram[i] += 1
+                return
+        self._wait_histogram[-1] += 1
+
+    def acquire(self, timeout=None):
+        """
+        Mượn một kết nối. Raise PoolError nếu hết thời gian chờ.
+        """
+        timeout = self.timeout if timeout is None else timeout
+        started = time.monotonic()
+        deadline = started + timeout
+        slot = None
+
+        with self._cond:
+            while True:
+                if self._idle:
+                    slot = self._idle.pop()
+                    break
+                if self._opened < self.size + self.max_overflow:
+                    self._opened += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._timeouts += 1
+                    raise PoolError(
+                        f"Connection pool exhausted: no connection available after {timeout}s "
+                        f"(size={self.size}, max_overflow={self.max_overflow})"
+                    )
+                self._waiting += 1
+                try:
+                    self._cond.wait(remaining)
+                finally:
+                    self._waiting -= 1
+            self._in_use += 1
+            self._record_wait((time.monotonic() - started) * 1000.0)
+
+        try:
+            slot = self._validate(slot)
+        except Exception:
+            with self._cond:
+                self._opened -= 1
+                self._in_use -= 1
+                self._cond.notify()
+            raise
+
+        return PooledConnection(self, slot)
+
+    def _validate(self, slot):
+        """
+        Mở kết nối mới nếu cần, recycle kết nối quá cũ và ping kết nối idle
+        """
+        if slot is None:
+            return self._connect()
+
+        if self.recycle and time.monotonic() - slot.created_at > self.recycle:
+            self._discard(slot.raw)
+            self._recycled += 1
+            return self._connect()
+
+        if self.pre_ping:
+            try:
+                slot.raw.ping(reconnect=False)
+            except mysql.connector.Error:
+                self._discard(slot.raw)
+                self._ping_failures += 1
+                return self._connect()
+
+        return slot
+
+    def _release(self, slot):
+        healthy = True
+        try:
+            if slot.raw.in_transaction:
+                slot.raw.rollback()
+        except Exception:
+            healthy = False
+
+        with self._cond:
+            self._in_use -= 1
+            if healthy and self._opened <= self.size:
+                self._idle.append(slot)
+            else:
+                # Kết nối overflow hoặc lỗi thì đóng luôn
+                self._opened -= 1
+                self._discard(slot.raw)
+            self._cond.notify()
+
+    def close_all(self):
+        """
+        Đóng toàn bộ kết nối idle (kết nối đang mượn sẽ bị đóng khi trả về)
+        """
+        with self._cond:
+            while self._idle:
+                slot = self._idle.pop()
+                self._opened -= 1
+                self._discard(slot.raw)
+
+    def stats(self):
+        """
+        Thống kê pool cho monitoring
+        """
+        with self._cond:
+            histogram = {}
+            for i, bound in enumerate(WAIT_BUCKETS_MS):
+                histogram[f"le_{bound}ms"] = self._wait_histogram[i]
+            histogram[f"gt_{WAIT_BUCKETS_MS[-1]}ms"] = self._wait_histogram[-1]
+
+            return {
+                'size': self.size,
+                'max_overflow': self.max_overflow,
+                'timeout': self.timeout,
+                'recycle': self.recycle,
+                'pre_ping': self.pre_ping,
+                'opened': self._opened,
+                'in_use': self._in_use,
+                'idle': len(self._idle),
+                'overflow': max(0, self._opened - self.size),
+                'waiting': self._waiting,
+                'checkouts': self._checkouts,
+                'timeouts': self._timeouts,
+                'recycled': self._recycled,
+                'ping_failures': self._ping_failures,
+                'wait_ms': {
+                    'avg': round(self._wait_total_ms / self._checkouts, 3) if self._checkouts else 0.0,
+                    'max': round(self._wait_max_ms, 3),
+                    'histogram': histogram
+                },
+                'statement_cache': dict(
+                    self.statement_stats.as_dict(),
+                    capacity_per_connection=self.statement_cache_size,
+                    cached_statements=sum(len(slot.statements) for slot in self._idle if slot.statements)
+                )
+            }
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """
+    Lấy pool dùng chung của process (khởi tạo lười lần đầu gọi)
+    """
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(DB_CONFIG, **POOL_CONFIG)
+    return _pool
@@ -0,0 +1,232 @@
+# Smart Travel Vietnam - Cache for Gemini itinerary responses
+# Hai tầng: LRU trong process + file JSON trên đĩa (dùng chung giữa các worker, còn sau khi restart).
+# Key là hash của các input tạo nên prompt đã chuẩn hóa: destination, số ngày, số khách, dải ngân
+# sách, preferences (đã sort, bỏ trùng) và chính các activities/restaurants/hotels gửi cho model,
+# nên khi catalog của thành phố thay đổi thì key đổi theo và entry cũ không bao giờ được dùng lại
+#
+#   from itinerary_cache import itinerary_cache, request_key
+#   key = request_key(destination_city_id, destination_name, duration, guests, budget, user_prefs, travel_data)
+#   text = itinerary_cache.get(key)
+#   if text is None:
+#       text = get_llm_provider().generate(prompt, context)
+#       itinerary_cache.put(key, text)
+
+import os
+import json
+import math
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+from app_logging import get_logger
+from reference_data import _id_key
+
+ITINERARY_CACHE_CONFIG = {
+    'enabled': os.environ.get('ITINERARY_CACHE_ENABLED', '1') != '0',
+    'max_entries': int(os.environ.get('ITINERARY_CACHE_MAX_ENTRIES', 256)),     # tầng bộ nhớ
+    'ttl': int(os.environ.get('ITINERARY_CACHE_TTL', 24 * 3600)),               # giây, cả hai tầng
+    'directory': os.environ.get('ITINERARY_CACHE_DIR', 'itinerary_cache'),      # '' = tắt tầng đĩa
+}
+
+# Độ rộng tương đối của một dải ngân sách trong key (0.1 = 10%)
+BUDGET_BAND_WIDTH = float(os.environ.get('ITINERARY_CACHE_BUDGET_BAND', 0.1))
+
+# Các preference được đưa vào prompt
+PREFERENCE_FIELDS = (
+    'liked_activities', 'liked_restaurants', 'liked_hotels', 'liked_transport_modes',
+    'disliked_activities', 'disliked_restaurants', 'disliked_hotels', 'disliked_transport_modes',
+)
+
+KEY_VERSION = 2  # tăng khi đổi prompt để bỏ qua các entry cũ trên đĩa
+
+_PRUNE_EVERY = 100  # số lần ghi đĩa giữa hai lần dọn file hết hạn
+
+log = get_logger('itinerary_cache')
+
+
+def budget_band(budget, width=None):
+    """
+    Chỉ số dải ngân sách theo thang log: các ngân sách lệch nhau dưới width (tương đối)
+    thường rơi vào cùng dải và dùng chung itinerary
+    """
+    width = BUDGET_BAND_WIDTH if width is None else width
+    budget = float(budget or 0)
+    if budget <= 0 or width <= 0:
+        return budget
+    return math.floor(math.log(budget) / math.log1p(width))
+
+
+def request_key(destination_city_id, destination_name, duration, guests, budget, user_prefs, travel_data,
+                model=None):
+    """
+    Hash SHA-256 của input prompt đã chuẩn hóa và model (backend) tạo response. user_id /
+    start_city_id không nằm trong key vì không ảnh hưởng tới lịch trình model trả về
+    """
+    user_prefs = user_prefs or {}
+    payload = {
+        'v': KEY_VERSION,
+        'model': model,
+        'destination': _id_key(destination_city_id),
+        'destination_name': destination_name,
+        'duration': int(duration),
+        'guests': int(guests),
+        'budget_band': budget_band(budget),
+        'prefs': {field: sorted({_id_key(value) for value in user_prefs.get(field) or ()})
+                  for field in PREFERENCE_FIELDS},
+        'catalog': travel_data,
+    }
+    blob = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str, separators=(',', ':'))
+    return hashlib.sha256(blob.encode('utf-8')).hexdigest()
+
+
+class ItineraryCache:
+    """
+    Text response của model theo request_key: LRU trong bộ nhớ, sau đó tới file <key>.json
+    trong directory. Entry quá ttl bị bỏ qua (và xóa khỏi đĩa)
+    """
+
+    def __init__(self, enabled=True, max_entries=256, ttl=24 * 3600, directory='itinerary_cache'):
+        self.enabled = enabled
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (created_at epoch, text)
+        self._writes = 0
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def _path(self, key):
+        return os.path.join(self.directory, f'{key}.json')
+
+    def _remember(self, key, created_at, text):
+        with self._lock:
+            self._entries[key] = (created_at, text)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get(self, key):
+        if not self.enabled:
+            return None
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if now - entry[0] < self.ttl:
+                    self._entries.move_to_end(key)
+                    self.memory_hits += 1
+                    return entry[1]
+                del self._entries[key]
+
+        entry = self._read(key, now)
+        if entry is not None:
+            self._remember(key, *entry)
+            with self._lock:
+                self.disk_hits += 1
+            return entry[1]
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def _read(self, key, now):
+        if not self.directory:
+            return None
+        path = self._path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                saved = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if not isinstance(saved, dict) or 'text' not in saved or now - saved.get('created_at', 0) >= self.ttl:
+            self._remove(path)
+            return None
+        return saved['created_at'], saved['text']
+
+    def put(self, key, text):
+        if not self.enabled:
+            return
+        created_at = time.time()
+        self._remember(key, created_at, text)
+        if not self.directory:
+            return
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            path = self._path(key)
+            tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'created_at': created_at, 'text': text}, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            log.warning('itinerary_cache_write_failed', directory=self.directory, error=str(e))
+            return
+
+        with self._lock:
+            self._writes += 1
+            prune = self._writes % _PRUNE_EVERY == 0
+        if prune:
+            self.prune()
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def prune(self):
+        """
+        Xóa các file đã hết hạn trên đĩa, trả về số file đã xóa
+        """
+        if not self.directory:
+            return 0
+        now, removed = time.time(), 0
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return 0
+        for name in names:
+            if not name.endswith('.json'):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                if now - os.path.getmtime(path) >= self.ttl:
+                    self._remove(path)
+                    removed += 1
+            except OSError:
+                continue
+        if removed:
+            log.info('itinerary_cache_pruned', files=removed)
+        return removed
+
+    def clear(self):
+        """
+        Xóa cả hai tầng (vd. sau khi đổi model hoặc prompt)
+        """
+        with self._lock:
+            self._entries.clear()
+        if self.directory and os.path.isdir(self.directory):
+            for name in os.listdir(self.directory):
+                if name.endswith('.json'):
+                    self._remove(os.path.join(self.directory, name))
+
+    def stats(self):
+        with self._lock:
+            lookups = self.memory_hits + self.disk_hits + self.misses
+            return {
+                'enabled': self.enabled,
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl': self.ttl,
+                'directory': self.directory,
+                'memory_hits': self.memory_hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'hit_ratio': round((self.memory_hits + self.disk_hits) / lookups, 4) if lookups else 0.0,
+            }
+
+
+itinerary_cache = ItineraryCache(**ITINERARY_CACHE_CONFIG)
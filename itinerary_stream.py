@@ -0,0 +1,161 @@
+# Smart Travel Vietnam - Incremental parsing of streamed Gemini itineraries
+# Khi gọi model ở chế độ stream, JSON lịch trình tới theo từng mảnh text.
+# DayStreamParser nhận từng mảnh và trả về các object trong mảng "days" ở cấp cao nhất ngay khi
+# object đó đóng ngoặc, để hậu xử lý và gửi ngày 1 cho browser trong lúc model còn viết ngày 2, 3...
+#
+#   from itinerary_stream import DayStreamParser
+#   parser = DayStreamParser()
+#   for text in get_llm_provider().stream(prompt, context):
+#       for day in parser.feed(text):
+#           ...
+#
+#   python itinerary_stream.py    # time-to-first-day so với chờ cả response (độ trễ model giả lập)
+
+import json
+import time
+
+
+class DayStreamParser:
+    """
+    Quét text một lần duy nhất (giữ trạng thái giữa các lần feed): độ sâu ngoặc, đang ở trong
+    string hay không, string cuối cùng ở cấp 1 (tên key). Markdown bao ngoài (```json) được bỏ qua
+    vì chỉ tính từ dấu { đầu tiên. Object không parse được (model viết sai) bị bỏ qua, caller vẫn
+    parse lại toàn bộ text ở cuối
+    """
+
+    def __init__(self, key='days'):
+        self.key = key
+        self._text = ''
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._string_start = None
+        self._last_string = None   # string cuối ở cấp 1
+        self._days_depth = None    # độ sâu bên trong mảng days, None khi chưa/không còn ở trong mảng
+        self._object_start = None
+        self.days_parsed = 0
+
+    def feed(self, chunk):
+        """
+        Thêm một mảnh text, trả về list các day object vừa hoàn chỉnh
+        """
+        if not chunk:
+            return []
+        self._text += chunk
+        text, completed = self._text, []
+        i = self._pos
+        while i < len(text):
+            ch = text[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == '\\':
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    if self._depth == 1:
+                        self._last_string = text[self._string_start + 1:i]
+            elif ch == '"':
+                self._in_string = True
+                self._string_start = i
+            elif ch in '{[':
+                if ch == '[' and self._depth == 1 and self._last_string == self.key:
+                    self._days_depth = 2
+                elif ch == '{' and self._days_depth is not None and self._depth == self._days_depth:
+                    self._object_start = i
+                self._depth += 1
+            elif ch in '}]':
+                self._depth -= 1
+                if self._days_depth is not None:
+                    if ch == '}' and self._depth == self._days_depth and self._object_start is not None:
+                        day = self._parse(text[self._object_start:i + 1])
+                        if day is not None:
+                            completed.append(day)
+                        self._object_start = None
+                    elif ch == ']' and self._depth == 1:
+                        self._days_depth = None
+            i += 1
+
+        # Chỉ giữ phần text còn cần (object day đang viết dở) để không quét lại từ đầu
+        keep_from = self._object_start if self._object_start is not None else i
+        if self._in_string and self._depth == 1 and self._string_start < keep_from:
+            keep_from = self._string_start
+        self._text = text[keep_from:]
+        self._pos = i - keep_from
+        if self._object_start is not None:
+            self._object_start -= keep_from
+        if self._in_string:
+            self._string_start -= keep_from
+        return completed
+
+    def _parse(self, blob):
+        try:
+            day = json.loads(blob)
+        except ValueError:
+            return None
+        if not isinstance(day, dict):
+            return None
+        self.days_parsed += 1
+        return day
+
+
+# ---------- benchmark ----------
+
+def _synthetic_itinerary(days, activities_per_day=8):
+    return {
+        'destination': 'Hội An', 'guests': 2, 'duration_days': days, 'within_budget': True,
+        'total_cost': 512.5,
+        'cost_breakdown': {'hotels': 200, 'activities': 150, 'meals': 120, 'transport_estimate': 42.5},
+        'days': [{
+            'day': d + 1,
+            'activities': [{
+                'start_time': f'{8 + a:02d}:00', 'end_time': f'{8 + a:02d}:45',
+                'type': 'transfer' if a % 2 else 'activity',
+                'place_id': None if a % 2 else f'A{d * activities_per_day + a:04d}',
+                'place_name': f'Địa điểm "{a}" {{ngày {d + 1}}}',
+                'description': 'Tham quan phố cổ [buổi sáng] \\ chụp ảnh',
+                'transport_mode': 'taxi', 'distance_km': None, 'travel_time_min': None, 'cost': 12.5,
+            } for a in range(activities_per_day)],
+        } for d in range(days)],
+    }
+
+
+def benchmark(days=(3, 7, 14), chunk_size=64, chunk_delay_ms=5.0):
+    """
+    Giả lập stream của model: response chia thành mảnh chunk_size ký tự, mỗi mảnh trễ chunk_delay_ms.
+    So thời điểm có ngày đầu tiên với thời điểm có cả response (cách cũ), kiểm tra các ngày parse
+    được trùng với json.loads của cả response
+    """
+    report = []
+    for count in days:
+        itinerary = _synthetic_itinerary(count)
+        text = '```json\n' + json.dumps(itinerary, ensure_ascii=False, indent=2) + '\n```'
+        chunks = [text[i:i + chunk_size] for i in range(0, len(text), chunk_size)]
+
+        parser, parsed, first_day_at, parse_s = DayStreamParser(), [], None, 0.0
+        started = time.perf_counter()
+        for chunk in chunks:
+            time.sleep(chunk_delay_ms / 1000)
+            t = time.perf_counter()
+            new_days = parser.feed(chunk)
+            parse_s += time.perf_counter() - t
+            if new_days and first_day_at is None:
+                first_day_at = time.perf_counter() - started
+            parsed.extend(new_days)
+        total = time.perf_counter() - started
+
+        report.append({
+            'days': count,
+            'chunks': len(chunks),
+            'first_day_ms': round(first_day_at * 1000, 1) if first_day_at is not None else None,
+            'full_response_ms': round(total * 1000, 1),
+            'parse_overhead_ms': round(parse_s * 1000, 2),
+            'identical': parsed == itinerary['days'],
+        })
+    return report
+
+
+if __name__ == '__main__':
+    for line in benchmark():
+        print(line)
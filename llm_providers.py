@@ -0,0 +1,293 @@
+# Smart Travel Vietnam - LLM backends for itinerary generation
+# get_gemini_travel_recommendations gọi model qua get_llm_provider() thay vì một GenerativeModel
+# tạo lúc import. Chọn backend bằng LLM_PROVIDER:
+#   gemini  Google Gemini (mặc định), google.generativeai chỉ được import khi dùng tới
+#   stub    không gọi mạng: dựng lịch trình hợp lệ theo schema từ chính các candidate gửi cho model,
+#           có độ trễ giả lập và tỉ lệ lỗi / JSON hỏng cấu hình được, để load-test /api/generate-tour
+#
+#   from llm_providers import get_llm_provider
+#   llm = get_llm_provider()
+#   text = llm.generate(prompt, context)          # context: travel_data, user_prefs, duration, ...
+#   for piece in llm.stream(prompt, context): ...
+#
+#   GEMINI_API_KEY=... python app.py
+#   LLM_PROVIDER=stub LLM_STUB_LATENCY=2.5 LLM_STUB_ERROR_RATE=0.05 python app.py
+#   python llm_providers.py    # thông lượng + kiểm tra schema của stub
+
+import os
+import json
+import time
+import random
+import threading
+
+from app_logging import get_logger
+
+LLM_CONFIG = {
+    'provider': os.environ.get('LLM_PROVIDER', 'gemini'),
+    'gemini_model': os.environ.get('GEMINI_MODEL', 'models/gemini-1.5-flash'),
+    'gemini_api_key': os.environ.get('GEMINI_API_KEY'),  # bắt buộc khi provider=gemini
+    'stub_latency': float(os.environ.get('LLM_STUB_LATENCY', 1.0)),            # giây cho cả response
+    'stub_jitter': float(os.environ.get('LLM_STUB_JITTER', 0.2)),              # ± tỉ lệ của latency
+    'stub_error_rate': float(os.environ.get('LLM_STUB_ERROR_RATE', 0.0)),      # raise LLMError
+    'stub_malformed_rate': float(os.environ.get('LLM_STUB_MALFORMED_RATE', 0.0)),  # trả JSON bị cắt
+    'stub_chunk_chars': int(os.environ.get('LLM_STUB_CHUNK_CHARS', 256)),      # kích thước mảnh khi stream
+    'stub_seed': int(os.environ.get('LLM_STUB_SEED', 0)),
+}
+
+# Key bắt buộc của response (xem prompt_builder.OUTPUT_FORMAT)
+ITINERARY_KEYS = ('destination', 'guests', 'duration_days', 'within_budget', 'total_cost', 'cost_breakdown', 'days')
+ITEM_KEYS = ('start_time', 'end_time', 'type', 'place_id', 'place_name', 'description',
+             'transport_mode', 'distance_km', 'travel_time_min', 'cost')
+
+log = get_logger('llm_providers')
+
+
+class LLMError(Exception):
+    """Lỗi từ backend LLM (kể cả lỗi giả lập của stub)"""
+
+
+class LLMProvider:
+    """
+    Interface của backend: generate() trả về toàn bộ text, stream() trả về từng mảnh text.
+    context là input đã chuẩn hóa của prompt (backend thật bỏ qua, stub dùng để dựng lịch trình)
+    """
+    name = 'base'
+    model_name = None
+
+    def generate(self, prompt, context=None):
+        raise NotImplementedError
+
+    def stream(self, prompt, context=None):
+        yield self.generate(prompt, context)
+
+
+class GeminiProvider(LLMProvider):
+    name = 'gemini'
+
+    def __init__(self, model_name, api_key):
+        if not api_key:
+            raise ValueError("GEMINI_API_KEY is not set (or use LLM_PROVIDER=stub to run without Gemini)")
+        import google.generativeai as genai
+
+        genai.configure(api_key=api_key)
+        self.model_name = model_name.split('/')[-1]
+        self._model = genai.GenerativeModel(model_name=model_name)
+
+    def generate(self, prompt, context=None):
+        return self._model.generate_content(prompt).text.strip()
+
+    def stream(self, prompt, context=None):
+        for chunk in self._model.generate_content(prompt, stream=True):
+            try:
+                text = chunk.text
+            except ValueError:
+                # Chunk không có text (vd. chỉ có safety ratings)
+                continue
+            yield text
+
+
+# Lịch trình một ngày của stub: (start, end, type, loại candidate)
+_STUB_DAY = (
+    ('07:30', '08:15', 'meal', 'restaurants'),
+    ('09:00', '11:30', 'activity', 'activities'),
+    ('12:00', '13:00', 'meal', 'restaurants'),
+    ('13:30', '14:00', 'rest', None),
+    ('14:30', '17:00', 'activity', 'activities'),
+    ('18:30', '19:30', 'meal', 'restaurants'),
+    ('20:00', '21:00', 'hotel', 'hotels'),
+)
+
+_ID_FIELDS = {'activities': 'activity_id', 'restaurants': 'restaurant_id', 'hotels': 'hotel_id'}
+_PRICE_FIELDS = {'activities': 'price', 'restaurants': 'price_avg', 'hotels': 'price_per_night'}
+_PREF_FIELDS = {'activities': 'activities', 'restaurants': 'restaurants', 'hotels': 'hotels'}
+
+
+def _minutes(hhmm):
+    hours, minutes = hhmm.split(':')
+    return int(hours) * 60 + int(minutes)
+
+
+def _hhmm(minutes):
+    return f'{(minutes // 60) % 24:02d}:{minutes % 60:02d}'
+
+
+class StubProvider(LLMProvider):
+    """
+    Không gọi mạng. Lịch trình tất định theo context: candidate liked trước, rồi theo rating,
+    bỏ candidate disliked, xoay vòng qua các ngày; transfer giữa hai mục liên tiếp dùng transport
+    mode liked (hoặc mode không bị dislike, mặc định taxi). Độ trễ và lỗi lấy từ RNG có seed
+    """
+    name = 'stub'
+    model_name = 'local-stub'
+
+    def __init__(self, latency=1.0, jitter=0.2, error_rate=0.0, malformed_rate=0.0, chunk_chars=256, seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.malformed_rate = malformed_rate
+        self.chunk_chars = chunk_chars
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _draw(self):
+        with self._lock:
+            delay = self.latency * (1 + self.jitter * (2 * self._rng.random() - 1))
+            fail = self._rng.random() < self.error_rate
+            malformed = self._rng.random() < self.malformed_rate
+        return max(delay, 0.0), fail, malformed
+
+    def _respond(self, context):
+        delay, fail, malformed = self._draw()
+        if fail:
+            raise LLMError('Injected stub error')
+        text = json.dumps(build_stub_itinerary(**(context or {})), ensure_ascii=False)
+        if malformed:
+            text = text[:len(text) // 2]
+        return text, delay
+
+    def generate(self, prompt, context=None):
+        text, delay = self._respond(context)
+        time.sleep(delay)
+        return text
+
+    def stream(self, prompt, context=None):
+        text, delay = self._respond(context)
+        pieces = [text[i:i + self.chunk_chars] for i in range(0, len(text), self.chunk_chars)] or ['']
+        for piece in pieces:
+            time.sleep(delay / len(pieces))
+            yield piece
+
+
+def _ranked(rows, key, user_prefs):
+    id_field = _ID_FIELDS[key]
+    liked = {str(v) for v in user_prefs.get(f'liked_{_PREF_FIELDS[key]}') or ()}
+    disliked = {str(v) for v in user_prefs.get(f'disliked_{_PREF_FIELDS[key]}') or ()}
+    rows = [row for row in rows or () if str(row.get(id_field)) not in disliked]
+    return sorted(rows, key=lambda row: (str(row.get(id_field)) not in liked, -float(row.get('rating') or 0)))
+
+
+def build_stub_itinerary(destination_name='Unknown', duration=3, guests=1, budget=1000.0,
+                         travel_data=None, user_prefs=None, **_):
+    """
+    Lịch trình đúng schema của prompt_builder.OUTPUT_FORMAT từ các candidate trong travel_data
+    """
+    travel_data, user_prefs = travel_data or {}, user_prefs or {}
+    rooms = max(1, (guests + 1) // 2)
+    candidates = {key: _ranked(travel_data.get(key), key, user_prefs) for key in _ID_FIELDS}
+    disliked_modes = set(user_prefs.get('disliked_transport_modes') or ())
+    modes = list(user_prefs.get('liked_transport_modes') or ()) or \
+        [mode for mode in ('taxi', 'walk', 'bus') if mode not in disliked_modes] or ['taxi']
+
+    used = dict.fromkeys(_ID_FIELDS, 0)
+    breakdown = {'hotels': 0.0, 'activities': 0.0, 'meals': 0.0, 'transport_estimate': 0.0}
+    days = []
+    for day_number in range(1, duration + 1):
+        items = []
+        for start, end, item_type, key in _STUB_DAY:
+            place = None
+            if key == 'hotels':
+                place = candidates[key][0] if candidates[key] else None
+            elif key and candidates[key]:
+                place = candidates[key][used[key] % len(candidates[key])]
+                used[key] += 1
+            if key and place is None:
+                continue
+
+            if items:
+                # Transfer 15 phút trước mục này
+                transfer_start = _minutes(start) - 15
+                mode = modes[(day_number + len(items)) % len(modes)]
+                items.append({
+                    'start_time': _hhmm(transfer_start), 'end_time': start, 'type': 'transfer',
+                    'place_id': None, 'place_name': f'Di chuyển bằng {mode}',
+                    'description': f'Di chuyển bằng {mode} đến địa điểm tiếp theo',
+                    'transport_mode': mode, 'distance_km': None, 'travel_time_min': None, 'cost': 0,
+                })
+
+            cost = 0.0
+            if place is not None:
+                price = float(place.get(_PRICE_FIELDS[key]) or 0)
+                cost = round(price * (rooms if key == 'hotels' else guests), 2)
+                breakdown['hotels' if key == 'hotels' else 'meals' if key == 'restaurants' else 'activities'] += cost
+            items.append({
+                'start_time': start, 'end_time': end, 'type': item_type if item_type != 'rest' else 'activity',
+                'place_id': place.get(_ID_FIELDS[key]) if place else None,
+                'place_name': place.get('name') if place else 'Nghỉ ngơi',
+                'description': (place.get('description') or '')[:120] if place else 'Nghỉ ngơi tự do',
+                'transport_mode': None, 'distance_km': None, 'travel_time_min': None, 'cost': cost,
+            })
+        days.append({'day': day_number, 'activities': items})
+
+    breakdown = {key: round(value, 2) for key, value in breakdown.items()}
+    total = round(sum(breakdown.values()), 2)
+    itinerary = {
+        'destination': destination_name, 'guests': guests, 'duration_days': duration,
+        'within_budget': total <= budget, 'total_cost': total, 'cost_breakdown': breakdown, 'days': days,
+    }
+    if total > budget:
+        itinerary['reason'] = 'Candidate prices exceed the budget'
+    return itinerary
+
+
+def create_llm_provider(config=None):
+    config = config or LLM_CONFIG
+    provider = config['provider']
+    if provider == 'gemini':
+        return GeminiProvider(config['gemini_model'], config['gemini_api_key'])
+    if provider == 'stub':
+        return StubProvider(latency=config['stub_latency'], jitter=config['stub_jitter'],
+                            error_rate=config['stub_error_rate'], malformed_rate=config['stub_malformed_rate'],
+                            chunk_chars=config['stub_chunk_chars'], seed=config['stub_seed'])
+    raise ValueError(f"Unknown LLM_PROVIDER: {provider}")
+
+
+_provider = None
+_provider_lock = threading.Lock()
+
+
+def get_llm_provider():
+    """
+    Backend dùng chung cho process, tạo ở lần gọi đầu tiên
+    """
+    global _provider
+    if _provider is None:
+        with _provider_lock:
+            if _provider is None:
+                _provider = create_llm_provider()
+                log.info('llm_provider_ready', provider=_provider.name, model=_provider.model_name)
+    return _provider
+
+
+# ---------- benchmark ----------
+
+def benchmark(requests=20, duration=5, threads=(1, 4)):
+    """
+    Thông lượng của stub (latency 0.2s) theo số thread song song và kiểm tra mọi response
+    có đủ key của schema
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    from prompt_builder import _synthetic_travel_data
+
+    context = {'destination_name': 'Đà Nẵng', 'duration': duration, 'guests': 2, 'budget': 1500.0,
+               'travel_data': _synthetic_travel_data(), 'user_prefs': {'liked_transport_modes': ['walk']}}
+    report = []
+    for workers in threads:
+        stub = StubProvider(latency=0.2, jitter=0.0)
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            texts = list(pool.map(lambda _: stub.generate('', context), range(requests)))
+        elapsed = time.perf_counter() - started
+        itineraries = [json.loads(text) for text in texts]
+        valid = all(
+            all(key in itinerary for key in ITINERARY_KEYS) and len(itinerary['days']) == duration and
+            all(all(key in item for key in ITEM_KEYS) for day in itinerary['days'] for item in day['activities'])
+            for itinerary in itineraries
+        )
+        report.append({'threads': workers, 'requests': requests, 'elapsed_s': round(elapsed, 2),
+                       'requests_per_s': round(requests / elapsed, 1), 'schema_valid': valid})
+    return report
+
+
+if __name__ == '__main__':
+    for line in benchmark():
+        print(line)
@@ -0,0 +1,78 @@
+# Smart Travel Vietnam - Bulk place lookups
+# Lấy nhiều activities/restaurants/hotels/transports theo id bằng một câu IN
+# thay vì một câu SELECT ... WHERE <id> = %s cho từng id trong vòng lặp
+#
+#   from place_catalog import get_places_by_ids
+#   get_places_by_ids('activity', ['A001', 'A002'])                    # {'A001': {...}, 'A002': {...}}
+#   get_places_by_ids('hotel', ids, columns=('latitude', 'longitude'))
+
+import os
+
+import db
+from app_logging import get_logger
+from reference_data import _id_key
+
+PLACE_CATALOG_CONFIG = {
+    'in_chunk_size': int(os.environ.get('PLACE_LOOKUP_CHUNK_SIZE', 512)),  # số id tối đa mỗi câu IN
+}
+
+# place_type -> (bảng, cột id, cột giá)
+PLACE_TYPES = {
+    'hotel': ('hotels', 'hotel_id', 'price_per_night'),
+    'activity': ('activities', 'activity_id', 'price'),
+    'restaurant': ('restaurants', 'restaurant_id', 'price_avg'),
+    'transport': ('transports', 'transport_id', 'avg_price_per_km'),
+}
+
+TABLE_PLACE_TYPES = {table: place_type for place_type, (table, _, _) in PLACE_TYPES.items()}
+
+log = get_logger('place_catalog')
+
+
+def _padded(keys):
+    # Làm tròn số placeholder lên lũy thừa của 2 (lặp lại id cuối) để prepared statement
+    # cache của kết nối chỉ giữ vài biến thể của câu IN
+    size = 1 << (len(keys) - 1).bit_length()
+    return keys + [keys[-1]] * (size - len(keys))
+
+
+def get_places_by_ids(place_type, ids, columns=None):
+    """
+    {id truyền vào: row} của các id tồn tại, id không có trong bảng bị bỏ qua (giống
+    city_directory.resolve_many). columns=None lấy mọi cột, cột id luôn có trong row.
+    place_type không hợp lệ hoặc lỗi DB trả về {} (như execute_query trả None)
+    """
+    if place_type not in PLACE_TYPES:
+        return {}
+    table, id_field, _ = PLACE_TYPES[place_type]
+
+    wanted = {}  # id key -> các giá trị id truyền vào
+    for place_id in ids:
+        if place_id is not None:
+            wanted.setdefault(_id_key(place_id), []).append(place_id)
+    if not wanted:
+        return {}
+
+    select = '*' if columns is None else ', '.join(dict.fromkeys((id_field,) + tuple(columns)))
+    keys = list(wanted)
+    chunk_size = PLACE_CATALOG_CONFIG['in_chunk_size']
+    rows_by_key = {}
+    try:
+        with db.session() as s:
+            for start in range(0, len(keys), chunk_size):
+                chunk = _padded(keys[start:start + chunk_size])
+                placeholders = ', '.join(['%s'] * len(chunk))
+                rows = s.execute(f"SELECT {select} FROM {table} WHERE {id_field} IN ({placeholders})", tuple(chunk))
+                for row in rows or []:
+                    rows_by_key.setdefault(_id_key(row[id_field]), row)
+    except Exception as e:
+        log.warning('place_lookup_failed', place_type=place_type, ids=len(keys), error=str(e))
+        return {}
+
+    result = {}
+    for key, originals in wanted.items():
+        row = rows_by_key.get(key)
+        if row is not None:
+            for place_id in originals:
+                result[place_id] = row
+    return result
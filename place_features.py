@@ -0,0 +1,170 @@
+# Smart Travel Vietnam - Content-based place feature cache
+# Ma trận đặc trưng (price, rating) của các place trong một thành phố, đã điền giá trị thiếu
+# bằng mean và chuẩn hóa như SimpleImputer + StandardScaler, được cache theo (place_type, city)
+# và build lại khi catalog_events báo bảng tương ứng thay đổi. Một lần gợi ý chỉ còn là
+# một phép nhân ma trận-vector (cosine) và chọn top-k
+#
+#   from place_features import place_feature_cache
+#   features = place_feature_cache.get(city_id, 'activity')
+#   features.most_similar(preferred_places, limit=5)
+#   features.top_rated(limit=5)
+
+import os
+import time
+import threading
+
+import numpy as np
+
+import db
+from app_logging import get_logger
+from catalog_events import subscribe
+from place_catalog import PLACE_TYPES, TABLE_PLACE_TYPES
+from reference_data import _id_key
+
+PLACE_FEATURES_CONFIG = {
+    'ttl': int(os.environ.get('PLACE_FEATURES_TTL', 900)),                # giây, lưới an toàn khi DB bị sửa ngoài admin
+    'candidates': int(os.environ.get('PLACE_FEATURES_CANDIDATES', 100)),  # số place rating cao nhất mỗi thành phố
+}
+
+log = get_logger('place_features')
+
+
+def _to_float(value):
+    return float(value) if value is not None else np.nan
+
+
+class PlaceFeatures:
+    """
+    Các place của một (place_type, city) theo rating giảm dần, kèm:
+      means:        mean từng cột trên giá trị khác NULL (SimpleImputer strategy='mean')
+      center/scale: mean và độ lệch chuẩn sau khi điền (StandardScaler, cột hằng có scale 1)
+      unit:         các dòng đã chuẩn hóa chia cho norm, để cosine là một phép nhân
+    """
+
+    def __init__(self, place_type, places):
+        self.place_type = place_type
+        self.places = places
+        _, id_field, self.price_field = PLACE_TYPES[place_type]
+        self._by_id = {_id_key(place[id_field]): place for place in places}
+
+        raw = self._raw(places)
+        with np.errstate(invalid='ignore'):
+            counts = (~np.isnan(raw)).sum(axis=0)
+            sums = np.nansum(raw, axis=0)
+            self.means = np.where(counts > 0, sums / np.maximum(counts, 1), 0.0)
+
+        filled = self._impute(raw)
+        self.center = filled.mean(axis=0) if len(places) else np.zeros(2)
+        std = filled.std(axis=0) if len(places) else np.ones(2)
+        self.scale = np.where(std > 0, std, 1.0)
+
+        scaled = (filled - self.center) / self.scale
+        norms = np.linalg.norm(scaled, axis=1)
+        self.unit = scaled / np.where(norms > 0, norms, 1.0)[:, None]
+
+    def __len__(self):
+        return len(self.places)
+
+    def _raw(self, places):
+        return np.array([[_to_float(place.get(self.price_field)), _to_float(place.get('rating'))]
+                         for place in places], dtype=float).reshape(-1, 2)
+
+    def _impute(self, raw):
+        return np.where(np.isnan(raw), self.means, raw)
+
+    def transform(self, places):
+        """
+        Đặc trưng đã điền + chuẩn hóa của các place bất kỳ (vd. place user đã chọn)
+        theo thống kê của thành phố
+        """
+        return (self._impute(self._raw(places)) - self.center) / self.scale
+
+    def lookup(self, place_ids):
+        """
+        {id truyền vào: place} cho các id nằm trong danh sách của thành phố (như get_places_by_ids)
+        """
+        found = {}
+        for place_id in place_ids:
+            place = self._by_id.get(_id_key(place_id)) if place_id is not None else None
+            if place is not None:
+                found[place_id] = place
+        return found
+
+    def top_rated(self, limit):
+        return [dict(place) for place in self.places[:max(int(limit), 0)]]
+
+    def most_similar(self, preferred_places, limit=5):
+        """
+        limit place có cosine similarity cao nhất với trung bình đặc trưng của preferred_places,
+        place cùng điểm giữ thứ tự rating
+        """
+        if not len(self) or not preferred_places:
+            return []
+        profile = self.transform(preferred_places).mean(axis=0)
+        norm = np.linalg.norm(profile)
+        similarities = self.unit @ (profile / norm) if norm > 0 else np.zeros(len(self))
+        order = np.argsort(-similarities, kind='stable')[:max(int(limit), 0)]
+        return [dict(self.places[i]) for i in order]
+
+
+class PlaceFeatureCache:
+    """
+    PlaceFeatures theo (place_type, city), build lười, hết hạn theo TTL và bị xóa khi bảng
+    của place_type thay đổi
+    """
+
+    def __init__(self, ttl=900, candidates=100):
+        self.ttl = ttl
+        self.candidates = candidates
+        self._lock = threading.Lock()
+        self._entries = {}                                # (place_type, city key) -> (loaded_at, PlaceFeatures)
+        self._versions = dict.fromkeys(PLACE_TYPES, 0)    # tăng mỗi lần invalidate place_type
+
+    def _load(self, city_id, place_type):
+        table = PLACE_TYPES[place_type][0]
+        with db.session() as s:
+            rows = s.execute(f"SELECT * FROM {table} WHERE city_id = %s ORDER BY rating DESC LIMIT %s",
+                             (city_id, self.candidates))
+        return PlaceFeatures(place_type, list(rows or []))
+
+    def get(self, city_id, place_type):
+        """
+        PlaceFeatures của thành phố, None nếu place_type không hợp lệ hoặc query lỗi
+        """
+        if place_type not in PLACE_TYPES or city_id is None:
+            return None
+        key = (place_type, _id_key(city_id))
+        entry = self._entries.get(key)
+        if entry is not None and time.monotonic() - entry[0] < self.ttl:
+            return entry[1]
+
+        version = self._versions[place_type]
+        try:
+            features = self._load(city_id, place_type)
+        except Exception as e:
+            log.warning('place_features_load_failed', place_type=place_type, city_id=city_id, error=str(e))
+            return entry[1] if entry is not None else None
+
+        with self._lock:
+            if version == self._versions[place_type]:
+                # Bảng bị ghi trong lúc build thì không cache, lần sau build lại
+                self._entries[key] = (time.monotonic(), features)
+        log.debug('place_features_built', place_type=place_type, city_id=city_id, places=len(features))
+        return features
+
+    def invalidate(self, place_type=None):
+        with self._lock:
+            for current in ([place_type] if place_type else list(PLACE_TYPES)):
+                self._versions[current] += 1
+            stale = [key for key in self._entries if place_type is None or key[0] == place_type]
+            for key in stale:
+                del self._entries[key]
+        return len(stale)
+
+    def _on_change(self, table, row_id):
+        # Không biết city của dòng bị sửa nên xóa mọi thành phố của place_type đó
+        self.invalidate(TABLE_PLACE_TYPES[table])
+
+
+place_feature_cache = PlaceFeatureCache(**PLACE_FEATURES_CONFIG)
+subscribe(place_feature_cache._on_change, tables=tuple(TABLE_PLACE_TYPES))
@@ -0,0 +1,211 @@
+# Smart Travel Vietnam - Compact Gemini itinerary prompt
+# Prompt cũ nhúng activities/restaurants/hotels bằng json.dumps(indent=2) kèm description đầy đủ và
+# tọa độ, lặp lại preference list ở nhiều mục. Bản này gửi candidate dạng bảng (một dòng / place,
+# tham chiếu bằng id), bỏ tọa độ (chỉ dùng khi hậu xử lý khoảng cách), cắt ngắn description, mỗi
+# preference / rule chỉ xuất hiện một lần. Format JSON output giữ nguyên như prompt cũ
+#
+#   from prompt_builder import build_itinerary_prompt, estimate_tokens
+#   prompt = build_itinerary_prompt(destination_name, city_id, duration, guests, budget, travel_data, user_prefs)
+#   estimate_tokens(prompt)
+#
+#   python prompt_builder.py    # số ký tự / token ước lượng của prompt trên dữ liệu giả lập
+
+import os
+import re
+import json
+
+PROMPT_CONFIG = {
+    'description_chars': int(os.environ.get('PROMPT_DESCRIPTION_CHARS', 80)),  # 0 = bỏ description
+}
+
+# (key trong travel_data, cột id, cột giá) theo thứ tự xuất hiện trong prompt
+CANDIDATE_TABLES = (
+    ('activities', 'activity_id', 'price'),
+    ('restaurants', 'restaurant_id', 'price_avg'),
+    ('hotels', 'hotel_id', 'price_per_night'),
+)
+
+PREFERENCE_GROUPS = (
+    ('activities', 'activities'),
+    ('restaurants', 'restaurants'),
+    ('hotels', 'hotels'),
+    ('transport', 'transport_modes'),
+)
+
+# Format output: giống hệt mục REQUIRED OUTPUT FORMAT của prompt cũ (json.loads và hậu xử lý dựa vào nó)
+OUTPUT_FORMAT = """{{
+"destination": "{destination_name}",
+"guests": {guests},
+"duration_days": {duration},
+"within_budget": true,
+"total_cost": <number>,
+"cost_breakdown": {{
+    "hotels": <number>,
+    "activities": <number>,
+    "meals": <number>,
+    "transport_estimate": <number>
+}},
+"days": [
+    {{
+    "day": 1,
+    "activities": [
+        {{
+        "start_time": "09:00",
+        "end_time": "10:30",
+        "type": "activity" | "meal" | "hotel" | "transfer",
+        "place_id": "<id or null>",
+        "place_name": "<string>",
+        "description": "<string>",
+        "transport_mode": "walk|bike|scooter|taxi|bus|metro",
+        "distance_km": null,
+        "travel_time_min": null,
+        "cost": <number>
+        }}
+    ]
+    }}
+]
+}}"""
+
+_WHITESPACE = re.compile(r'\s+')
+_TOKEN = re.compile(r'\w+|[^\w\s]')
+
+
+def estimate_tokens(text):
+    """
+    Số token ước lượng: mỗi từ và mỗi ký tự dấu câu / ngoặc tính một token (sát với tokenizer
+    của model cho text nhiều JSON hơn cách chia số ký tự cho 4)
+    """
+    return len(_TOKEN.findall(text))
+
+
+def _cell(value, limit=None):
+    if value is None:
+        return ''
+    if isinstance(value, float):
+        return f'{round(value, 2):g}'
+    text = _WHITESPACE.sub(' ', str(value)).replace('|', '/').strip()
+    if limit is not None and len(text) > limit:
+        text = text[:limit].rsplit(' ', 1)[0].rstrip(',.;:') + '…'
+    return text
+
+
+def _table(rows, id_field, price_field, description_chars):
+    columns = ['id', 'name', price_field, 'rating']
+    fields = [id_field, 'name', price_field, 'rating']
+    if description_chars:
+        columns.append('description')
+    lines = ['|'.join(columns)]
+    for row in rows:
+        cells = [_cell(row.get(field)) for field in fields]
+        if description_chars:
+            cells.append(_cell(row.get('description'), description_chars))
+        lines.append('|'.join(cells))
+    return '\n'.join(lines)
+
+
+def _preference_line(user_prefs, prefix):
+    return ' '.join(
+        f'{label}={json.dumps(list(user_prefs.get(f"{prefix}_{field}") or []), ensure_ascii=False)}'
+        for label, field in PREFERENCE_GROUPS
+    )
+
+
+def build_itinerary_prompt(destination_name, destination_city_id, duration, guests, budget, travel_data,
+                           user_prefs=None, description_chars=None):
+    """
+    Prompt tạo lịch trình từ candidate của thành phố (travel_data: activities/restaurants/hotels
+    như được load trong get_gemini_travel_recommendations) và preferences của user
+    """
+    user_prefs = user_prefs or {}
+    if description_chars is None:
+        description_chars = PROMPT_CONFIG['description_chars']
+    rooms = max(1, (guests + 1) // 2)
+
+    tables = '\n\n'.join(
+        f"{key} ({len(travel_data.get(key) or [])}):\n"
+        f"{_table(travel_data.get(key) or [], id_field, price_field, description_chars)}"
+        for key, id_field, price_field in CANDIDATE_TABLES
+    )
+    output_format = OUTPUT_FORMAT.format(destination_name=destination_name, guests=guests, duration=duration)
+
+    return f"""You are an AI travel planner. Output ONLY valid JSON (no comments, no prose).
+
+TRIP: destination={destination_name} (city_id={destination_city_id}); days={duration}; guests={guests}; rooms={rooms}
+BUDGET (USD, all guests): total={budget}; per_day={budget / duration:.2f}; per_person={budget / guests:.2f}; per_person_per_day={budget / (duration * guests):.2f}
+
+CANDIDATES (one per line, columns separated by |; use the id column as place_id):
+{tables}
+
+PREFERENCES (ids or transport mode names):
+liked: {_preference_line(user_prefs, 'liked')}
+disliked: {_preference_line(user_prefs, 'disliked')}
+
+RULES:
+1. Budget: stay within the total and the per_day budget. Hotel cost = price_per_night x rooms x nights; activity/meal cost = price x guests; transfer cost = 0 (computed later).
+2. Preferences: never use a disliked item or transport mode; prioritize liked items when the budget allows; otherwise pick by highest rating, then lowest cost, then location.
+3. Days 1..{duration}: 6-10 items per day including meals, transfers and at least one 15-30 min rest; breakfast 07:00-08:30, lunch 12:00-13:00, dinner 18:30-19:30. Balance busy and relaxed periods, consider local culture and opening hours.
+4. Use only the candidates above. Min rating 3.5 (3.0 if options are limited). No duplicate place within a day; vary activities and restaurants across days.
+5. Items sorted by start_time, HH:MM 24h, no overlaps. Insert exactly one "transfer" item between consecutive non-transfer items: 10-25 min, place_id null, place_name "Di chuyển bằng <mode>", cost 0.
+6. transport_mode of a transfer is never null: only liked transport modes if any, else any mode that is not disliked, default "taxi".
+7. distance_km and travel_time_min are always null (computed in post-processing).
+8. If the budget cannot be met, still output the plan with "within_budget": false and a "reason".
+
+OUTPUT FORMAT:
+{output_format}"""
+
+
+# ---------- schema output ----------
+
+_SCHEMA_KEY = re.compile(r'"(\w+)"\s*:')
+
+
+def output_schema_keys(prompt):
+    """
+    Các key JSON (theo thứ tự) trong mục format output của prompt, dùng để kiểm tra prompt
+    vẫn yêu cầu đúng schema mà json.loads và hậu xử lý dựa vào (xem tests/test_prompt_builder.py)
+    """
+    start = prompt.find('"destination":')
+    if start < 0:
+        return []
+    end = prompt.find('Validation:', start)
+    return _SCHEMA_KEY.findall(prompt[start:end if end >= 0 else len(prompt)])
+
+
+def _synthetic_travel_data(activities=20, restaurants=15, hotels=10):
+    description = ('Điểm tham quan nổi tiếng với kiến trúc cổ, ẩm thực đường phố phong phú và nhiều hoạt động '
+                   'văn hóa truyền thống, phù hợp cho gia đình và nhóm bạn, mở cửa từ sáng tới tối')
+    def rows(count, id_field, prefix, price_field):
+        return [{id_field: f'{prefix}{i:04d}', 'name': f'{prefix} place {i}', price_field: 10.0 + i * 2.5,
+                 'rating': 3.5 + (i % 15) / 10, 'description': description,
+                 'latitude': 16.0 + i / 1000, 'longitude': 108.0 + i / 1000} for i in range(count)]
+    return {
+        'activities': rows(activities, 'activity_id', 'A', 'price'),
+        'restaurants': rows(restaurants, 'restaurant_id', 'R', 'price_avg'),
+        'hotels': rows(hotels, 'hotel_id', 'H', 'price_per_night'),
+    }
+
+
+def benchmark(durations=(3, 7), guests=2, budget=1500.0):
+    """
+    Kích thước prompt trên dữ liệu giả lập (20 activities, 15 restaurants, 10 hotels như query của
+    get_gemini_travel_recommendations)
+    """
+    travel_data = _synthetic_travel_data()
+    user_prefs = {'liked_activities': ['A0001', 'A0004'], 'liked_restaurants': ['R0002'],
+                  'liked_transport_modes': ['taxi', 'walk'], 'disliked_hotels': ['H0003'],
+                  'disliked_transport_modes': ['bus']}
+    report = []
+    for duration in durations:
+        prompt = build_itinerary_prompt('Đà Nẵng', 5, duration, guests, budget, travel_data, user_prefs)
+        report.append({
+            'days': duration,
+            'chars': len(prompt),
+            'tokens': estimate_tokens(prompt),
+            'schema_keys': len(output_schema_keys(prompt)),
+        })
+    return report
+
+
+if __name__ == '__main__':
+    for line in benchmark():
+        print(line)
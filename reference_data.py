@@ -0,0 +1,315 @@
+# Smart Travel Vietnam - In-process reference data
+# Bảng cities/transports ít thay đổi: load một lần vào bộ nhớ, refresh theo TTL hoặc khi admin ghi dữ liệu
+#
+#   from reference_data import city_directory
+#   city_directory.name(5)                      # 'Hà Nội'
+#   city_directory.resolve_many([1, 5, '7'])    # {1: {...}, 5: {...}, '7': {...}}
+#   city_directory.find_id('ha noi')            # 5 (không phân biệt hoa thường / dấu)
+#   transport_catalog.resolve_preferences(['T0001', 'walking'])  # ['Taxi', 'walk']
+
+import os
+import time
+import threading
+import unicodedata
+
+import db
+from app_logging import get_logger
+
+REFERENCE_DATA_CONFIG = {
+    'city_ttl': int(os.environ.get('CITY_DIRECTORY_TTL', 600)),  # giây
+    'transport_ttl': int(os.environ.get('TRANSPORT_CATALOG_TTL', 600)),  # giây
+}
+
+# Tên phương tiện frontend gửi trực tiếp thay cho transport_id
+TRANSPORT_MODE_NAMES = ('walk', 'bike', 'scooter', 'taxi', 'bus', 'metro')
+
+# Alias (đã lower) -> tên phương tiện chuẩn
+TRANSPORT_MODE_ALIASES = {
+    'walk': 'walk',
+    'walking': 'walk',
+    'on foot': 'walk',
+    'foot': 'walk',
+}
+
+log = get_logger('reference_data')
+
+
+def fold_text(value):
+    """
+    Chuẩn hóa chuỗi để so khớp không phân biệt hoa thường và dấu tiếng Việt
+    (giống collation utf8mb4_unicode_ci của database)
+    """
+    if value is None:
+        return ''
+    text = str(value).replace('đ', 'd').replace('Đ', 'D')
+    text = unicodedata.normalize('NFD', text)
+    text = ''.join(ch for ch in text if not unicodedata.combining(ch))
+    return ' '.join(text.lower().split())
+
+
+def _id_key(value):
+    return str(value).strip()
+
+
+class _ReferenceTable:
+    """
+    Bảng tham chiếu load nguyên khối vào bộ nhớ, reload khi hết TTL hoặc sau invalidate().
+    background_refresh=True: khi đã có dữ liệu thì reload chạy trên thread riêng, request vẫn
+    đọc dữ liệu cũ cho tới khi bản mới sẵn sàng (dùng cho bảng load lâu)
+    """
+
+    table_name = 'reference_table'
+    background_refresh = False
+
+    def __init__(self, ttl=600):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._data = None
+        self._loaded_at = None
+        self._refreshing = False
+        self._invalidations = 0
+
+    def _load(self):
+        raise NotImplementedError
+
+    def _fresh(self):
+        return self._loaded_at is not None and time.monotonic() - self._loaded_at < self.ttl
+
+    def _ensure_loaded(self):
+        if self._fresh():
+            return self._data
+        if self.background_refresh and self._data is not None:
+            self._start_refresh()
+            return self._data
+        with self._lock:
+            if self._fresh():
+                return self._data
+            try:
+                self._data = self._load()
+                self._loaded_at = time.monotonic()
+            except Exception as e:
+                if self._data is None:
+                    raise
+                # Giữ dữ liệu cũ nếu refresh lỗi, thử lại sau một TTL
+                self._loaded_at = time.monotonic()
+                log.warning(f'{self.table_name}_refresh_failed', error=str(e))
+            return self._data
+
+    def _start_refresh(self):
+        with self._lock:
+            if self._refreshing or self._fresh():
+                return
+            self._refreshing = True
+        threading.Thread(target=self._refresh, name=f'{self.table_name}-refresh', daemon=True).start()
+
+    def _refresh(self):
+        invalidations = self._invalidations
+        try:
+            data = self._load()
+        except Exception as e:
+            data = None
+            log.warning(f'{self.table_name}_refresh_failed', error=str(e))
+        with self._lock:
+            if data is not None:
+                self._data = data
+            # Lỗi thì giữ dữ liệu cũ, thử lại sau một TTL. invalidate() trong lúc đang load thì
+            # bản vừa load có thể đã cũ: để lần truy cập sau reload tiếp
+            if data is None or invalidations == self._invalidations:
+                self._loaded_at = time.monotonic()
+            self._refreshing = False
+        if data is not None:
+            self._refreshed()
+
+    def _refreshed(self):
+        """
+        Gọi sau khi bản reload nền đã thay dữ liệu cũ
+        """
+
+    def invalidate(self):
+        """
+        Buộc load lại ở lần truy cập kế tiếp (gọi sau khi admin sửa bảng tương ứng)
+        """
+        with self._lock:
+            self._loaded_at = None
+            self._invalidations += 1
+
+
+class CityDirectory(_ReferenceTable):
+    """
+    Từ điển thành phố trong bộ nhớ: city_id -> name/country và tên đã fold -> city_id
+    """
+
+    table_name = 'city_directory'
+
+    def _load(self):
+        """
+        Trả về snapshot (by_id, by_name, ordered):
+          by_id:   '5' -> {'city_id': 5, 'name': ..., 'country': ...}
+          by_name: 'ha noi' -> ['5', ...] theo thứ tự city_id
+          ordered: record theo thứ tự city_id (giống thứ tự quét của MySQL)
+        """
+        with db.session() as s:
+            rows = s.execute("SELECT city_id, name, country FROM cities ORDER BY city_id")
+
+        by_id, by_name, ordered = {}, {}, []
+        for row in rows or []:
+            record = {
+                'city_id': row['city_id'],
+                'name': row['name'],
+                'country': row['country'],
+                '_name': fold_text(row['name']),
+                '_country': fold_text(row['country']),
+            }
+            key = _id_key(row['city_id'])
+            by_id[key] = record
+            by_name.setdefault(record['_name'], []).append(key)
+            ordered.append(record)
+
+        log.info('city_directory_loaded', cities=len(ordered))
+        return by_id, by_name, ordered
+
+    @staticmethod
+    def _public(record):
+        return {'city_id': record['city_id'], 'name': record['name'], 'country': record['country']}
+
+    def get(self, city_id):
+        """
+        Trả về {'city_id', 'name', 'country'} hoặc None
+        """
+        if city_id is None:
+            return None
+        record = self._ensure_loaded()[0].get(_id_key(city_id))
+        return self._public(record) if record else None
+
+    def name(self, city_id, default=None):
+        record = self.get(city_id)
+        return record['name'] if record else default
+
+    def resolve_many(self, city_ids):
+        """
+        Resolve nhiều city_id một lần. Key của kết quả giữ nguyên giá trị truyền vào,
+        id không tồn tại bị bỏ qua
+        """
+        by_id = self._ensure_loaded()[0]
+        result = {}
+        for city_id in city_ids:
+            if city_id is None:
+                continue
+            record = by_id.get(_id_key(city_id))
+            if record:
+                result[city_id] = self._public(record)
+        return result
+
+    def find_id(self, name, country=None):
+        """
+        Tìm city_id theo tên (và country nếu có). Ưu tiên khớp nguyên tên,
+        sau đó khớp chuỗi con như name LIKE '%...%'
+        """
+        by_id, by_name, ordered = self._ensure_loaded()
+        name_key = fold_text(name)
+        country_key = fold_text(country) if country else ''
+        if not name_key:
+            return None
+
+        for key in by_name.get(name_key, []):
+            record = by_id[key]
+            if country_key in record['_country']:
+                return record['city_id']
+
+        for record in ordered:
+            if name_key in record['_name'] and country_key in record['_country']:
+                return record['city_id']
+        return None
+
+    def all(self, complete_only=True):
+        """
+        Danh sách thành phố sắp xếp theo tên (thứ tự như ORDER BY name với collation
+        không phân biệt dấu). complete_only bỏ các dòng thiếu name/country như /api/cities
+        """
+        records = [r for r in self._ensure_loaded()[2] if not complete_only or (r['name'] and r['country'])]
+        records.sort(key=lambda r: r['_name'])
+        return [self._public(r) for r in records]
+
+
+class TransportCatalog(_ReferenceTable):
+    """
+    Bảng transport_id -> type trong bộ nhớ, thay cho các câu
+    SELECT type FROM transports WHERE transport_id = %s lặp lại trong một lần tạo tour
+    """
+
+    table_name = 'transport_catalog'
+
+    def _load(self):
+        with db.session() as s:
+            rows = s.execute("SELECT transport_id, type FROM transports")
+
+        types = {}
+        for row in rows or []:
+            if row['type']:
+                types[_id_key(row['transport_id'])] = row['type']
+
+        log.info('transport_catalog_loaded', transports=len(types))
+        return types
+
+    @staticmethod
+    def is_transport_id(value):
+        return isinstance(value, str) and value.startswith('T0')
+
+    def type_of(self, transport_id):
+        """
+        Trả về type trong DB (giữ nguyên hoa thường, vd. 'Taxi') hoặc None
+        """
+        if transport_id is None:
+            return None
+        return self._ensure_loaded().get(_id_key(transport_id))
+
+    def resolve_many(self, transport_ids):
+        """
+        Resolve nhiều transport_id một lần, id không tồn tại bị bỏ qua
+        """
+        types = self._ensure_loaded()
+        result = {}
+        for transport_id in transport_ids:
+            if transport_id is None:
+                continue
+            transport_type = types.get(_id_key(transport_id))
+            if transport_type:
+                result[transport_id] = transport_type
+        return result
+
+    def resolve_preferences(self, values, unknown='taxi'):
+        """
+        Chuyển danh sách transport preference của frontend (tên phương tiện, alias
+        hoặc transport_id) thành tên phương tiện. Giá trị không resolve được thay bằng
+        unknown, hoặc bị bỏ qua nếu unknown=None
+        """
+        types = self._ensure_loaded()
+        modes = []
+        for value in values:
+            if value in TRANSPORT_MODE_NAMES:
+                modes.append(value)
+                continue
+            alias = TRANSPORT_MODE_ALIASES.get(str(value).lower())
+            if alias:
+                modes.append(alias)
+                continue
+            transport_type = types.get(_id_key(value))
+            if transport_type:
+                modes.append(transport_type)
+            elif unknown is not None:
+                modes.append(unknown)
+        return modes
+
+    def mode_name(self, value, unknown=None):
+        """
+        Tên phương tiện (lower) cho một giá trị transport_mode: transport_id 'T0..'
+        được tra bảng, tên khác chỉ lower. Trả về unknown nếu id không tồn tại
+        """
+        if self.is_transport_id(value):
+            transport_type = self.type_of(value)
+            return transport_type.lower() if transport_type else unknown
+        return value.lower()
+
+
+city_directory = CityDirectory(ttl=REFERENCE_DATA_CONFIG['city_ttl'])
+transport_catalog = TransportCatalog(ttl=REFERENCE_DATA_CONFIG['transport_ttl'])
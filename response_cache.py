@@ -0,0 +1,260 @@
+# Smart Travel Vietnam - Shared response cache for near-static endpoints
+# LRU + TTL trong bộ nhớ, key theo endpoint + query args đã chuẩn hóa. Mỗi entry gắn với
+# các bảng nó đọc, và bị xóa khi catalog_events báo bảng đó thay đổi
+#
+#   from response_cache import cached_response
+#
+#   @app.route("/api/restaurants/cuisines")
+#   @cached_response(tables=('restaurants',))
+#   def get_restaurant_cuisines(): ...
+#
+#   @app.route("/api/hotels/<string:hotel_id>")
+#   @http_cache(max_age=60)                      # ETag + 304 + Cache-Control
+#   @cached_response(tables=('hotels', 'cities'), key_args=())
+#   def get_hotel_details(hotel_id): ...
+
+import os
+import time
+import threading
+from functools import wraps
+from collections import OrderedDict
+
+from flask import g, request, make_response, has_app_context
+
+from app_logging import get_logger
+from catalog_events import subscribe
+
+RESPONSE_CACHE_CONFIG = {
+    'max_entries': int(os.environ.get('RESPONSE_CACHE_MAX_ENTRIES', 512)),
+    'ttl': int(os.environ.get('RESPONSE_CACHE_TTL', 300)),  # giây, lưới an toàn khi DB bị sửa ngoài admin
+}
+
+
+def _parse_max_age_overrides(value):
+    # 'get_cities=3600,get_hotel_details=120' -> {'get_cities': 3600, 'get_hotel_details': 120}
+    overrides = {}
+    for item in (value or '').split(','):
+        endpoint, _, seconds = item.partition('=')
+        if endpoint.strip() and seconds.strip().isdigit():
+            overrides[endpoint.strip()] = int(seconds)
+    return overrides
+
+
+# Cache-Control max-age (giây) theo endpoint, override bằng HTTP_CACHE_MAX_AGE
+HTTP_CACHE_CONFIG = {
+    'default_max_age': int(os.environ.get('HTTP_CACHE_DEFAULT_MAX_AGE', 60)),
+    'max_age': _parse_max_age_overrides(os.environ.get('HTTP_CACHE_MAX_AGE')),
+}
+
+_G_SKIP = '_response_cache_skip'
+
+log = get_logger('response_cache')
+
+
+class ResponseCache:
+    """
+    LRU các response (body, status, headers) đã render, có TTL và invalidate theo bảng
+    """
+
+    def __init__(self, max_entries=512, ttl=300):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (expires_at, tables, body, status, headers)
+        self._routes = {}              # endpoint -> {'hits', 'misses', 'tables'}
+        self._versions = {}            # table -> số lần invalidate, None -> số lần xóa hết
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def register(self, endpoint, tables):
+        with self._lock:
+            self._routes.setdefault(endpoint, {'hits': 0, 'misses': 0, 'tables': sorted(tables)})
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            route = self._routes.get(key[0])
+            if entry is not None and entry[0] <= time.monotonic():
+                del self._entries[key]
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                if route:
+                    route['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            if route:
+                route['hits'] += 1
+            return entry
+
+    def versions(self, tables):
+        """
+        Snapshot version của các bảng, lấy trước khi render để put() biết bảng có bị ghi giữa chừng
+        """
+        with self._lock:
+            return tuple(self._versions.get(table, 0) for table in (None,) + tuple(tables))
+
+    def put(self, key, tables, body, status, headers, ttl=None, versions=None):
+        """
+        Lưu response. versions là snapshot từ versions(tables) trước khi render: bảng đã bị
+        invalidate sau đó thì body có thể là dữ liệu trước khi ghi, không lưu
+        """
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            if versions is not None and versions != tuple(
+                    self._versions.get(table, 0) for table in (None,) + tuple(tables)):
+                return False
+            self._entries[key] = (expires_at, frozenset(tables), body, status, headers)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return True
+
+    def invalidate(self, table=None):
+        """
+        Xóa các entry phụ thuộc bảng table (None = xóa hết)
+        """
+        with self._lock:
+            self._versions[table] = self._versions.get(table, 0) + 1
+            if table is None:
+                removed = len(self._entries)
+                self._entries.clear()
+            else:
+                stale = [key for key, entry in self._entries.items() if table in entry[1]]
+                for key in stale:
+                    del self._entries[key]
+                removed = len(stale)
+            self.invalidations += removed
+        if removed:
+            log.info('response_cache_invalidated', table=table, entries=removed)
+        return removed
+
+    def stats(self):
+        """
+        Thống kê cache cho monitoring
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            routes = {}
+            for endpoint, route in self._routes.items():
+                route_lookups = route['hits'] + route['misses']
+                routes[endpoint] = dict(
+                    route,
+                    hit_ratio=round(route['hits'] / route_lookups, 4) if route_lookups else 0.0
+                )
+            return {
+                'max_entries': self.max_entries,
+                'ttl': self.ttl,
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'invalidations': self.invalidations,
+                'routes': routes
+            }
+
+
+response_cache = ResponseCache(**RESPONSE_CACHE_CONFIG)
+
+
+def _on_catalog_change(table, row_id):
+    # Danh sách DISTINCT phụ thuộc cả bảng, và entry chi tiết không ghi lại row_id,
+    # nên một dòng thay đổi xóa mọi entry của bảng đó (bảng catalog ít khi được ghi)
+    response_cache.invalidate(table)
+
+
+subscribe(_on_catalog_change)
+
+
+def skip_response_cache():
+    """
+    Đánh dấu response của request hiện tại không được cache (vd. trả về rỗng vì lỗi DB)
+    """
+    if has_app_context():
+        setattr(g, _G_SKIP, True)
+
+
+def _cache_key(endpoint, key_args):
+    args = request.args
+    names = sorted(args) if key_args is None else key_args
+    return (endpoint,) + tuple(
+        (name, tuple(value.strip() for value in args.getlist(name))) for name in names if name in args
+    )
+
+
+def cached_response(tables, key_args=None, ttl=None):
+    """
+    Decorator cache response của một GET handler.
+      tables:   các bảng handler đọc, notify_change trên bảng nào thì entry bị xóa
+      key_args: các query arg tạo nên key (None = mọi arg); arg khác như cache-buster bị bỏ qua
+    Chỉ cache response 200 của request không bị skip_response_cache()
+    """
+    tables = tuple(tables)
+
+    def decorator(view):
+        endpoint = view.__name__
+        response_cache.register(endpoint, tables)
+
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            key = _cache_key(endpoint, key_args) + args + tuple(sorted(kwargs.items()))
+            entry = response_cache.get(key)
+            if entry is not None:
+                _, _, body, status, headers = entry
+                response = make_response(body, status, headers)
+                response.headers['X-Cache'] = 'HIT'
+                return response
+
+            versions = response_cache.versions(tables)
+            response = make_response(view(*args, **kwargs))
+            if response.status_code == 200 and not g.pop(_G_SKIP, False) and not response.is_streamed:
+                # Lưu kèm ETag để http_cache không phải hash lại body ở các lần HIT.
+                # Bảng bị ghi trong lúc render thì put() bỏ qua, lần sau render lại
+                response.add_etag()
+                response_cache.put(key, tables, response.get_data(), response.status_code,
+                                   list(response.headers.items()), ttl=ttl, versions=versions)
+            response.headers['X-Cache'] = 'MISS'
+            return response
+
+        return wrapper
+
+    return decorator
+
+
+def http_cache(max_age=None):
+    """
+    Decorator thêm ETag (hash nội dung), Cache-Control: public, max-age và trả 304
+    khi If-None-Match khớp. max_age lấy theo HTTP_CACHE_CONFIG['max_age'][endpoint],
+    sau đó tới tham số của decorator, cuối cùng là default_max_age.
+    Đặt bên ngoài cached_response để request 304 không chạm tới DB lẫn jsonify
+    """
+
+    def decorator(view):
+        endpoint = view.__name__
+
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            response = make_response(view(*args, **kwargs))
+            if response.status_code != 200 or response.is_streamed:
+                return response
+
+            if response.get_etag()[0] is None:
+                response.add_etag()
+            seconds = HTTP_CACHE_CONFIG['max_age'].get(endpoint)
+            if seconds is None:
+                seconds = HTTP_CACHE_CONFIG['default_max_age'] if max_age is None else max_age
+            response.cache_control.public = True
+            response.cache_control.max_age = seconds
+            return response.make_conditional(request)
+
+        return wrapper
+
+    return decorator
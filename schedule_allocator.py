@@ -0,0 +1,98 @@
+# Smart Travel Vietnam - Linear-time day allocation for generate_tour_schedule
+# Chia activities/restaurants đã chọn cho từng ngày bằng một cursor, thay vì mỗi ngày dựng lại
+# danh sách mọi place đã dùng rồi kiểm tra `a not in [...]` trên list (O(ngày² x place))
+#
+#   from schedule_allocator import allocate_days, slot_layout
+#   allocate_days(sel_activities, duration=7, per_day=4)   # [[...ngày 1], [...ngày 2], ...]
+#   slot_layout(time_slots)                               # số slot theo loại, start_time hotel cuối
+#
+#   python schedule_allocator.py    # benchmark theo số ngày và số place, so với vòng lặp cũ
+
+import time
+import random
+
+
+def allocate_days(items, duration, per_day):
+    """
+    Item của từng ngày, cùng kết quả với vòng lặp cũ của generate_tour_schedule:
+      - mỗi ngày lấy per_day item chưa dùng kế tiếp theo thứ tự của items
+      - ngày còn thiếu thì bù bằng các item đầu danh sách; từ đó mọi item đã được dùng nên
+        các ngày sau đều lấy per_day item đầu tiên
+    Item chưa dùng luôn là phần đuôi items[cursor:], nên mỗi ngày chỉ tốn O(per_day)
+    """
+    days, cursor, total = [], 0, len(items)
+    for _ in range(duration):
+        remaining = total - cursor
+        if remaining >= per_day:
+            days.append(items[cursor:cursor + per_day])
+            cursor += per_day
+        else:
+            days.append(items[cursor:] + items[:per_day - remaining])
+            cursor = total
+    return days
+
+
+def slot_layout(time_slots):
+    """
+    Thông tin tính một lần cho mọi ngày: số slot theo loại và start_time của slot hotel cuối
+    cùng trong ngày (slot được tính tiền phòng)
+    """
+    counts = {}
+    for slot in time_slots:
+        counts[slot['type']] = counts.get(slot['type'], 0) + 1
+    hotel_starts = [slot['start_time'] for slot in time_slots if slot['type'] == 'hotel']
+    return {
+        'counts': counts,
+        'last_hotel_start': max(hotel_starts) if hotel_starts else None,
+    }
+
+
+# ---------- benchmark ----------
+
+def _reference_allocate(items, duration, per_day):
+    # Bản sao vòng lặp cũ để so kết quả và thời gian
+    all_days = []
+    for _ in range(duration):
+        remaining = [a for a in items if a not in [item for sublist in all_days for item in sublist]]
+        if len(remaining) < per_day:
+            remaining += items
+        all_days.append(remaining[:per_day])
+    return all_days
+
+
+def _synthetic_items(count, rng):
+    return [{'activity_id': f'A{i:05d}', 'name': f'Activity {i}', 'price': rng.randint(0, 100)}
+            for i in range(count)]
+
+
+def benchmark(durations=(7, 14, 28, 56), candidates=(50, 500, 5000), per_day=4, repeat=3, loop_limit=500, seed=3):
+    """
+    Thời gian allocate_days theo số ngày x số place (vòng lặp cũ chỉ chạy khi số place <= loop_limit)
+    và kiểm tra kết quả trùng khớp. allocate_days tăng tuyến tính theo số ngày và gần như không đổi
+    theo số place, vòng lặp cũ tăng theo bình phương số ngày nhân số place
+    """
+    rng = random.Random(seed)
+    report = []
+    for count in candidates:
+        items = _synthetic_items(count, rng)
+        for duration in durations:
+            started = time.perf_counter()
+            for _ in range(repeat):
+                result = allocate_days(items, duration, per_day)
+            linear_ms = (time.perf_counter() - started) * 1000 / repeat
+
+            loop_ms, identical = None, None
+            if count <= loop_limit:
+                started = time.perf_counter()
+                expected = _reference_allocate(items, duration, per_day)
+                loop_ms = (time.perf_counter() - started) * 1000
+                identical = expected == result
+
+            report.append({'candidates': count, 'days': duration, 'allocate_ms': round(linear_ms, 4),
+                           'loop_ms': round(loop_ms, 2) if loop_ms is not None else None, 'identical': identical})
+    return report
+
+
+if __name__ == '__main__':
+    for line in benchmark():
+        print(line)
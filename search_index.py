@@ -0,0 +1,703 @@
+# Smart Travel Vietnam - In-process search indexes
+# Index trong bộ nhớ cho ghost-text autocomplete (prefix: countries, cities, cuisines,
+# tên hotel/restaurant) và autocomplete hotels/restaurants (n-gram, tìm chuỗi con + sửa lỗi gõ),
+# build một lần từ DB và cập nhật theo từng dòng khi admin ghi dữ liệu
+#
+#   from search_index import catalog_index
+#   catalog_index.suggest_country('vi')            # 'Vietnam'
+#   catalog_index.suggest_city('ha', 'Vietnam')    # 'Ha Long'
+#   catalog_index.suggest_name('hotels', 'mu')     # tên hotel rating cao nhất bắt đầu bằng 'mu'
+#   catalog_index.search('hotels', 'muong thnah', limit=5)  # rows như hotels_autocomplete, chịu được lỗi gõ
+
+import os
+import time
+import heapq
+import bisect
+import threading
+from collections import Counter
+
+import db
+from app_logging import get_logger
+from catalog_events import subscribe
+from reference_data import fold_text
+
+SEARCH_INDEX_CONFIG = {
+    # Rebuild toàn bộ sau khoảng thời gian này (giây) để bắt các thay đổi ngoài endpoint admin
+    'rebuild_interval': int(os.environ.get('SEARCH_INDEX_REBUILD_INTERVAL', 3600)),
+    # Độ dài prefix (sau khi fold) được tính sẵn kết quả tốt nhất cho index tên
+    'precomputed_prefix_lengths': (2, 3, 4, 5, 6),
+    # Số kết quả prefix dài được nhớ lại giữa các lần cập nhật
+    'memo_size': 4096,
+    # Tìm gần đúng (sửa lỗi gõ) khi không đủ kết quả khớp chuỗi con
+    'fuzzy_min_length': 4,          # query ngắn hơn không tìm gần đúng
+    'fuzzy_max_candidates': 200,    # số ứng viên (nhiều trigram chung nhất) được kiểm tra edit distance
+}
+
+log = get_logger('search_index')
+
+class ValuePrefixIndex:
+    """
+    Tập giá trị distinct (country, city, cuisine...) sắp xếp theo key đã fold.
+    Mỗi giá trị có refcount vì nhiều dòng/bảng cùng đóng góp một giá trị;
+    lookup trả về giá trị nhỏ nhất bắt đầu bằng prefix (như ORDER BY ... ASC LIMIT 1)
+    """
+
+    def __init__(self):
+        self._keys = []     # sorted folded keys
+        self._values = {}   # key -> {original value: refcount}
+
+    def __len__(self):
+        return len(self._keys)
+
+    def add(self, value):
+        key = fold_text(value)
+        if not key:
+            return
+        originals = self._values.get(key)
+        if originals is None:
+            originals = self._values[key] = {}
+            bisect.insort(self._keys, key)
+        originals[value] = originals.get(value, 0) + 1
+
+    def remove(self, value):
+        key = fold_text(value)
+        originals = self._values.get(key)
+        if not originals or value not in originals:
+            return
+        originals[value] -= 1
+        if originals[value] <= 0:
+            del originals[value]
+        if not originals:
+            del self._values[key]
+            i = bisect.bisect_left(self._keys, key)
+            if i < len(self._keys) and self._keys[i] == key:
+                del self._keys[i]
+
+    def lookup(self, prefix):
+        """
+        prefix phải được fold sẵn
+        """
+        i = bisect.bisect_left(self._keys, prefix)
+        if i < len(self._keys) and self._keys[i].startswith(prefix):
+            return min(self._values[self._keys[i]])
+        return None
+
+
+class RankedPrefixIndex:
+    """
+    Tên (hotel/restaurant) sắp xếp theo key đã fold, lookup trả về tên có rating cao nhất
+    bắt đầu bằng prefix (như ORDER BY rating DESC, name ASC LIMIT 1).
+    Kết quả cho các prefix ngắn được tính sẵn, prefix dài quét đoạn nhỏ trong mảng và nhớ lại
+    """
+
+    def __init__(self, precomputed_lengths=(2, 3, 4, 5, 6), memo_size=4096):
+        self.precomputed_lengths = tuple(precomputed_lengths)
+        self.memo_size = memo_size
+        self._rows = {}     # row_id -> (rank, key, name)
+        self._sorted = []   # sorted (key, row_id)
+        self._best = {}     # prefix -> row_id
+        self._memo = {}     # prefix -> name (prefix dài)
+
+    def __len__(self):
+        return len(self._rows)
+
+    @staticmethod
+    def _rank(key, name, rating):
+        # MySQL ORDER BY rating DESC đặt NULL cuối cùng
+        if rating is None:
+            return (1, 0.0, key, name)
+        return (0, -float(rating), key, name)
+
+    def build(self, rows):
+        """
+        Build lại toàn bộ từ iterable (row_id, name, rating)
+        """
+        self._rows, self._best, self._memo = {}, {}, {}
+        for row_id, name, rating in rows:
+            key = fold_text(name)
+            if key:
+                self._rows[row_id] = (self._rank(key, name, rating), key, name)
+        self._sorted = sorted((key, row_id) for row_id, (_, key, _) in self._rows.items())
+        for row_id, (rank, key, _) in self._rows.items():
+            self._offer(row_id, rank, key)
+
+    def _offer(self, row_id, rank, key):
+        for length in self.precomputed_lengths:
+            if len(key) < length:
+                break
+            prefix = key[:length]
+            best = self._best.get(prefix)
+            if best is None or rank < self._rows[best][0]:
+                self._best[prefix] = row_id
+
+    def _scan(self, prefix):
+        best = None
+        i = bisect.bisect_left(self._sorted, (prefix,))
+        while i < len(self._sorted) and self._sorted[i][0].startswith(prefix):
+            row_id = self._sorted[i][1]
+            if best is None or self._rows[row_id][0] < self._rows[best][0]:
+                best = row_id
+            i += 1
+        return best
+
+    def upsert(self, row_id, name, rating):
+        self.remove(row_id)
+        key = fold_text(name)
+        if not key:
+            return
+        rank = self._rank(key, name, rating)
+        self._rows[row_id] = (rank, key, name)
+        bisect.insort(self._sorted, (key, row_id))
+        self._offer(row_id, rank, key)
+        self._memo.clear()
+
+    def remove(self, row_id):
+        entry = self._rows.pop(row_id, None)
+        if entry is None:
+            return
+        _, key, _ = entry
+        i = bisect.bisect_left(self._sorted, (key, row_id))
+        if i < len(self._sorted) and self._sorted[i] == (key, row_id):
+            del self._sorted[i]
+        for length in self.precomputed_lengths:
+            if len(key) < length:
+                break
+            prefix = key[:length]
+            if self._best.get(prefix) == row_id:
+                replacement = self._scan(prefix)
+                if replacement is None:
+                    del self._best[prefix]
+                else:
+                    self._best[prefix] = replacement
+        self._memo.clear()
+
+    def lookup(self, prefix):
+        """
+        prefix phải được fold sẵn
+        """
+        if len(prefix) in self.precomputed_lengths:
+            row_id = self._best.get(prefix)
+            return self._rows[row_id][2] if row_id is not None else None
+
+        if prefix in self._memo:
+            return self._memo[prefix]
+        row_id = self._scan(prefix)
+        name = self._rows[row_id][2] if row_id is not None else None
+        if len(self._memo) >= self.memo_size:
+            self._memo.clear()
+        self._memo[prefix] = name
+        return name
+
+
+def _edit_distance_within(a, b, limit):
+    """
+    Khoảng cách Damerau-Levenshtein (OSA) giữa a và b nếu <= limit, ngược lại trả về limit + 1
+    """
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous2 = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        row_min = current[0]
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            value = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if previous2 is not None and i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                value = min(value, previous2[j - 2] + 1)
+            current[j] = value
+            row_min = min(row_min, value)
+        if row_min > limit:
+            return limit + 1
+        previous2, previous = previous, current
+    return previous[-1] if previous[-1] <= limit else limit + 1
+
+
+class NgramIndex:
+    """
+    Inverted index n-gram trên các field đã fold (vd. name/city/country) để tìm chuỗi con
+    như LIKE '%q%' mà không quét toàn bảng: query 2 ký tự dùng bigram, dài hơn thì giao các
+    posting trigram rồi kiểm tra lại. Thứ hạng giống SQL cũ: name bắt đầu bằng q (1) > city (2)
+    > country (3) > chứa q ở bất kỳ field nào (4), rồi rating DESC, name ASC. Khi chưa đủ kết quả,
+    bổ sung kết quả gần đúng (5) theo edit distance để chịu được lỗi gõ
+    """
+
+    def __init__(self, fields, tier_fields=('name', 'city', 'country'),
+                 fuzzy_min_length=4, fuzzy_max_candidates=200):
+        self.fields = tuple(fields)
+        self.tier_fields = tuple(tier_fields)
+        self.fuzzy_min_length = fuzzy_min_length
+        self.fuzzy_max_candidates = fuzzy_max_candidates
+        self._docs = {}       # row_id -> (folded fields dict, rank, row)
+        self._postings = {}   # gram -> set(row_id)
+
+    def __len__(self):
+        return len(self._docs)
+
+    @staticmethod
+    def _grams(text):
+        grams = set()
+        for size in (2, 3):
+            for i in range(len(text) - size + 1):
+                grams.add(text[i:i + size])
+        return grams
+
+    def build(self, rows):
+        """
+        Build lại toàn bộ từ iterable (row_id, row dict)
+        """
+        self._docs, self._postings = {}, {}
+        for row_id, row in rows:
+            self._add(row_id, row)
+
+    def _add(self, row_id, row):
+        folded = {field: fold_text(row.get(field)) for field in self.fields}
+        rank = RankedPrefixIndex._rank(folded.get('name', ''), row.get('name') or '', row.get('rating'))
+        self._docs[row_id] = (folded, rank, row)
+        for text in folded.values():
+            for gram in self._grams(text):
+                self._postings.setdefault(gram, set()).add(row_id)
+
+    def upsert(self, row_id, row):
+        self.remove(row_id)
+        self._add(row_id, row)
+
+    def remove(self, row_id):
+        doc = self._docs.pop(row_id, None)
+        if doc is None:
+            return
+        for text in doc[0].values():
+            for gram in self._grams(text):
+                posting = self._postings.get(gram)
+                if posting is not None:
+                    posting.discard(row_id)
+                    if not posting:
+                        del self._postings[gram]
+
+    def _tier(self, folded, query):
+        for tier, field in enumerate(self.tier_fields, 1):
+            if folded.get(field, '').startswith(query):
+                return tier
+        for text in folded.values():
+            if query in text:
+                return len(self.tier_fields) + 1
+        return None
+
+    def _substring_candidates(self, query):
+        size = 2 if len(query) < 3 else 3
+        grams = {query[i:i + size] for i in range(len(query) - size + 1)}
+        postings = sorted((self._postings.get(gram, ()) for gram in grams), key=len)
+        if not postings or not postings[0]:
+            return set()
+        candidates = set(postings[0])
+        for posting in postings[1:]:
+            candidates &= posting
+            if not candidates:
+                break
+        return candidates
+
+    @staticmethod
+    def _fuzzy_distance(folded, query, limit, memo):
+        """
+        Edit distance nhỏ nhất giữa query và các đoạn bắt đầu ở đầu một từ của bất kỳ field nào,
+        dài hơn/kém tối đa limit ký tự. memo dùng chung trong một lần search vì tên
+        thành phố/quốc gia và các từ như 'hotel', 'resort' lặp lại giữa nhiều row
+        """
+        best = limit + 1
+        for text in folded.values():
+            starts = [0] + [i + 1 for i, ch in enumerate(text) if ch == ' ']
+            for start in starts:
+                for length in range(max(1, len(query) - limit), len(query) + limit + 1):
+                    if start + length > len(text):
+                        break
+                    window = text[start:start + length]
+                    distance = memo.get(window)
+                    if distance is None:
+                        distance = memo[window] = _edit_distance_within(query, window, limit)
+                    if distance < best:
+                        best = distance
+                        if best == 0:
+                            return 0
+        return best
+
+    def search(self, query, limit=5, fuzzy=True):
+        """
+        Trả về tối đa limit row (dict gốc), query chưa cần fold
+        """
+        query = fold_text(query)
+        if not query or limit <= 0:
+            return []
+
+        matches = []
+        for row_id in self._substring_candidates(query):
+            folded, rank, _ = self._docs[row_id]
+            tier = self._tier(folded, query)
+            if tier is not None:
+                matches.append((tier, 0, rank, row_id))
+        results = heapq.nsmallest(limit, matches)
+
+        if fuzzy and len(results) < limit and len(query) >= self.fuzzy_min_length:
+            seen = {row_id for _, _, _, row_id in matches}
+            max_typos = 1 if len(query) <= 6 else 2
+            overlap = Counter()
+            trigrams = {query[i:i + 3] for i in range(len(query) - 2)}
+            for gram in trigrams:
+                overlap.update(self._postings.get(gram, ()))
+            # Đoạn cách query <= k lỗi vẫn chung ít nhất len(trigrams) - 3k trigram (q-gram lemma)
+            min_overlap = max(1, len(trigrams) - 3 * max_typos)
+            fuzzy_matches, memo = [], {}
+            for row_id, shared in overlap.most_common(self.fuzzy_max_candidates):
+                if shared < min_overlap:
+                    break
+                if row_id in seen:
+                    continue
+                folded, rank, _ = self._docs[row_id]
+                distance = self._fuzzy_distance(folded, query, max_typos, memo)
+                if distance <= max_typos:
+                    fuzzy_matches.append((len(self.tier_fields) + 2, distance, rank, row_id))
+            results += heapq.nsmallest(limit - len(results), fuzzy_matches)
+
+        return [self._docs[row_id][2] for _, _, _, row_id in results]
+
+
+class _CatalogState:
+    """
+    Một bộ index hoàn chỉnh của CatalogIndex. Rebuild dựng bộ mới ngoài lock rồi thay bộ cũ
+    bằng một phép gán; cập nhật từng dòng sửa trực tiếp bộ đang dùng (dưới lock của CatalogIndex)
+    """
+
+    def __init__(self, tables, search_fields, config):
+        self.rows = {table: {} for table in tables}
+        self.countries = ValuePrefixIndex()
+        self.cities = ValuePrefixIndex()
+        self.cities_by_country = {}
+        self.cuisines = ValuePrefixIndex()
+        self.names = {
+            table: RankedPrefixIndex(config['precomputed_prefix_lengths'], config['memo_size'])
+            for table in tables
+        }
+        self.ngrams = {
+            table: NgramIndex(search_fields[table],
+                              fuzzy_min_length=config['fuzzy_min_length'],
+                              fuzzy_max_candidates=config['fuzzy_max_candidates'])
+            for table in tables
+        }
+
+    def _add_values(self, table, row):
+        country, city = row.get('country'), row.get('city')
+        if country:
+            self.countries.add(country)
+        if city:
+            self.cities.add(city)
+            if country:
+                scoped = self.cities_by_country.setdefault(fold_text(country), ValuePrefixIndex())
+                scoped.add(city)
+        if table == 'restaurants' and row.get('cuisine_type'):
+            self.cuisines.add(row['cuisine_type'])
+
+    def _remove_values(self, table, row):
+        country, city = row.get('country'), row.get('city')
+        if country:
+            self.countries.remove(country)
+        if city:
+            self.cities.remove(city)
+            if country:
+                scoped = self.cities_by_country.get(fold_text(country))
+                if scoped is not None:
+                    scoped.remove(city)
+                    if not len(scoped):
+                        del self.cities_by_country[fold_text(country)]
+        if table == 'restaurants' and row.get('cuisine_type'):
+            self.cuisines.remove(row['cuisine_type'])
+
+    def load_table(self, table, rows):
+        """
+        Thay toàn bộ dòng của một bảng
+        """
+        for row in self.rows[table].values():
+            self._remove_values(table, row)
+        self.rows[table] = {}
+        for row in rows:
+            self.rows[table][row['row_id']] = row
+            self._add_values(table, row)
+        self.names[table].build((row['row_id'], row['name'], row['rating']) for row in rows)
+        self.ngrams[table].build((row['row_id'], row) for row in rows)
+
+    def apply_row(self, table, row_id, rows):
+        """
+        Thay dòng row_id bằng rows (dòng vừa đọc lại từ DB, rỗng nếu đã bị xóa)
+        """
+        old = self.rows[table].pop(row_id, None)
+        if old is not None:
+            self._remove_values(table, old)
+            self.names[table].remove(row_id)
+            self.ngrams[table].remove(row_id)
+        for row in rows:
+            self.rows[table][row['row_id']] = row
+            self._add_values(table, row)
+            self.names[table].upsert(row['row_id'], row['name'], row['rating'])
+            self.ngrams[table].upsert(row['row_id'], row)
+
+
+class CatalogIndex:
+    """
+    Toàn bộ index catalog: prefix cho các endpoint /api/ghost/* (countries và cities của
+    hotels + restaurants, cities có thể giới hạn theo country, cuisines, tên hotel và restaurant)
+    và n-gram cho /api/hotels/autocomplete, /api/restaurants/autocomplete.
+    Lock chỉ được giữ khi tra cứu / sửa index, không bao giờ trong lúc query DB: rebuild định kỳ
+    chạy trên thread nền và request vẫn dùng bộ index cũ tới khi bộ mới sẵn sàng
+    """
+
+    TABLES = {
+        'hotels': """
+            SELECT hotel_id AS row_id, hotel_id, name, city, country, stars, rating, price_per_night
+            FROM hotels""",
+        'restaurants': """
+            SELECT restaurant_id AS row_id, restaurant_id, name, city, country, cuisine_type, rating, price_avg
+            FROM restaurants""",
+    }
+    # Field được tìm chuỗi con, giống điều kiện WHERE ... LIKE '%q%' của từng endpoint
+    SEARCH_FIELDS = {
+        'hotels': ('name', 'city', 'country'),
+        'restaurants': ('name', 'city', 'country', 'cuisine_type'),
+    }
+    ID_COLUMNS = {'hotels': 'hotel_id', 'restaurants': 'restaurant_id'}
+
+    def __init__(self, config=None):
+        self.config = dict(SEARCH_INDEX_CONFIG, **(config or {}))
+        self._lock = threading.RLock()
+        self._build_done = threading.Condition(self._lock)
+        self._built_at = None
+        self._building = False
+        self._pending = None  # (table, row_id) thay đổi trong lúc build, áp lại lên bộ index mới
+        self._state = self._new_state()
+
+    def _new_state(self):
+        return _CatalogState(self.TABLES, self.SEARCH_FIELDS, self.config)
+
+    @property
+    def _rows(self):
+        return self._state.rows
+
+    # ---------- build / update ----------
+
+    def _fetch(self, table, row_id=None):
+        query = self.TABLES[table]
+        params = None
+        if row_id is not None:
+            query += f" WHERE {self.ID_COLUMNS[table]} = %s"
+            params = (row_id,)
+        with db.session() as s:
+            return s.execute(query, params) or []
+
+    def build(self):
+        """
+        Load toàn bộ hotels/restaurants, dựng bộ index mới ngoài lock rồi thay bộ cũ.
+        Chỉ một build chạy tại một thời điểm: nếu đang có build thì chờ build đó xong
+        """
+        with self._lock:
+            if self._building:
+                self._build_done.wait_for(lambda: not self._building)
+                return
+            self._building = True
+            self._pending = []
+
+        started = time.perf_counter()
+        try:
+            fetched = {table: self._fetch(table) for table in self.TABLES}
+            state = self._new_state()
+            for table, rows in fetched.items():
+                state.load_table(table, rows)
+        except BaseException:
+            with self._lock:
+                self._building = False
+                self._pending = None
+                self._build_done.notify_all()
+            raise
+
+        with self._lock:
+            self._state = state
+            self._built_at = time.monotonic()
+            pending, self._pending = self._pending, None
+            self._building = False
+            self._build_done.notify_all()
+
+        log.info('ghost_index_built', hotels=len(fetched['hotels']), restaurants=len(fetched['restaurants']),
+                 duration_ms=round((time.perf_counter() - started) * 1000.0, 2), replayed=len(pending))
+        # Dòng bị ghi sau khi build đã đọc DB: đọc lại lên bộ index mới
+        for table, row_id in dict.fromkeys(pending):
+            self.reload_row(table, row_id)
+
+    def _rebuild_in_background(self):
+        try:
+            self.build()
+        except Exception as e:
+            # Giữ index cũ, thử lại sau một rebuild_interval
+            with self._lock:
+                self._built_at = time.monotonic()
+            log.warning('ghost_index_rebuild_failed', error=str(e))
+
+    def ensure_built(self):
+        built_at = self._built_at
+        if built_at is not None and time.monotonic() - built_at < self.config['rebuild_interval']:
+            return
+        if built_at is None:
+            # Chưa có index nào: chờ build đầu tiên
+            self.build()
+            return
+        with self._lock:
+            if self._building:
+                return
+        threading.Thread(target=self._rebuild_in_background, name='ghost-index-rebuild', daemon=True).start()
+
+    def reload_row(self, table, row_id=None):
+        """
+        Cập nhật index cho một dòng (đọc lại dòng đó từ DB), hoặc cả bảng nếu row_id là None
+        """
+        if table not in self.TABLES:
+            return
+        with self._lock:
+            if self._pending is not None:
+                self._pending.append((table, row_id))
+            if self._built_at is None:
+                return
+
+        rows = self._fetch(table, row_id)
+        with self._lock:
+            if row_id is None:
+                self._state.load_table(table, rows)
+            else:
+                self._state.apply_row(table, row_id, rows)
+
+    def _on_catalog_change(self, table, row_id):
+        self.reload_row(table, row_id)
+
+    # ---------- lookups ----------
+
+    def suggest_country(self, query):
+        self.ensure_built()
+        with self._lock:
+            return self._state.countries.lookup(fold_text(query))
+
+    def suggest_city(self, query, country=None):
+        self.ensure_built()
+        with self._lock:
+            state = self._state
+            if country:
+                scoped = state.cities_by_country.get(fold_text(country))
+                return scoped.lookup(fold_text(query)) if scoped is not None else None
+            return state.cities.lookup(fold_text(query))
+
+    def suggest_cuisine(self, query):
+        self.ensure_built()
+        with self._lock:
+            return self._state.cuisines.lookup(fold_text(query))
+
+    def suggest_name(self, table, query):
+        self.ensure_built()
+        with self._lock:
+            return self._state.names[table].lookup(fold_text(query))
+
+    def search(self, table, query, limit=5, fuzzy=True):
+        """
+        Autocomplete hotels/restaurants: tìm chuỗi con trên name/city/country (+ cuisine_type
+        cho restaurants), xếp hạng như query SQL cũ, bổ sung kết quả gần đúng nếu thiếu
+        """
+        self.ensure_built()
+        with self._lock:
+            return self._state.ngrams[table].search(query, limit, fuzzy=fuzzy)
+
+
+catalog_index = CatalogIndex()
+subscribe(catalog_index._on_catalog_change, tables=CatalogIndex.TABLES.keys())
+
+
+# ---------- BENCHMARK ----------
+
+GHOST_SQL = {
+    'countries': """
+        (SELECT DISTINCT country FROM hotels WHERE country LIKE %s)
+        UNION
+        (SELECT DISTINCT country FROM restaurants WHERE country LIKE %s)
+        ORDER BY country ASC
+        LIMIT 1
+    """,
+    'cities': """
+        (SELECT DISTINCT city FROM hotels WHERE city LIKE %s)
+        UNION
+        (SELECT DISTINCT city FROM restaurants WHERE city LIKE %s)
+        ORDER BY city ASC
+        LIMIT 1
+    """,
+    'hotels': "SELECT name FROM hotels WHERE name LIKE %s ORDER BY rating DESC, name ASC LIMIT 1",
+    'restaurants': "SELECT name FROM restaurants WHERE name LIKE %s ORDER BY rating DESC, name ASC LIMIT 1",
+}
+
+
+def _percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))]
+
+
+def benchmark(samples=1000, seed=42):
+    """
+    So sánh p50/p99 (µs) giữa index trong bộ nhớ và query LIKE 'q%' trên MySQL
+    với các prefix 2-6 ký tự lấy ngẫu nhiên từ dữ liệu thật
+    """
+    import random
+
+    rng = random.Random(seed)
+    catalog_index.build()
+
+    sources = {
+        'countries': [r['country'] for t in CatalogIndex.TABLES for r in catalog_index._rows[t].values() if r.get('country')],
+        'cities': [r['city'] for t in CatalogIndex.TABLES for r in catalog_index._rows[t].values() if r.get('city')],
+        'hotels': [r['name'] for r in catalog_index._rows['hotels'].values() if r.get('name')],
+        'restaurants': [r['name'] for r in catalog_index._rows['restaurants'].values() if r.get('name')],
+    }
+    lookups = {
+        'countries': catalog_index.suggest_country,
+        'cities': catalog_index.suggest_city,
+        'hotels': lambda q: catalog_index.suggest_name('hotels', q),
+        'restaurants': lambda q: catalog_index.suggest_name('restaurants', q),
+    }
+
+    report = {}
+    for field, values in sources.items():
+        if not values:
+            continue
+        queries = []
+        for _ in range(samples):
+            value = rng.choice(values)
+            queries.append(value[:rng.randint(2, max(2, min(6, len(value))))])
+
+        index_us, sql_us, mismatches = [], [], 0
+        with db.session() as s:
+            for q in queries:
+                started = time.perf_counter()
+                from_index = lookups[field](q)
+                index_us.append((time.perf_counter() - started) * 1e6)
+
+                params = (f"{q}%",) * GHOST_SQL[field].count('%s')
+                started = time.perf_counter()
+                row = s.execute(GHOST_SQL[field], params, fetch_one=True)
+                sql_us.append((time.perf_counter() - started) * 1e6)
+
+                from_sql = next(iter(row.values())) if row else None
+                if fold_text(from_index) != fold_text(from_sql):
+                    mismatches += 1
+
+        report[field] = {
+            'index_p50_us': round(_percentile(index_us, 50), 1),
+            'index_p99_us': round(_percentile(index_us, 99), 1),
+            'sql_p50_us': round(_percentile(sql_us, 50), 1),
+            'sql_p99_us': round(_percentile(sql_us, 99), 1),
+            'mismatches': mismatches,
+        }
+    return report
+
+
+if __name__ == "__main__":
+    for field, stats in benchmark().items():
+        print(f"{field:12s} index p50={stats['index_p50_us']}µs p99={stats['index_p99_us']}µs | "
+              f"sql p50={stats['sql_p50_us']}µs p99={stats['sql_p99_us']}µs | mismatches={stats['mismatches']}")
@@ -0,0 +1,541 @@
+# Smart Travel Vietnam - Vectorized similar-user scoring
+# Thay vòng lặp UserTourInfo + percentage_shared từng dòng trong get_top_k_similar_users
+# bằng ma trận thưa nhị phân (tour option x item) cho hotels/activities/transports/restaurants
+# cộng vector ngân sách chuẩn hóa, chấm điểm mọi option trong một phép nhân ma trận
+#
+#   matrix = TourOptionMatrix.from_rows(options)    # options đã split id list
+#   matrix.top_k(user_input, K=5)                   # [(user_id, score), ...]
+#
+#   matrix.top_k(user_input, K=5, mode='ann')       # MinHash/LSH, gần đúng
+#   for top in matrix.top_k_many(users, K=5): ...   # nhiều user một lượt (ma trận trọng số user)
+#
+#   python similarity_engine.py                     # benchmark 10k / 100k / 1M tour options, recall của ann, batch
+
+import os
+import math
+import time
+
+import numpy as np
+from scipy import sparse
+
+# Thứ tự cộng giống get_user_similarity để điểm số trùng khớp tới từng bit
+ITEM_FIELDS = ('hotel_ids', 'activity_ids', 'transport_ids', 'restaurant_ids')
+
+SIMILARITY_CONFIG = {
+    'mode': os.environ.get('SIMILAR_USERS_MODE', 'exact'),                      # exact | ann | auto, kết quả gần đúng chỉ khi bật rõ ràng
+    'ann_min_options': int(os.environ.get('SIMILAR_USERS_ANN_MIN_OPTIONS', 200000)),  # ngưỡng của auto
+    'num_perm': int(os.environ.get('SIMILAR_USERS_ANN_NUM_PERM', 32)),
+    'bands': int(os.environ.get('SIMILAR_USERS_ANN_BANDS', 32)),           # num_perm / bands hàng mỗi band
+    'max_candidates': int(os.environ.get('SIMILAR_USERS_ANN_MAX_CANDIDATES', 20000)),
+    'budget_candidates': int(os.environ.get('SIMILAR_USERS_ANN_BUDGET_CANDIDATES', 256)),
+    'batch_cells': int(os.environ.get('SIMILAR_USERS_BATCH_CELLS', 1 << 21)),  # số ô option x user mỗi khối của top_k_many
+}
+
+
+def _to_float(value):
+    return float(value) if value is not None else np.nan
+
+
+def normalized_budget(target_budget, guest_count, duration_days):
+    """
+    Ngân sách / (khách * ngày) như trong get_user_similarity
+    """
+    return target_budget / (guest_count * duration_days)
+
+
+class TourOptionMatrix:
+    """
+    Tập tour option (thường là một destination_city_id) dưới dạng mảng:
+      user_ids, destination_ids: object array, so sánh bằng ==/!= của Python như code cũ
+      budgets:                   ngân sách chuẩn hóa (NaN nếu thiếu dữ liệu)
+      items[field]:              CSR nhị phân n_options x len(vocabularies[field])
+    """
+
+    def __init__(self, user_ids, destination_ids, budgets, items, vocabularies):
+        self.user_ids = user_ids
+        self.destination_ids = destination_ids
+        self.budgets = budgets
+        self.items = items
+        self.vocabularies = vocabularies
+        self._lsh = {}
+        self._user_rows_index = None
+
+    def __len__(self):
+        return len(self.user_ids)
+
+    @classmethod
+    def from_rows(cls, rows):
+        """
+        Build từ các row dict (user_id, destination_city_id, guest_count, duration_days,
+        target_budget và 4 list id). Item lặp lại trong một row chỉ tính một lần,
+        giống GROUP_CONCAT(DISTINCT ...)
+        """
+        rows = list(rows)
+        n = len(rows)
+        user_ids = np.empty(n, dtype=object)
+        destination_ids = np.empty(n, dtype=object)
+        target = np.empty(n)
+        guests = np.empty(n)
+        days = np.empty(n)
+        for i, row in enumerate(rows):
+            user_ids[i] = row.get('user_id')
+            destination_ids[i] = row.get('destination_city_id')
+            target[i] = _to_float(row.get('target_budget'))
+            guests[i] = _to_float(row.get('guest_count'))
+            days[i] = _to_float(row.get('duration_days'))
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            budgets = normalized_budget(target, guests, days)
+
+        items, vocabularies = {}, {}
+        for field in ITEM_FIELDS:
+            vocabulary = {}
+            indptr, indices = [0], []
+            for row in rows:
+                columns = {vocabulary.setdefault(item, len(vocabulary)) for item in row.get(field) or ()}
+                indices.extend(columns)
+                indptr.append(len(indices))
+            data = np.ones(len(indices), dtype=np.int32)
+            items[field] = sparse.csr_matrix((data, indices, indptr), shape=(n, len(vocabulary)))
+            vocabularies[field] = vocabulary
+
+        return cls(user_ids, destination_ids, budgets, items, vocabularies)
+
+    def _shared(self, field, user_items, rows=None):
+        """
+        percentage_shared(user_items, option_items) cho mọi option (hoặc các dòng rows): số item
+        của user (tính cả item lặp) có trong option / len(user_items)
+        """
+        if not user_items:
+            return 0.0
+        vocabulary = self.vocabularies[field]
+        weights = np.zeros(len(vocabulary), dtype=np.int64)
+        for item in user_items:
+            column = vocabulary.get(item)
+            if column is not None:
+                weights[column] += 1
+        matrix = self.items[field] if rows is None else self.items[field][rows]
+        return (matrix @ weights) / len(user_items)
+
+    def scores(self, user_input, rows=None):
+        """
+        Điểm get_user_similarity(user_input, option) của từng option (hoặc các dòng rows),
+        -inf cho option khác destination, cùng user hoặc thiếu dữ liệu ngân sách
+        """
+        budgets = self.budgets if rows is None else self.budgets[rows]
+        user_budget = normalized_budget(user_input.target_budget, user_input.guest_count, user_input.duration_days)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            scores = np.abs((user_budget - budgets) / (user_budget + budgets + 1e-9))
+        for field in ITEM_FIELDS:
+            scores = scores + self._shared(field, getattr(user_input, field), rows)
+
+        destination_ids = self.destination_ids if rows is None else self.destination_ids[rows]
+        user_ids = self.user_ids if rows is None else self.user_ids[rows]
+        valid = (destination_ids == user_input.destination_city_id) & (user_ids != user_input.user_id)
+        valid &= np.isfinite(scores)
+        return np.where(valid, scores, -math.inf)
+
+    def top_k_rows(self, user_input, K=5, mode='exact', **ann_params):
+        """
+        Chỉ số dòng của K option điểm cao nhất, theo điểm giảm dần rồi thứ tự dòng.
+        mode='ann' chỉ chấm điểm chính xác trên tập ứng viên của MinHashLSHIndex
+        """
+        if K <= 0 or not len(self):
+            return np.empty(0, dtype=np.int64), np.empty(0)
+
+        if mode == 'ann':
+            params = {key: ann_params.get(key, SIMILARITY_CONFIG[key]) for key in ('num_perm', 'bands')}
+            rows = self.lsh(**params).candidates(
+                self, user_input,
+                max_candidates=ann_params.get('max_candidates', SIMILARITY_CONFIG['max_candidates']),
+                budget_candidates=ann_params.get('budget_candidates', SIMILARITY_CONFIG['budget_candidates']),
+            )
+            scores = self.scores(user_input, rows)
+        else:
+            rows = np.arange(len(self))
+            scores = self.scores(user_input)
+
+        return self._select(rows, scores, K)
+
+    @staticmethod
+    def _select(rows, scores, K):
+        candidates = np.flatnonzero(scores != -math.inf)
+        if len(candidates) > K:
+            # Ngưỡng điểm thứ K (argpartition, O(n)), rồi chỉ sort phần >= ngưỡng
+            kth = scores[candidates[np.argpartition(-scores[candidates], K - 1)[K - 1]]]
+            candidates = candidates[scores[candidates] >= kth]
+        order = candidates[np.lexsort((rows[candidates], -scores[candidates]))][:K]
+        return rows[order], scores[order]
+
+    def top_k(self, user_input, K=5, mode='exact', **ann_params):
+        """
+        K option điểm cao nhất dạng [(user_id, score)], cùng thứ tự với
+        sorted(..., reverse=True)[:K] (option cùng điểm giữ thứ tự dòng).
+        mode: 'exact', 'ann' (MinHash/LSH, tham số ghi đè SIMILARITY_CONFIG qua ann_params)
+        hoặc 'auto' (ann khi số option >= SIMILARITY_CONFIG['ann_min_options'])
+        """
+        if mode == 'auto':
+            mode = 'ann' if len(self) >= SIMILARITY_CONFIG['ann_min_options'] else 'exact'
+        rows, scores = self.top_k_rows(user_input, K, mode, **ann_params)
+        return [(self.user_ids[i], float(score)) for i, score in zip(rows, scores)]
+
+    def batch_scores(self, user_inputs):
+        """
+        Ma trận điểm len(user_inputs) x n_options, dòng j bằng scores(user_inputs[j]):
+        mỗi loại item là một phép nhân CSR x ma trận trọng số (vocabulary x user)
+        """
+        m = len(user_inputs)
+        user_budgets = np.array([normalized_budget(u.target_budget, u.guest_count, u.duration_days)
+                                 for u in user_inputs], dtype=float)
+        # Tính theo layout option x user (liền bộ nhớ với kết quả CSR x dense), chuyển vị một lần ở cuối
+        budgets = self.budgets[:, None]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            scores = np.subtract(user_budgets, budgets)
+            np.divide(scores, user_budgets + budgets + 1e-9, out=scores)
+        np.abs(scores, out=scores)
+
+        for field in ITEM_FIELDS:
+            vocabulary = self.vocabularies[field]
+            weights = np.zeros((len(vocabulary), m), dtype=np.int64)
+            lengths = np.ones(m)
+            for j, user_input in enumerate(user_inputs):
+                user_items = getattr(user_input, field)
+                if not user_items:
+                    continue  # cột trọng số 0 -> cộng 0.0 như _shared
+                lengths[j] = len(user_items)
+                for item in user_items:
+                    column = vocabulary.get(item)
+                    if column is not None:
+                        weights[column, j] += 1
+            scores += (self.items[field] @ weights) / lengths
+        scores = np.ascontiguousarray(scores.T)
+
+        # Loại option khác destination / cùng user: so sánh mỗi destination một lần,
+        # dòng cùng user lấy từ index user_id -> dòng thay vì so sánh n x m object
+        scores[~np.isfinite(scores)] = -math.inf
+        mismatched = {}
+        user_rows = self._user_rows()
+        for j, user_input in enumerate(user_inputs):
+            destination = user_input.destination_city_id
+            rows = mismatched.get(destination)
+            if rows is None:
+                rows = mismatched[destination] = np.flatnonzero(~(self.destination_ids == destination))
+            scores[j, rows] = -math.inf
+            scores[j, user_rows.get(user_input.user_id, ())] = -math.inf
+        return scores
+
+    def _user_rows(self):
+        user_rows = self._user_rows_index
+        if user_rows is None:
+            user_rows = {}
+            for i, user_id in enumerate(self.user_ids):
+                user_rows.setdefault(user_id, []).append(i)
+            self._user_rows_index = user_rows
+        return user_rows
+
+    def top_k_many(self, user_inputs, K=5, mode='exact', batch_cells=None, **ann_params):
+        """
+        Generator: top_k của từng user trong user_inputs (cùng thứ tự, cùng kết quả với top_k).
+        Exact chấm điểm từng khối user bằng batch_scores rồi chọn top-K cả khối một lượt, khối
+        giới hạn batch_cells ô (mặc định SIMILARITY_CONFIG['batch_cells']) để không cấp phát
+        users x n_options một lần. mode='ann' (hoặc auto với partition lớn) chấm từng user
+        trên tập ứng viên LSH riêng
+        """
+        user_inputs = list(user_inputs)
+        if mode == 'auto':
+            mode = 'ann' if len(self) >= SIMILARITY_CONFIG['ann_min_options'] else 'exact'
+        if mode == 'ann' or K <= 0 or not len(self):
+            for user_input in user_inputs:
+                yield self.top_k(user_input, K, mode, **ann_params)
+            return
+
+        block = max(1, (batch_cells or SIMILARITY_CONFIG['batch_cells']) // len(self))
+        for start in range(0, len(user_inputs), block):
+            scores = self.batch_scores(user_inputs[start:start + block])
+            keep = scores != -math.inf
+            if scores.shape[1] > K:
+                kth = -np.partition(-scores, K - 1, axis=1)[:, K - 1:K]
+                keep &= scores >= kth
+            users, rows = np.nonzero(keep)
+            values = scores[users, rows]
+            order = np.lexsort((rows, -values, users))
+            users, rows, values = users[order], rows[order], values[order]
+            bounds = np.searchsorted(users, np.arange(scores.shape[0] + 1))
+            for j in range(scores.shape[0]):
+                lo, hi = bounds[j], min(bounds[j + 1], bounds[j] + K)
+                yield [(self.user_ids[i], float(score)) for i, score in zip(rows[lo:hi], values[lo:hi])]
+
+    def lsh(self, num_perm=32, bands=32):
+        """
+        MinHashLSHIndex của ma trận (build lười, cache theo tham số; ma trận không đổi
+        sau khi build nên index không bao giờ cũ)
+        """
+        key = (num_perm, bands)
+        index = self._lsh.get(key)
+        if index is None:
+            index = self._lsh[key] = MinHashLSHIndex(self, num_perm, bands)
+        return index
+
+
+class MinHashLSHIndex:
+    """
+    Ứng viên gần đúng cho top_k khi partition quá lớn để chấm điểm hết:
+      - MinHash (num_perm hàm băm) trên tập item của từng option (4 loại item gộp chung),
+        chia bands band; option trùng key ở ít nhất một band với user là ứng viên, ưu tiên
+        option trùng nhiều band (ước lượng Jaccard). Nhiều band / ít hàng mỗi band và
+        max_candidates lớn -> recall cao hơn nhưng chậm hơn. Điểm tương đồng cộng containment
+        của từng loại item nên overlap thường thấp: 1 hàng mỗi band cho recall tốt nhất
+      - Build index tốn vài giây với 1M option (chỉ một lần cho mỗi TourOptionMatrix)
+      - Budget band: thành phần ngân sách |u - o| / (u + o) của điểm tăng theo độ lệch ngân sách,
+        nên option ở hai đầu dải ngân sách (đã sort sẵn) luôn được thêm vào ứng viên
+    """
+
+    _PRIME = (1 << 31) - 1
+    _EMPTY = np.uint64(0xFFFFFFFFFFFFFFFF)  # key của option không có item, không bao giờ khớp
+    _CHUNK = 65536
+
+    def __init__(self, matrix, num_perm=32, bands=32, seed=1):
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows_per_band = num_perm // bands
+
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, self._PRIME, num_perm, dtype=np.int64)
+        self._b = rng.integers(0, self._PRIME, num_perm, dtype=np.int64)
+        self._band_mix = rng.integers(1, 1 << 63, self.rows_per_band, dtype=np.uint64) | np.uint64(1)
+
+        # Token toàn cục = (loại item, cột) -> ma trận n x tổng số item
+        self._offsets, offset = {}, 0
+        for field in ITEM_FIELDS:
+            self._offsets[field] = offset
+            offset += len(matrix.vocabularies[field])
+        tokens = sparse.hstack([matrix.items[field] for field in ITEM_FIELDS], format='csr')
+
+        keys = self._band_keys(self._signatures(tokens.indptr, tokens.indices))
+        self._order = np.argsort(keys, axis=0, kind='stable')          # bands cột, mỗi cột là thứ tự dòng
+        self._sorted_keys = np.take_along_axis(keys, self._order, axis=0)
+        self._budget_order = np.argsort(np.where(np.isfinite(matrix.budgets), matrix.budgets, np.nan), kind='stable')
+        self._budget_count = int(np.isfinite(matrix.budgets).sum())    # NaN nằm cuối thứ tự
+
+    def _signatures(self, indptr, indices):
+        n = len(indptr) - 1
+        signatures = np.full((n, self.num_perm), self._PRIME, dtype=np.int64)
+        for start in range(0, n, self._CHUNK):
+            stop = min(start + self._CHUNK, n)
+            lo, hi = indptr[start], indptr[stop]
+            if lo == hi:
+                continue
+            hashed = (np.outer(indices[lo:hi].astype(np.int64), self._a) + self._b) % self._PRIME
+            counts = np.diff(indptr[start:stop + 1])
+            non_empty = np.flatnonzero(counts)
+            segment_starts = (indptr[start:stop] - lo)[non_empty]
+            signatures[start + non_empty] = np.minimum.reduceat(hashed, segment_starts, axis=0)
+        signatures[np.diff(indptr) == 0] = -1
+        return signatures
+
+    def _band_keys(self, signatures):
+        keys = np.empty((len(signatures), self.bands), dtype=np.uint64)
+        empty = signatures[:, 0] == -1
+        with np.errstate(over='ignore'):
+            for band in range(self.bands):
+                chunk = signatures[:, band * self.rows_per_band:(band + 1) * self.rows_per_band].astype(np.uint64)
+                keys[:, band] = (chunk * self._band_mix).sum(axis=1)
+        keys[empty] = self._EMPTY
+        return keys
+
+    def _query_keys(self, matrix, user_input):
+        indices = []
+        for field in ITEM_FIELDS:
+            vocabulary = matrix.vocabularies[field]
+            for item in getattr(user_input, field) or ():
+                column = vocabulary.get(item)
+                if column is not None:
+                    indices.append(self._offsets[field] + column)
+        if not indices:
+            return None
+        indices = np.unique(np.array(indices, dtype=np.int64))
+        signature = self._signatures(np.array([0, len(indices)]), indices)
+        return self._band_keys(signature)[0]
+
+    def candidates(self, matrix, user_input, max_candidates=20000, budget_candidates=256):
+        """
+        Chỉ số dòng ứng viên: các option trùng band với user (giữ tối đa max_candidates option
+        trùng nhiều band nhất) cộng budget_candidates option ở mỗi đầu dải ngân sách
+        """
+        parts = []
+        keys = self._query_keys(matrix, user_input)
+        if keys is not None:
+            hits = []
+            for band in range(self.bands):
+                column = self._sorted_keys[:, band]
+                lo, hi = np.searchsorted(column, keys[band], 'left'), np.searchsorted(column, keys[band], 'right')
+                if hi > lo:
+                    hits.append(self._order[lo:hi, band])
+            if hits:
+                rows, collisions = np.unique(np.concatenate(hits), return_counts=True)
+                if len(rows) > max_candidates:
+                    rows = rows[np.argpartition(-collisions, max_candidates - 1)[:max_candidates]]
+                parts.append(rows)
+
+        if budget_candidates > 0 and self._budget_count:
+            valid = self._budget_order[:self._budget_count]
+            parts.append(valid[:budget_candidates])
+            parts.append(valid[-budget_candidates:])
+
+        if not parts:
+            return np.empty(0, dtype=np.int64)
+        return np.unique(np.concatenate(parts))
+
+
+# ---------- benchmark ----------
+
+def _reference_top_k(user_input, rows, K):
+    # Bản sao vòng lặp cũ (percentage_shared + get_user_similarity) để so kết quả
+    def shared(list1, list2):
+        if not list1:
+            return 0.0
+        return sum(1 for item in list1 if item in list2) / len(list1)
+
+    user_budget = normalized_budget(user_input.target_budget, user_input.guest_count, user_input.duration_days)
+    similarities = []
+    for row in rows:
+        if user_input.destination_city_id != row['destination_city_id'] or user_input.user_id == row['user_id']:
+            continue
+        other_budget = normalized_budget(row['target_budget'], row['guest_count'], row['duration_days'])
+        score = math.fabs((user_budget - other_budget) / (user_budget + other_budget + 1e-9))
+        score = (score + shared(user_input.hotel_ids, row['hotel_ids']) + shared(user_input.activity_ids, row['activity_ids'])
+                 + shared(user_input.transport_ids, row['transport_ids']) + shared(user_input.restaurant_ids, row['restaurant_ids']))
+        similarities.append((row['user_id'], score))
+    return sorted(similarities, key=lambda x: x[1], reverse=True)[:K]
+
+
+def _synthetic_rows(n, rng):
+    catalog = {'hotel_ids': ('H', 2000), 'activity_ids': ('A', 5000),
+               'restaurant_ids': ('R', 3000), 'transport_ids': ('T0', 40)}
+    columns = {}
+    for field, (prefix, size) in catalog.items():
+        counts = rng.integers(0, 6, n)
+        ids = rng.integers(1, size + 1, counts.sum())
+        bounds = np.concatenate(([0], np.cumsum(counts)))
+        labels = np.char.add(prefix, ids.astype(str)).tolist()
+        columns[field] = [sorted(set(labels[bounds[i]:bounds[i + 1]])) for i in range(n)]
+    users = rng.integers(1, max(n // 3, 2), n)
+    guests = rng.integers(1, 6, n)
+    days = rng.integers(1, 8, n)
+    budgets = rng.integers(100, 5000, n)
+    return [
+        {'user_id': f'U{users[i]}', 'destination_city_id': 1, 'guest_count': int(guests[i]),
+         'duration_days': int(days[i]), 'target_budget': float(budgets[i]),
+         **{field: columns[field][i] for field in catalog}}
+        for i in range(n)
+    ]
+
+
+def benchmark(sizes=(10_000, 100_000, 1_000_000), K=5, queries=20, loop_limit=100_000, seed=42):
+    """
+    So sánh vòng lặp cũ với TourOptionMatrix: thời gian build, thời gian chấm điểm trung bình
+    mỗi user và kiểm tra top-K trùng khớp (vòng lặp cũ chỉ chạy tới loop_limit option)
+    """
+    from types import SimpleNamespace
+
+    rng = np.random.default_rng(seed)
+    report = []
+    for n in sizes:
+        rows = _synthetic_rows(n, rng)
+        users = [SimpleNamespace(**dict(rows[i], user_id='U_query')) for i in rng.integers(0, n, queries)]
+
+        started = time.perf_counter()
+        matrix = TourOptionMatrix.from_rows(rows)
+        build_ms = (time.perf_counter() - started) * 1000
+
+        started = time.perf_counter()
+        results = [matrix.top_k(user, K) for user in users]
+        vector_ms = (time.perf_counter() - started) * 1000 / queries
+
+        loop_ms, identical = None, None
+        if n <= loop_limit:
+            sample = users[:3]
+            started = time.perf_counter()
+            expected = [_reference_top_k(user, rows, K) for user in sample]
+            loop_ms = (time.perf_counter() - started) * 1000 / len(sample)
+            identical = expected == results[:len(sample)]
+
+        report.append({'options': n, 'build_ms': round(build_ms, 1), 'vectorized_ms': round(vector_ms, 2),
+                       'loop_ms': round(loop_ms, 1) if loop_ms is not None else None, 'identical': identical})
+    return report
+
+
+def benchmark_ann(sizes=(100_000, 1_000_000), K=5, queries=50, seed=7,
+                  configs=({'num_perm': 16, 'bands': 16, 'max_candidates': 5000},
+                           {'num_perm': 32, 'bands': 32, 'max_candidates': 5000},
+                           {'num_perm': 32, 'bands': 32, 'max_candidates': 20000},
+                           {'num_perm': 64, 'bands': 64, 'max_candidates': 30000})):
+    """
+    Recall@K và latency của mode='ann' so với exact với từng cấu hình tham số
+    (recall = tỉ lệ option của top-K exact có trong top-K ann)
+    """
+    from types import SimpleNamespace
+
+    rng = np.random.default_rng(seed)
+    report = []
+    for n in sizes:
+        rows = _synthetic_rows(n, rng)
+        matrix = TourOptionMatrix.from_rows(rows)
+        users = [SimpleNamespace(**dict(rows[i], user_id='U_query')) for i in rng.integers(0, n, queries)]
+
+        started = time.perf_counter()
+        exact = [set(matrix.top_k_rows(user, K)[0].tolist()) for user in users]
+        exact_ms = (time.perf_counter() - started) * 1000 / queries
+
+        for config in configs:
+            params = dict({key: SIMILARITY_CONFIG[key] for key in ('num_perm', 'bands', 'max_candidates', 'budget_candidates')},
+                          **config)
+            started = time.perf_counter()
+            matrix.lsh(params['num_perm'], params['bands'])
+            build_ms = (time.perf_counter() - started) * 1000
+
+            started = time.perf_counter()
+            found = [set(matrix.top_k_rows(user, K, mode='ann', **params)[0].tolist()) for user in users]
+            ann_ms = (time.perf_counter() - started) * 1000 / queries
+
+            recall = sum(len(e & f) for e, f in zip(exact, found)) / sum(len(e) for e in exact)
+            report.append({'options': n, 'params': params, 'recall': round(recall, 3),
+                           'exact_ms': round(exact_ms, 2), 'ann_ms': round(ann_ms, 2), 'index_build_ms': round(build_ms, 1)})
+    return report
+
+
+def benchmark_batch(sizes=(10_000, 100_000), K=5, users=500, seed=11):
+    """
+    top_k từng user so với top_k_many cho cùng danh sách user: tổng thời gian và kết quả trùng khớp
+    """
+    from types import SimpleNamespace
+
+    rng = np.random.default_rng(seed)
+    report = []
+    for n in sizes:
+        rows = _synthetic_rows(n, rng)
+        matrix = TourOptionMatrix.from_rows(rows)
+        queries = [SimpleNamespace(**dict(rows[i], user_id='U_query')) for i in rng.integers(0, n, users)]
+
+        started = time.perf_counter()
+        single = [matrix.top_k(user, K) for user in queries]
+        single_ms = (time.perf_counter() - started) * 1000
+
+        started = time.perf_counter()
+        batched = list(matrix.top_k_many(queries, K))
+        batch_ms = (time.perf_counter() - started) * 1000
+
+        report.append({'options': n, 'users': users, 'single_ms': round(single_ms, 1),
+                       'batch_ms': round(batch_ms, 1), 'identical': single == batched})
+    return report
+
+
+if __name__ == '__main__':
+    for line in benchmark():
+        print(line)
+    for line in benchmark_ann():
+        print(line)
+    for line in benchmark_batch():
+        print(line)
@@ -0,0 +1,54 @@
+import json
+
+import pytest
+
+from prompt_builder import OUTPUT_FORMAT, build_itinerary_prompt, output_schema_keys
+
+# Key của REQUIRED OUTPUT FORMAT trong prompt cũ của get_gemini_travel_recommendations, theo thứ tự.
+# json.loads, DayStreamParser và hậu xử lý khoảng cách dựa vào đúng các key này
+LEGACY_SCHEMA_KEYS = [
+    'destination', 'guests', 'duration_days', 'within_budget', 'total_cost',
+    'cost_breakdown', 'hotels', 'activities', 'meals', 'transport_estimate',
+    'days', 'day', 'activities',
+    'start_time', 'end_time', 'type', 'place_id', 'place_name', 'description',
+    'transport_mode', 'distance_km', 'travel_time_min', 'cost',
+]
+
+TRAVEL_DATA = {
+    'activities': [{'activity_id': 'A0001', 'name': 'Cầu Rồng', 'price': 0, 'rating': 4.6,
+                    'description': 'Cây cầu "rồng" phun lửa {cuối tuần}', 'latitude': 16.06, 'longitude': 108.22}],
+    'restaurants': [{'restaurant_id': 'R0001', 'name': 'Mì Quảng Bà Mua', 'price_avg': 3.5, 'rating': 4.3,
+                     'description': None, 'latitude': 16.07, 'longitude': 108.21}],
+    'hotels': [{'hotel_id': 'H0001', 'name': 'Sala Danang Beach', 'price_per_night': 65, 'rating': 4.5,
+                'description': 'Khách sạn sát biển Mỹ Khê', 'latitude': 16.05, 'longitude': 108.24}],
+}
+
+USER_PREFS = {'liked_activities': ['A0001'], 'disliked_hotels': ['H0002'],
+              'liked_transport_modes': ['taxi'], 'disliked_transport_modes': ['bus']}
+
+
+@pytest.mark.parametrize('travel_data, user_prefs', [
+    (TRAVEL_DATA, USER_PREFS),
+    (TRAVEL_DATA, {}),
+    ({'activities': [], 'restaurants': [], 'hotels': []}, {}),
+])
+def test_output_schema_unchanged(travel_data, user_prefs):
+    prompt = build_itinerary_prompt('Đà Nẵng', 5, 3, 2, 1500.0, travel_data, user_prefs)
+    assert output_schema_keys(prompt) == LEGACY_SCHEMA_KEYS
+
+
+def test_output_format_values_filled_in():
+    prompt = build_itinerary_prompt('Đà Nẵng', 5, 4, 3, 900.0, TRAVEL_DATA, USER_PREFS)
+    assert '"destination": "Đà Nẵng"' in prompt
+    assert '"guests": 3' in prompt
+    assert '"duration_days": 4' in prompt
+
+
+def test_output_format_is_valid_json_template():
+    # Bỏ placeholder <...> và lựa chọn "a" | "b" thì mẫu output phải là JSON hợp lệ
+    template = OUTPUT_FORMAT.format(destination_name='Đà Nẵng', guests=2, duration=3)
+    template = template.replace('<number>', '0').replace('"<id or null>"', 'null')
+    template = template.replace('"activity" | "meal" | "hotel" | "transfer"', '"activity"')
+    itinerary = json.loads(template)
+    assert list(itinerary) == ['destination', 'guests', 'duration_days', 'within_budget',
+                               'total_cost', 'cost_breakdown', 'days']
@@ -0,0 +1,371 @@
+# Smart Travel Vietnam - In-memory tour option feature store
+# Materialize tour_options + 4 bảng mapping (hotels/activities/restaurants/transports) một lần,
+# chia partition theo destination_city_id, để recommend_existing / recommend_cold_start đọc
+# từ bộ nhớ thay vì chạy lại LEFT JOIN + GROUP_CONCAT trên cả bảng mỗi request.
+# Code ghi tour option gọi notify_change('tour_options', option_id) để cập nhật đúng option đó.
+#
+#   from tour_feature_store import tour_feature_store
+#   partition = tour_feature_store.partition(destination_city_id)
+#   partition.similarity_matrix().top_k(user_input, K=5)
+#   tour_feature_store.options_for_user('U001')
+#   tour_feature_store.imputation_stats()          # mean / mode / top item cho impute_all_fields
+
+import os
+import threading
+from collections import Counter
+
+import db
+from app_logging import get_logger
+from catalog_events import subscribe
+from reference_data import _ReferenceTable, _id_key
+from similarity_engine import ITEM_FIELDS, TourOptionMatrix
+
+TOUR_FEATURE_STORE_CONFIG = {
+    'ttl': int(os.environ.get('TOUR_FEATURE_STORE_TTL', 900)),  # giây, full reload định kỳ
+}
+
+TOUR_OPTIONS_SQL = """
+    SELECT
+        t.option_id,
+        t.user_id,
+        t.start_city_id,
+        t.destination_city_id,
+        t.guest_count,
+        t.duration_days,
+        t.target_budget,
+        t.rating,
+        GROUP_CONCAT(DISTINCT ta.activity_id) as activity_ids,
+        GROUP_CONCAT(DISTINCT th.hotel_id) as hotel_ids,
+        GROUP_CONCAT(DISTINCT tr.restaurant_id) as restaurant_ids,
+        GROUP_CONCAT(DISTINCT tt.transport_id) as transport_ids
+    FROM tour_options t
+    LEFT JOIN tour_options_activities ta ON t.option_id = ta.option_id
+    LEFT JOIN tour_options_hotels th ON t.option_id = th.option_id
+    LEFT JOIN tour_options_restaurants tr ON t.option_id = tr.option_id
+    LEFT JOIN tour_options_transports tt ON t.option_id = tt.option_id
+    {where}
+    GROUP BY t.option_id, t.user_id, t.start_city_id, t.destination_city_id,
+             t.guest_count, t.duration_days, t.target_budget, t.rating
+"""
+
+NUMERIC_FIELDS = ('guest_count', 'duration_days', 'target_budget', 'rating')
+
+# Cột GROUP BY của get_top_k_similar_users: các option cùng user và cùng thông số được gộp item
+SIMILARITY_GROUP_FIELDS = ('user_id', 'start_city_id', 'destination_city_id',
+                           'guest_count', 'duration_days', 'target_budget')
+
+# Trường được impute_all_fields điền khi user bỏ trống (target_budget: chỉ là fallback khi budget_model
+# chưa có model, xem prepare_cold_start_user)
+MEAN_FIELDS = ('guest_count', 'duration_days', 'target_budget')
+MODE_FIELDS = ('start_city_id', 'destination_city_id')
+TOP_ITEMS = 3
+
+log = get_logger('tour_feature_store')
+
+
+def _record(row):
+    """
+    Row SQL -> record của store: số dạng float (None giữ nguyên), id list dạng tuple
+    """
+    record = {
+        'option_id': row['option_id'],
+        'user_id': row['user_id'],
+        'start_city_id': row['start_city_id'],
+        'destination_city_id': row['destination_city_id'],
+    }
+    for field in NUMERIC_FIELDS:
+        record[field] = float(row[field]) if row[field] is not None else None
+    for field in ITEM_FIELDS:
+        record[field] = tuple(row[field].split(',')) if row[field] else ()
+    return record
+
+
+def _public(record):
+    # Caller được phép sửa dict trả về (nhiều chỗ gán lại field), nên trả bản copy
+    public = dict(record)
+    for field in ITEM_FIELDS:
+        public[field] = list(record[field])
+    return public
+
+
+class CityPartition:
+    """
+    Các tour option có cùng destination_city_id, kèm TourOptionMatrix được build lười
+    và build lại sau khi partition thay đổi. lock là write lock của store: add/remove được gọi
+    khi đang giữ lock, đọc options thì lấy snapshot dưới lock
+    """
+
+    def __init__(self, destination_id, lock):
+        self.destination_id = destination_id
+        self.options = {}  # option key -> record, theo thứ tự option_id lúc load
+        self._lock = lock
+        self._version = 0
+        self._matrix = None
+
+    def __len__(self):
+        return len(self.options)
+
+    def add(self, record):
+        self.options[_id_key(record['option_id'])] = record
+        self._version += 1
+        self._matrix = None
+
+    def remove(self, option_key):
+        if self.options.pop(option_key, None) is not None:
+            self._version += 1
+            self._matrix = None
+
+    def records(self):
+        with self._lock:
+            return list(self.options.values())
+
+    def similarity_matrix(self):
+        """
+        TourOptionMatrix (id list dạng ma trận thưa + ngân sách chuẩn hóa) của partition, với
+        cùng cách gộp như query GROUP BY cũ của get_top_k_similar_users: item của các option
+        cùng user và cùng thông số được gộp thành một dòng
+        """
+        matrix = self._matrix
+        if matrix is not None:
+            return matrix
+
+        with self._lock:
+            version = self._version
+            records = list(self.options.values())
+        groups = {}
+        for record in records:
+            key = tuple(record[field] for field in SIMILARITY_GROUP_FIELDS)
+            group = groups.get(key)
+            if group is None:
+                group = groups[key] = dict(zip(SIMILARITY_GROUP_FIELDS, key), **{f: set() for f in ITEM_FIELDS})
+            for field in ITEM_FIELDS:
+                group[field].update(record[field])
+        matrix = TourOptionMatrix.from_rows(groups.values())
+        with self._lock:
+            if version == self._version:
+                # Partition bị ghi trong lúc build thì không cache, lần sau build lại
+                self._matrix = matrix
+        return matrix
+
+
+class RunningStats:
+    """
+    Thống kê trên toàn bộ tour option, cập nhật theo từng option được thêm/xóa:
+      MEAN_FIELDS: tổng + số giá trị khác None -> mean
+      MODE_FIELDS: Counter giá trị -> mode (bằng nhau thì lấy giá trị nhỏ nhất như pandas mode()[0])
+      ITEM_FIELDS: Counter item -> TOP_ITEMS item phổ biến nhất (bằng nhau thì item xuất hiện trước)
+    snapshot() được cache tới lần thay đổi kế tiếp
+    """
+
+    def __init__(self):
+        self.options = 0
+        self.sums = dict.fromkeys(MEAN_FIELDS, 0.0)
+        self.counts = dict.fromkeys(MEAN_FIELDS, 0)
+        self.values = {field: Counter() for field in MODE_FIELDS}
+        self.items = {field: Counter() for field in ITEM_FIELDS}
+        self._snapshot = None
+
+    def add(self, record, sign=1):
+        self.options += sign
+        for field in MEAN_FIELDS:
+            if record[field] is not None:
+                self.sums[field] += sign * record[field]
+                self.counts[field] += sign
+        for field in MODE_FIELDS:
+            if record[field] is not None:
+                self._count(self.values[field], record[field], sign)
+        for field in ITEM_FIELDS:
+            counter = self.items[field]
+            for item in record[field]:
+                self._count(counter, item, sign)
+        self._snapshot = None
+
+    def remove(self, record):
+        self.add(record, -1)
+
+    @staticmethod
+    def _count(counter, key, sign):
+        count = counter[key] + sign
+        if count > 0:
+            counter[key] = count
+        else:
+            del counter[key]
+
+    def snapshot(self):
+        """
+        {'options': số option, field: mean / mode / list top item}; mean, mode là None khi
+        không có giá trị nào
+        """
+        snapshot = self._snapshot
+        if snapshot is not None:
+            return snapshot
+
+        snapshot = {'options': self.options}
+        for field in MEAN_FIELDS:
+            count = self.counts[field]
+            snapshot[field] = self.sums[field] / count if count > 0 else None
+        for field in MODE_FIELDS:
+            counter = self.values[field]
+            if counter:
+                top = max(counter.values())
+                snapshot[field] = min(value for value, count in counter.items() if count == top)
+            else:
+                snapshot[field] = None
+        for field in ITEM_FIELDS:
+            snapshot[field] = [item for item, _ in self.items[field].most_common(TOP_ITEMS)]
+        self._snapshot = snapshot
+        return snapshot
+
+
+class TourFeatureStore(_ReferenceTable):
+    """
+    Toàn bộ tour option trong bộ nhớ, chia partition theo destination_city_id, có index theo
+    option_id và user_id và RunningStats cho impute. Full reload theo TTL trên thread nền (request
+    đọc bản cũ trong lúc reload), cập nhật từng option qua catalog_events
+    """
+
+    table_name = 'tour_feature_store'
+    background_refresh = True
+
+    def __init__(self, ttl=900):
+        super().__init__(ttl)
+        self._write_lock = threading.RLock()
+        self._pending = set()  # option_id thay đổi trong lúc reload nền, áp lại lên bản mới
+
+    def _load(self):
+        with db.session() as s:
+            rows = s.execute(TOUR_OPTIONS_SQL.format(where='') + " ORDER BY t.option_id")
+
+        partitions, options, by_user, stats = {}, {}, {}, RunningStats()
+        for row in rows or []:
+            self._index(partitions, options, by_user, stats, _record(row))
+
+        log.info('tour_feature_store_loaded', options=len(options), cities=len(partitions))
+        return partitions, options, by_user, stats
+
+    def _index(self, partitions, options, by_user, stats, record):
+        option_key = _id_key(record['option_id'])
+        destination_key = _id_key(record['destination_city_id'])
+        partition = partitions.get(destination_key)
+        if partition is None:
+            partition = partitions[destination_key] = CityPartition(record['destination_city_id'], self._write_lock)
+        partition.add(record)
+        options[option_key] = record
+        by_user.setdefault(_id_key(record['user_id']), {})[option_key] = record
+        stats.add(record)
+
+    @staticmethod
+    def _unindex(partitions, options, by_user, stats, option_key):
+        record = options.pop(option_key, None)
+        if record is None:
+            return
+        stats.remove(record)
+        destination_key = _id_key(record['destination_city_id'])
+        partition = partitions.get(destination_key)
+        if partition is not None:
+            partition.remove(option_key)
+            if not len(partition):
+                del partitions[destination_key]
+        user_key = _id_key(record['user_id'])
+        user_options = by_user.get(user_key)
+        if user_options is not None:
+            user_options.pop(option_key, None)
+            if not user_options:
+                del by_user[user_key]
+
+    # ---------- cập nhật ----------
+
+    def reload_option(self, option_id):
+        """
+        Đọc lại một option từ DB (sau khi được thêm/sửa/xóa) và cập nhật partition tương ứng
+        """
+        if self._data is None:
+            return  # chưa load thì lần truy cập đầu sẽ load đủ
+        with self._lock:
+            if self._refreshing:
+                # Bản đang reload nền có thể đã đọc DB trước thay đổi này
+                self._pending.add(option_id)
+        with db.session() as s:
+            row = s.execute(TOUR_OPTIONS_SQL.format(where="WHERE t.option_id = %s"), (option_id,), fetch_one=True)
+
+        partitions, options, by_user, stats = self._data
+        with self._write_lock:
+            self._unindex(partitions, options, by_user, stats, _id_key(option_id))
+            if row:
+                self._index(partitions, options, by_user, stats, _record(row))
+
+    def _refreshed(self):
+        with self._lock:
+            pending, self._pending = self._pending, set()
+        for option_id in pending:
+            try:
+                self.reload_option(option_id)
+            except Exception as e:
+                log.warning('tour_feature_store_reload_option_failed', option_id=option_id, error=str(e))
+                self.invalidate()
+
+    def _on_change(self, table, row_id):
+        if row_id is None:
+            self.invalidate()
+        else:
+            self.reload_option(row_id)
+
+    # ---------- đọc ----------
+
+    def partition(self, destination_city_id):
+        """
+        CityPartition của destination_city_id, hoặc None nếu thành phố chưa có tour option nào
+        """
+        if destination_city_id is None:
+            return None
+        return self._ensure_loaded()[0].get(_id_key(destination_city_id))
+
+    def get(self, option_id):
+        record = self._ensure_loaded()[1].get(_id_key(option_id))
+        return _public(record) if record else None
+
+    def options_for_user(self, user_id):
+        by_user = self._ensure_loaded()[2]
+        with self._write_lock:
+            return [_public(record) for record in by_user.get(_id_key(user_id), {}).values()]
+
+    def count_for_user(self, user_id):
+        return len(self._ensure_loaded()[2].get(_id_key(user_id), ()))
+
+    def options_for_users(self, user_ids):
+        by_user = self._ensure_loaded()[2]
+        result = []
+        with self._write_lock:
+            for user_key in dict.fromkeys(_id_key(user_id) for user_id in user_ids):
+                result.extend(_public(record) for record in by_user.get(user_key, {}).values())
+        return result
+
+    def all_options(self):
+        options = self._ensure_loaded()[1]
+        with self._write_lock:
+            return [_public(record) for record in options.values()]
+
+    def first_options(self, limit, destination_city_id=None):
+        """
+        limit option đầu tiên (của một thành phố nếu có destination_city_id), như ... LIMIT %s
+        """
+        if destination_city_id is not None:
+            partition = self.partition(destination_city_id)
+            records = partition.records() if partition is not None else []
+        else:
+            options = self._ensure_loaded()[1]
+            with self._write_lock:
+                records = list(options.values())
+        return [_public(record) for record in records[:max(int(limit), 0)]]
+
+    def imputation_stats(self):
+        """
+        RunningStats.snapshot() của toàn bộ option (dict dùng chung, không được sửa)
+        """
+        stats = self._ensure_loaded()[3]
+        with self._write_lock:
+            return stats.snapshot()
+
+
+tour_feature_store = TourFeatureStore(ttl=TOUR_FEATURE_STORE_CONFIG['ttl'])
+subscribe(tour_feature_store._on_change, tables=('tour_options',))
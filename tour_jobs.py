@@ -0,0 +1,235 @@
+# Smart Travel Vietnam - Background tour generation jobs
+# /api/generate-tour?async=1 trả về job id ngay, việc gọi Gemini + hậu xử lý chạy trên một
+# pool worker có giới hạn. Client poll /api/generate-tour/<job_id> để lấy status/progress/result.
+# Hai request giống hệt nhau trong lúc job đầu chưa xong dùng chung một job.
+# /api/generate-tour?stream=1 cũng chạy trên pool này: job ghi lại các event progress/day và
+# generator SSE đọc chúng bằng wait_events()
+#
+#   from tour_jobs import tour_jobs, QueueFull
+#   job, created = tour_jobs.submit(key, run, tour_input, user_prefs)   # run(..., progress=callback)
+#   tour_jobs.submit(key, run, tour_input, user_prefs, stream=True)     # run(..., progress=..., on_day=...)
+#   tour_jobs.get(job['job_id'])     # {'status': 'running', 'progress': 30, 'stage': 'generating', ...}
+#   events, cursor, job = tour_jobs.wait_events(job_id, cursor, timeout=15)
+#   tour_jobs.stats()                # queue depth, số job đang chạy, thời gian chờ/chạy trung bình
+
+import os
+import json
+import time
+import uuid
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from app_logging import get_logger
+
+TOUR_JOBS_CONFIG = {
+    'workers': int(os.environ.get('TOUR_JOBS_WORKERS', 4)),             # số job chạy đồng thời
+    'max_queued': int(os.environ.get('TOUR_JOBS_MAX_QUEUED', 50)),      # job chờ tối đa, vượt thì từ chối
+    'result_ttl': int(os.environ.get('TOUR_JOBS_RESULT_TTL', 900)),     # giây giữ kết quả sau khi xong
+}
+
+QUEUED, RUNNING, SUCCEEDED, FAILED = 'queued', 'running', 'succeeded', 'failed'
+
+log = get_logger('tour_jobs')
+
+
+class QueueFull(Exception):
+    """Số job đang chờ đã đạt max_queued"""
+
+
+def job_key(*parts):
+    """
+    Key dedupe của request: hash của các input đã chuẩn hóa (dict sort theo key)
+    """
+    blob = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str, separators=(',', ':'))
+    return hashlib.sha256(blob.encode('utf-8')).hexdigest()
+
+
+class TourJobQueue:
+    """
+    Job theo id, chạy trên ThreadPoolExecutor(workers). Hàm của job nhận thêm progress(percent, stage)
+    và trả về (http_status, payload); payload['success'] quyết định job succeeded hay failed.
+    Job đã xong được giữ result_ttl giây rồi bị xóa lười ở lần submit/get sau.
+    Mỗi job có log event ('progress', {...}) / ('day', day) chỉ ghi thêm, nhiều client stream
+    (kể cả client được dedupe vào job đang chạy) đọc độc lập theo cursor của mình
+    """
+
+    def __init__(self, workers=4, max_queued=50, result_ttl=900):
+        self.workers = workers
+        self.max_queued = max_queued
+        self.result_ttl = result_ttl
+        self._executor = None
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)   # báo có event mới / job xong
+        self._jobs = {}        # job_id -> job dict
+        self._in_flight = {}   # key -> job_id của job queued/running
+        self._queued = 0
+        self._running = 0
+        self._submitted = 0
+        self._deduplicated = 0
+        self._rejected = 0
+        self._finished = {SUCCEEDED: 0, FAILED: 0}
+        self._started = 0
+        self._completed_runs = 0
+        self._wait_ms_total = 0.0
+        self._run_ms_total = 0.0
+
+    def _pool(self):
+        # Tạo lười để import module không sinh thread (vd. script/benchmark)
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='tour-job')
+        return self._executor
+
+    def submit(self, key, fn, *args, stream=False):
+        """
+        (job snapshot, created). created=False nếu đã có job cùng key đang chờ/chạy.
+        stream=True truyền thêm on_day(day) cho fn, mỗi ngày được ghi thành event 'day'.
+        Raise QueueFull khi hàng đợi đầy
+        """
+        with self._lock:
+            self._purge_expired()
+            job_id = self._in_flight.get(key)
+            if job_id is not None:
+                self._deduplicated += 1
+                return self._snapshot(self._jobs[job_id]), False
+            if self._queued >= self.max_queued:
+                self._rejected += 1
+                raise QueueFull(f"Tour generation queue is full ({self.max_queued} jobs waiting)")
+
+            job = {
+                'job_id': uuid.uuid4().hex,
+                'key': key,
+                'status': QUEUED,
+                'progress': 0,
+                'stage': QUEUED,
+                'http_status': None,
+                'result': None,
+                'created_at': time.time(),
+                'started_at': None,
+                'finished_at': None,
+                'events': [],
+            }
+            self._jobs[job['job_id']] = job
+            self._in_flight[key] = job['job_id']
+            self._queued += 1
+            self._submitted += 1
+            snapshot = self._snapshot(job)
+            executor = self._pool()
+
+        try:
+            executor.submit(self._run, job, fn, args, stream)
+        except RuntimeError as e:
+            # Executor đã shutdown (process đang tắt)
+            self._finish(job, 503, {'success': False, 'error': f'Tour generation unavailable: {e}'}, started=False)
+            snapshot = self._snapshot(job)
+        log.info('tour_job_submitted', job_id=job['job_id'], queued=self._queued, running=self._running)
+        return snapshot, True
+
+    def _run(self, job, fn, args, stream=False):
+        with self._lock:
+            self._queued -= 1
+            self._running += 1
+            job['status'] = job['stage'] = RUNNING
+            job['started_at'] = time.time()
+            self._started += 1
+            self._wait_ms_total += (job['started_at'] - job['created_at']) * 1000
+
+        def progress(percent, stage=None):
+            with self._lock:
+                job['progress'] = max(job['progress'], min(int(percent), 99))
+                if stage:
+                    job['stage'] = stage
+                job['events'].append(('progress', {'progress': job['progress'], 'stage': job['stage']}))
+                self._changed.notify_all()
+
+        def on_day(day):
+            with self._lock:
+                job['events'].append(('day', day))
+                self._changed.notify_all()
+
+        kwargs = {'progress': progress}
+        if stream:
+            kwargs['on_day'] = on_day
+        try:
+            http_status, payload = fn(*args, **kwargs)
+        except Exception as e:
+            log.exception('tour_job_crashed', job_id=job['job_id'], error=str(e))
+            http_status, payload = 500, {'success': False, 'error': f'Unexpected server error: {e}'}
+        self._finish(job, http_status, payload)
+
+    def _finish(self, job, http_status, payload, started=True):
+        with self._lock:
+            status = SUCCEEDED if payload.get('success') else FAILED
+            job.update(status=status, stage=status, progress=100, http_status=http_status,
+                       result=payload, finished_at=time.time())
+            if started:
+                self._running -= 1
+                self._completed_runs += 1
+                self._run_ms_total += (job['finished_at'] - job['started_at']) * 1000
+            else:
+                self._queued -= 1
+            self._finished[status] += 1
+            if self._in_flight.get(job['key']) == job['job_id']:
+                del self._in_flight[job['key']]
+            self._changed.notify_all()
+        log.info('tour_job_finished', job_id=job['job_id'], status=status,
+                 duration_ms=round((job['finished_at'] - job['created_at']) * 1000, 1))
+
+    def _purge_expired(self):
+        now = time.time()
+        expired = [job_id for job_id, job in self._jobs.items()
+                   if job['finished_at'] is not None and now - job['finished_at'] >= self.result_ttl]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    @staticmethod
+    def _snapshot(job):
+        snapshot = {field: job[field] for field in ('job_id', 'status', 'progress', 'stage',
+                                                    'created_at', 'started_at', 'finished_at')}
+        if job['finished_at'] is not None:
+            snapshot['http_status'] = job['http_status']
+            snapshot['result'] = job['result']
+        return snapshot
+
+    def get(self, job_id):
+        """
+        Snapshot của job (kèm result khi đã xong), None nếu không có hoặc đã hết hạn
+        """
+        with self._lock:
+            self._purge_expired()
+            job = self._jobs.get(job_id)
+            return self._snapshot(job) if job is not None else None
+
+    def wait_events(self, job_id, cursor=0, timeout=None):
+        """
+        Chờ tối đa timeout giây tới khi job có event sau vị trí cursor hoặc đã xong.
+        Trả về (event mới, cursor mới, snapshot), snapshot None nếu không có job hoặc đã hết hạn
+        """
+        with self._changed:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return [], cursor, None
+            self._changed.wait_for(
+                lambda: len(job['events']) > cursor or job['finished_at'] is not None, timeout)
+            events = job['events'][cursor:]
+            return events, cursor + len(events), self._snapshot(job)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'workers': self.workers,
+                'max_queued': self.max_queued,
+                'queued': self._queued,
+                'running': self._running,
+                'retained': len(self._jobs),
+                'submitted': self._submitted,
+                'deduplicated': self._deduplicated,
+                'rejected': self._rejected,
+                'succeeded': self._finished[SUCCEEDED],
+                'failed': self._finished[FAILED],
+                'avg_wait_ms': round(self._wait_ms_total / self._started, 1) if self._started else 0.0,
+                'avg_run_ms': round(self._run_ms_total / self._completed_runs, 1) if self._completed_runs else 0.0,
+            }
+
+
+tour_jobs = TourJobQueue(**TOUR_JOBS_CONFIG)